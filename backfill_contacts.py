@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Дозаполнение контактов из сохраненных переписок
+
+Находит контакты, которые бот пропустил в диалогах, и добавляет их в контакты
+арендатора без дубликатов. Источники: логи бота с LOG_TRANSCRIPTS=true (вместе
+с ротированными файлами), JSON Lines с полями user_id и text, экспорт чатов
+Telegram Desktop (result.json). Прерванный запуск продолжается с того же места
+
+    python backfill_contacts.py logs/                       # все логи из каталога
+    python backfill_contacts.py export/result.json --dry-run
+    python backfill_contacts.py logs/ --tenant brand_a --concurrency 4 --rate 2
+    python backfill_contacts.py logs/ --no-llm              # только регулярные выражения, без запросов к LLM
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from settings.config import Config
+
+logger = logging.getLogger(__name__)
+
+def resolve_tenant(name: str):
+    """Папка данных и id бота арендатора: из TENANTS_FILE или настроек .env"""
+    if Config.uses_tenants_file():
+        with open(Config.TENANTS_FILE, 'r', encoding='utf-8') as f:
+            for item in json.load(f):
+                if item['name'] == name:
+                    return item.get('data_dir', os.path.join('data', item['name'])), item['token']
+        raise ValueError(f"Арендатор {name} не найден в {Config.TENANTS_FILE}")
+    if name != 'default':
+        raise ValueError(f"Арендатор {name} задается только через TENANTS_FILE")
+    return 'data', Config.TELEGRAM_BOT_TOKEN or ''
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Дозаполнение контактов из сохраненных переписок")
+    parser.add_argument('sources', nargs='+', help="Файлы, маски или каталоги с логами и выгрузками")
+    parser.add_argument('--tenant', default='default', help="Арендатор, в чьи контакты добавлять")
+    parser.add_argument('--concurrency', type=int, default=Config.BACKFILL_CONCURRENCY,
+                        help="Одновременных запросов к LLM")
+    parser.add_argument('--rate', type=float, default=Config.BACKFILL_RATE, help="Запросов к LLM в секунду")
+    parser.add_argument('--no-llm', action='store_true', help="Без LLM: только телефоны и email по регулярным выражениям")
+    parser.add_argument('--dry-run', action='store_true', help="Показать найденное, ничего не сохраняя")
+    parser.add_argument('--verbose', action='store_true', help="Подробный лог")
+    return parser.parse_args(argv)
+
+async def run(args) -> dict:
+    from services.ai_service import ai_service
+    from services.contact_backfill import ContactBackfill
+    from services.contact_manager import ContactManager
+    from services.transcripts import expand_sources
+    
+    data_dir, token = resolve_tenant(args.tenant)
+    bot_id = int(token.split(':')[0]) if token.split(':')[0].isdigit() else None
+    backfill = ContactBackfill(
+        ContactManager(data_dir), tenant=args.tenant, bot_id=bot_id, concurrency=args.concurrency,
+        rate=args.rate, use_llm=not args.no_llm, dry_run=args.dry_run
+    )
+    try:
+        stats = await backfill.run(expand_sources(args.sources))
+    finally:
+        await ai_service.close()
+    
+    for contact in backfill.found:
+        print(f"{contact['user_id']}\t{contact['first_name']}\t{contact['phone_number']}\t{contact['email']}")
+    return stats
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.no_llm and not Config.OPENROUTER_API_KEY:
+        print("OPENROUTER_API_KEY не найден в .env файле (или запустите с --no-llm)")
+        sys.exit(1)
+    
+    from services.log_pipeline import log_pipeline
+    log_pipeline.start(log_file='', level='INFO' if args.verbose else 'WARNING')
+    try:
+        stats = asyncio.run(run(args))
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    finally:
+        log_pipeline.stop()
+    
+    print(
+        f"Файлов: {stats['files']}, сообщений: {stats['messages']}, кандидатов: {stats['candidates']}, "
+        f"запросов к LLM: {stats['llm_requests']}, найдено контактов: {stats['extracted']}, "
+        f"добавлено: {stats['added']}, дубликатов: {stats['duplicates']}, ошибок: {stats['failed']}, "
+        f"время: {stats['elapsed']} с"
+    )
+
+if __name__ == "__main__":
+    main()
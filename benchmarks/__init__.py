@@ -0,0 +1 @@
+# Пустой файл для того, чтобы Python считал benchmarks пакетом
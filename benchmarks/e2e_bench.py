@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк бота без сети: настоящий диспетчер и обработчики против
+заглушек Telegram Bot API и OpenRouter (см. benchmarks/fake_servers.py)
+
+Каждый запрос - отдельный пользователь со своим сценарием (/start, кнопки,
+вопрос к AI, сообщение с телефоном, отправка контакта). Меряется время от
+появления апдейта в getUpdates до первого ответа бота в этот чат.
+
+Запуск из корня проекта:
+    python -m benchmarks.e2e_bench --requests 500 --concurrency 50 --llm-latency 0.8
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+
+from benchmarks.fake_servers import percentile
+from benchmarks.harness import BotHarness
+
+def build_scenarios() -> dict:
+    """Сценарии: имя -> (текст, контакт); тексты кнопок берем из настроек бота"""
+    from settings.texts import CONSULTATION_BTN_TXT, FAQ_BTN_TXT, PRICE_BTN_TXT
+    
+    return {
+        'start': ('/start', None),
+        'price_button': (PRICE_BTN_TXT, None),
+        'faq': ('/faq', None),
+        'consultation_button': (CONSULTATION_BTN_TXT, None),
+        'ai_question': ('Сколько стоит сделать AI-ассистента для интернет-магазина?', None),
+        'ai_with_phone': ('Меня зовут Иван, мой телефон +7 916 123-45-67, нужен лендинг', None),
+        'contact_button': (None, {'phone_number': '+79161234567', 'first_name': 'Иван'}),
+    }
+
+async def run_benchmark(args) -> dict:
+    harness = BotHarness(
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        contact_ratio=args.contact_ratio,
+        llm_error_ratio=args.llm_error_ratio,
+        send_latency=args.send_latency,
+        respect_limits=args.respect_limits,
+        log_level=logging.INFO if args.verbose else logging.WARNING
+    )
+    await harness.start()
+    scenarios = build_scenarios()
+    names = list(scenarios)
+    rng = random.Random(args.seed)
+    
+    latencies = defaultdict(list)
+    timeouts = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    
+    async def one_request(index: int):
+        name = rng.choice(names)
+        text, contact = scenarios[name]
+        if contact is not None:
+            contact = dict(contact, user_id=100000 + index)
+        async with semaphore:
+            try:
+                latency, _ = await harness.request(100000 + index, text=text, contact=contact, timeout=args.timeout)
+                latencies[name].append(latency)
+            except asyncio.TimeoutError:
+                timeouts[name] += 1
+    
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await harness.stop()
+    
+    def summarize(values: list, failed: int) -> dict:
+        return {
+            'count': len(values),
+            'timeouts': failed,
+            'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+            'max_ms': round(max(values, default=0) * 1000, 1)
+        }
+    
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+        'total': summarize(all_latencies, sum(timeouts.values())),
+        'scenarios': {name: summarize(latencies[name], timeouts[name]) for name in names},
+        'telegram_calls': dict(harness.telegram.stats),
+        'llm_calls': dict(harness.llm.stats)
+    }
+
+def print_report(result: dict):
+    print(f"Запросов: {result['requests']}, параллельно: {result['concurrency']}, "
+          f"время: {result['elapsed_s']} с, пропускная способность: {result['throughput_rps']} ответов/с")
+    print(f"{'сценарий':<22} {'ответов':>8} {'таймаут':>8} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'max мс':>9}")
+    rows = list(result['scenarios'].items()) + [('ВСЕГО', result['total'])]
+    for name, row in rows:
+        print(f"{name:<22} {row['count']:>8} {row['timeouts']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['max_ms']:>9}")
+    print(f"Вызовы Telegram API: {result['telegram_calls']}")
+    print(f"Вызовы LLM: {result['llm_calls']}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк бота против локальных заглушек")
+    parser.add_argument('--requests', type=int, default=200, help="Число запросов (каждый - новый пользователь)")
+    parser.add_argument('--concurrency', type=int, default=20, help="Одновременных запросов")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Средняя задержка LLM, с")
+    parser.add_argument('--llm-jitter', type=float, default=0.2, help="Разброс задержки LLM (сигма), с")
+    parser.add_argument('--llm-error-ratio', type=float, default=0.0, help="Доля ответов LLM с ошибкой 500")
+    parser.add_argument('--contact-ratio', type=float, default=0.1, help="Доля ответов LLM с блоком контактов")
+    parser.add_argument('--send-latency', type=float, default=0.0, help="Задержка sendMessage в заглушке Telegram, с")
+    parser.add_argument('--respect-limits', action='store_true', help="Не снимать глобальный лимит отправки")
+    parser.add_argument('--timeout', type=float, default=60, help="Сколько ждать ответа на запрос, с")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+    parser.add_argument('--verbose', action='store_true', help="Не приглушать логи бота")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
@@ -0,0 +1,236 @@
+"""
+Локальные заглушки внешних API для офлайн-бенчмарков
+
+FakeTelegramServer - минимальный Bot API: отдает апдейты через getUpdates
+(long polling) и принимает исходящие сообщения, уведомляя ожидающих ответа.
+FakeLLMServer - OpenAI-совместимый /chat/completions с настраиваемой задержкой
+и ответами, в том числе с блоком ===КОНТАКТЫ===
+"""
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+BOT_ID = 123456
+
+class FakeTelegramServer:
+    """Заглушка Telegram Bot API на aiohttp"""
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, send_latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.send_latency = send_latency
+        self.runner: Optional[web.AppRunner] = None
+        
+        self.updates: deque = deque()
+        self.new_updates = asyncio.Event()
+        self.next_update_id = 1
+        self.message_id = 0
+        self.waiters: Dict[int, deque] = defaultdict(deque)  # chat_id -> futures ожидающих ответа
+        self.sent: List[dict] = []
+        self.stats = defaultdict(int)
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+    
+    async def start(self):
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+    
+    # --- Апдейты ---
+    
+    def push_update(self, update: dict) -> int:
+        """Ставит апдейт в очередь getUpdates, возвращает его update_id"""
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        update['update_id'] = update_id
+        self.updates.append(update)
+        self.new_updates.set()
+        return update_id
+    
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        """Future, который завершится первым сообщением бота в этот чат (текст сообщения)"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id].append(future)
+        return future
+    
+    # --- Обработчик Bot API ---
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.stats[method] += 1
+        data = dict(await request.post()) if request.can_read_body else {}
+        
+        if method == 'getUpdates':
+            return self._ok(await self._get_updates(data))
+        if method == 'getMe':
+            return self._ok({'id': BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'})
+        if method in ('sendMessage', 'sendDocument'):
+            if self.send_latency:
+                await asyncio.sleep(self.send_latency)
+            return self._ok(self._record_message(method, data))
+        # sendChatAction, deleteWebhook, setWebhook и прочее
+        return self._ok(True)
+    
+    async def _get_updates(self, data: dict) -> list:
+        offset = int(data.get('offset', 0) or 0)
+        timeout = float(data.get('timeout', 0) or 0)
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(data.get('limit', 100) or 100)
+        return [self.updates[i] for i in range(min(limit, len(self.updates)))]
+    
+    def _record_message(self, method: str, data: dict) -> dict:
+        self.message_id += 1
+        chat_id = int(data.get('chat_id'))
+        text = data.get('text') or data.get('caption') or ''
+        self.sent.append({'method': method, 'chat_id': chat_id, 'text': text, 'time': time.perf_counter()})
+        
+        waiters = self.waiters.get(chat_id)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(text)
+                break
+        
+        return {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': text
+        }
+    
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+class FakeLLMServer:
+    """OpenAI-совместимый endpoint с настраиваемой задержкой и ответами"""
+    
+    DEFAULT_REPLIES = (
+        "Здравствуйте! Мы разрабатываем лендинги, AI-ассистентов и системы автоматизации продаж. "
+        "Расскажите, пожалуйста, о вашей задаче - подберем подходящее решение.",
+        "Стоимость лендинга начинается от 30 000 рублей, срок разработки - от 7 рабочих дней. "
+        "Точная цена зависит от объема и интеграций.",
+        "**Отличный вопрос!** AI-ассистент отвечает клиентам 24/7, квалифицирует заявки и передает их менеджеру.\n\n"
+        "Могу записать вас на бесплатную консультацию.",
+    )
+    CONTACT_REPLY = (
+        "Спасибо, {name}! Передали ваши контакты менеджеру, он свяжется с вами в ближайшее время.\n\n"
+        "===КОНТАКТЫ===\nИМЯ: {name}\nТЕЛЕФОН: {phone}\nEMAIL: {email}\nКОММЕНТАРИЙ: Заявка на консультацию\n"
+        "===КОНЕЦ КОНТАКТОВ==="
+    )
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.5, jitter: float = 0.2,
+                 contact_ratio: float = 0.1, replies=None, error_ratio: float = 0.0, seed: int = 1):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.contact_ratio = contact_ratio
+        self.error_ratio = error_ratio
+        self.replies = tuple(replies or self.DEFAULT_REPLIES)
+        self.rng = random.Random(seed)
+        self.runner: Optional[web.AppRunner] = None
+        self.stats = defaultdict(int)
+    
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+    
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_get('/v1/models', self.models)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+    
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response({'object': 'list', 'data': [{'id': 'fake-model', 'object': 'model'}]})
+    
+    def _delay(self) -> float:
+        return max(0.0, self.rng.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+    
+    def _reply(self, messages: list) -> str:
+        """Ответ с контактами, если пользователь прислал телефон, иначе - с вероятностью contact_ratio"""
+        last = messages[-1]['content'] if messages else ''
+        digits = ''.join(ch for ch in last if ch.isdigit())
+        if len(digits) >= 10 or self.rng.random() < self.contact_ratio:
+            phone = '+7' + (digits[-10:] if len(digits) >= 10 else f"9{self.rng.randrange(10 ** 9):09d}")
+            return self.CONTACT_REPLY.format(name='Иван', phone=phone, email='')
+        return self.rng.choice(self.replies)
+    
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.stats['requests'] += 1
+        await asyncio.sleep(self._delay())
+        
+        if self.error_ratio and self.rng.random() < self.error_ratio:
+            self.stats['errors'] += 1
+            return web.json_response({'error': {'message': 'fake upstream error', 'type': 'server_error'}}, status=500)
+        
+        content = self._reply(body.get('messages', []))
+        prompt_tokens = sum(len(str(m.get('content', ''))) for m in body.get('messages', [])) // 4
+        completion_tokens = len(content) // 4
+        return web.json_response({
+            'id': f"chatcmpl-{self.stats['requests']}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake-model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+def message_update(user_id: int, text: str = None, contact: dict = None, first_name: str = 'Иван') -> dict:
+    """Апдейт с сообщением пользователя в формате Bot API (update_id проставит сервер)"""
+    message = {
+        'message_id': random.randrange(1, 2 ** 31),
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private', 'first_name': first_name},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': first_name, 'language_code': 'ru'},
+    }
+    if text is not None:
+        message['text'] = text
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    if contact is not None:
+        message['contact'] = contact
+    return {'message': message}
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль (nearest rank) для отчетов"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
@@ -0,0 +1,99 @@
+"""
+Запуск настоящего бота (диспетчер, обработчики, очереди) против локальных заглушек
+
+Перед импортом bot.py окружение перенастраивается на FakeTelegramServer и
+FakeLLMServer, а рабочий каталог - на временный (data/, logs/ не трогают проект).
+Используется e2e-бенчмарком и генератором нагрузки
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Optional, Tuple
+
+from benchmarks.fake_servers import BOT_ID, FakeLLMServer, FakeTelegramServer, message_update
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_CHAT_ID = 1
+
+class BotHarness:
+    """Бот в режиме polling против заглушек Telegram и LLM"""
+    
+    def __init__(self, llm_latency: float = 0.5, llm_jitter: float = 0.2, contact_ratio: float = 0.1,
+                 llm_error_ratio: float = 0.0, send_latency: float = 0.0, respect_limits: bool = False,
+                 workdir: Optional[str] = None, log_level: int = logging.WARNING):
+        self.telegram = FakeTelegramServer(send_latency=send_latency)
+        self.llm = FakeLLMServer(latency=llm_latency, jitter=llm_jitter, contact_ratio=contact_ratio,
+                                 error_ratio=llm_error_ratio)
+        self.respect_limits = respect_limits
+        self.workdir = workdir
+        self.log_level = log_level
+        self.bot_module = None
+        self.polling_task: Optional[asyncio.Task] = None
+    
+    def _prepare_environment(self):
+        """Настраивает окружение до импорта bot.py (конфиг читается при импорте)"""
+        self.workdir = self.workdir or tempfile.mkdtemp(prefix='bot-bench-')
+        knowledge_link = os.path.join(self.workdir, 'knowledge_base')
+        if not os.path.exists(knowledge_link):
+            os.symlink(os.path.join(PROJECT_ROOT, 'knowledge_base'), knowledge_link)
+        os.chdir(self.workdir)
+        if PROJECT_ROOT not in sys.path:
+            sys.path.insert(0, PROJECT_ROOT)
+        
+        os.environ.update({
+            'TELEGRAM_BOT_TOKEN': f"{BOT_ID}:BENCHMARKBENCHMARKBENCHMARKBENCHMARK",
+            'OPENROUTER_API_KEY': 'benchmark',
+            'ADMIN_CHAT_ID': str(ADMIN_CHAT_ID),
+            'TELEGRAM_API_URL': self.telegram.url,
+            'OPENROUTER_BASE_URL': self.llm.url,
+            'TENANTS_FILE': '',
+            'BOT_MODE': 'polling',
+            'ENABLE_METRICS': 'false',
+        })
+        if not self.respect_limits:
+            # Меряем бота, а не лимиты Telegram: глобальный лимит отправки снимаем
+            os.environ['TELEGRAM_GLOBAL_RATE'] = '1000000'
+    
+    async def start(self):
+        await self.telegram.start()
+        await self.llm.start()
+        self._prepare_environment()
+        
+        import bot
+        self.bot_module = bot
+        # Логи идут через тот же конвейер, что и в production, но только в консоль:
+        # журнал каждого апдейта искажает замеры и забивает вывод отчета
+        bot.log_pipeline.start(log_file='', level=logging.getLevelName(self.log_level))
+        await bot.on_startup(notify_started=False)
+        self.polling_task = asyncio.create_task(
+            bot.dp.start_polling(
+                *bot.container.tenant_registry.bots(), handle_signals=False, close_bot_session=False, polling_timeout=1
+            )
+        )
+    
+    async def stop(self):
+        bot = self.bot_module
+        if self.polling_task:
+            try:
+                await bot.dp.stop_polling()
+            except RuntimeError:
+                pass
+            await asyncio.gather(self.polling_task, return_exceptions=True)
+        if bot:
+            await bot.on_shutdown()
+        await self.telegram.stop()
+        await self.llm.stop()
+        if bot:
+            bot.log_pipeline.stop()
+    
+    async def request(self, user_id: int, text: str = None, contact: dict = None,
+                      timeout: float = 60) -> Tuple[float, str]:
+        """Отправляет сообщение от пользователя и ждет первого ответа бота: (задержка в секундах, текст ответа)"""
+        reply = self.telegram.expect_reply(user_id)
+        started = time.perf_counter()
+        self.telegram.push_update(message_update(user_id, text=text, contact=contact))
+        reply_text = await asyncio.wait_for(reply, timeout)
+        return time.perf_counter() - started, reply_text
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Генератор нагрузки: N одновременных пользователей ведут многоходовые диалоги
+
+Бот запускается целиком против заглушек Telegram и LLM (см. benchmarks/harness.py).
+Каждый виртуальный пользователь проигрывает диалог: нажатия кнопок меню, вопросы
+к AI, серии сообщений подряд без ожидания ответа, отправку контакта кнопкой
+(F.contact) и текстом. Пользователи подключаются по профилю нарастания нагрузки.
+
+Отчет: p50/p95/p99 времени до первого ответа по типам реплик, доля ошибок и
+таймаутов, рост памяти истории диалогов (HistoryManager) и таймлайн по интервалам,
+по которому видно, при скольких активных пользователях бот перестает укладываться в SLO.
+
+Запуск из корня проекта:
+    python -m benchmarks.load_replay --users 200 --profile linear --ramp 60
+    python -m benchmarks.load_replay --users 500 --profile step --steps 5 --dialogs benchmarks/dialogs/example.json
+
+Формат файла диалогов (JSON): список {"name": ..., "turns": [...]}, реплика - одна из
+{"text": "..."}, {"contact": true}, {"burst": ["...", "..."]}, {"pause": секунды}
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from benchmarks.fake_servers import percentile
+from benchmarks.harness import BotHarness
+from services.memory_inspector import deep_sizeof, format_bytes, get_rss
+
+PROFILES = ('constant', 'linear', 'step', 'spike')
+
+# Ответы бота, которые означают ошибку обработки (общая ошибка и недоступность LLM)
+ERROR_REPLY_PREFIXES = (
+    "Извините, произошла ошибка",
+    "Извините, в настоящее время у меня технические проблемы",
+)
+
+def builtin_dialogs() -> List[dict]:
+    """Типовые диалоги; тексты кнопок берем из настроек бота"""
+    from settings.texts import CONSULTATION_BTN_TXT, FAQ_BTN_TXT, PRICE_BTN_TXT, SERVICE_BTN_TXT
+    
+    return [
+        {'name': 'menu_browser', 'turns': [
+            {'text': '/start'}, {'text': SERVICE_BTN_TXT}, {'text': PRICE_BTN_TXT}, {'text': FAQ_BTN_TXT},
+        ]},
+        {'name': 'faq_questions', 'turns': [
+            {'text': '/start'},
+            {'text': 'Сколько стоит лендинг?'},
+            {'text': 'А сроки разработки какие?'},
+            {'text': 'Можно ли подключить оплату картой?'},
+        ]},
+        {'name': 'rapid_fire', 'turns': [
+            {'text': 'Добрый день'},
+            {'burst': ['Нужен бот для салона красоты', 'С записью клиентов', 'И напоминаниями', 'Сколько будет стоить?']},
+        ]},
+        {'name': 'contact_button', 'turns': [
+            {'text': '/start'}, {'text': PRICE_BTN_TXT}, {'text': CONSULTATION_BTN_TXT}, {'contact': True},
+        ]},
+        {'name': 'contact_text', 'turns': [
+            {'text': 'Хочу AI-ассистента для интернет-магазина'},
+            {'text': 'Сколько это будет стоить?'},
+            {'text': 'Меня зовут Ольга, телефон +7 (926) 555-01-02, почта olga@example.com'},
+        ]},
+    ]
+
+def load_dialogs(path: str) -> List[dict]:
+    """Диалоги из JSON-файла (записанные или написанные вручную)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        dialogs = json.load(f)
+    for index, dialog in enumerate(dialogs):
+        dialog.setdefault('name', f"dialog_{index}")
+        if not dialog.get('turns'):
+            raise ValueError(f"В диалоге {dialog['name']} нет реплик")
+    return dialogs
+
+def turn_kind(text: str) -> str:
+    """Тип текстовой реплики для группировки задержек"""
+    from settings.texts import (
+        SERVICE_BTN_TXT, ABOUT_BTN_TXT, PRICE_BTN_TXT, FAQ_BTN_TXT, CONSULTATION_BTN_TXT, BACK_BTN_TXT
+    )
+    
+    if text.startswith('/'):
+        return 'command'
+    if text in (SERVICE_BTN_TXT, ABOUT_BTN_TXT, PRICE_BTN_TXT, FAQ_BTN_TXT, CONSULTATION_BTN_TXT, BACK_BTN_TXT):
+        return 'menu'
+    if sum(ch.isdigit() for ch in text) >= 10 or '@' in text:
+        return 'contact_text'
+    return 'question'
+
+def start_offsets(users: int, profile: str, ramp: float, steps: int) -> List[float]:
+    """Момент подключения каждого пользователя (секунды от начала) по профилю нагрузки"""
+    if profile == 'constant' or ramp <= 0:
+        return [0.0] * users
+    if profile == 'linear':
+        return [ramp * i / users for i in range(users)]
+    if profile == 'step':
+        per_step = -(-users // steps)
+        return [ramp * (i // per_step) / steps for i in range(users)]
+    if profile == 'spike':
+        # Половина пользователей подключается равномерно, вторая половина - разом в конце разгона
+        base = users // 2
+        return [ramp * i / max(base, 1) for i in range(base)] + [ramp] * (users - base)
+    raise ValueError(f"Неизвестный профиль нагрузки: {profile}")
+
+class LoadReport:
+    """Результаты прогона: задержки по типам реплик, ошибки и таймлайн по интервалам"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.timeouts: Dict[str, int] = defaultdict(int)
+        self.active_users = 0
+        self.finished_users = 0
+        self.timeline: List[dict] = []
+        self._window: List[float] = []
+        self._window_errors = 0
+        self._window_timeouts = 0
+        self._window_started = self.started
+    
+    def record(self, kind: str, latency: Optional[float], error: bool = False):
+        """Итог одной реплики: latency None - ответа не дождались"""
+        if latency is None:
+            self.timeouts[kind] += 1
+            self._window_timeouts += 1
+            return
+        self.latencies[kind].append(latency)
+        self._window.append(latency)
+        if error:
+            self.errors[kind] += 1
+            self._window_errors += 1
+    
+    def close_interval(self, history_users: int, history_bytes: int):
+        """Закрывает интервал таймлайна"""
+        now = time.perf_counter()
+        replies = self._window
+        attempts = len(replies) + self._window_timeouts
+        failures = self._window_errors + self._window_timeouts
+        self.timeline.append({
+            't_s': round(now - self.started, 1),
+            'active_users': self.active_users,
+            'rps': round(len(replies) / (now - self._window_started), 1),
+            'p95_ms': round(percentile(replies, 0.95) * 1000, 1),
+            'failure_rate': round(failures / attempts, 3) if attempts else 0.0,
+            'history_users': history_users,
+            'history_bytes': history_bytes
+        })
+        self._window, self._window_errors, self._window_timeouts = [], 0, 0
+        self._window_started = now
+    
+    def summary(self, kinds: List[str]) -> Dict[str, dict]:
+        def summarize(values: list, errors: int, timeouts: int) -> dict:
+            attempts = len(values) + timeouts
+            return {
+                'replies': len(values),
+                'errors': errors,
+                'timeouts': timeouts,
+                'failure_rate': round((errors + timeouts) / attempts, 3) if attempts else 0.0,
+                'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+                'max_ms': round(max(values, default=0) * 1000, 1)
+            }
+        
+        result = {kind: summarize(self.latencies[kind], self.errors[kind], self.timeouts[kind]) for kind in kinds}
+        result['total'] = summarize(
+            [value for values in self.latencies.values() for value in values],
+            sum(self.errors.values()), sum(self.timeouts.values())
+        )
+        return result
+    
+    def breaking_point(self, slo: float, max_failure_rate: float) -> Optional[dict]:
+        """Первый интервал, где p95 вышел за SLO или доля ошибок превысила допустимую"""
+        for point in self.timeline:
+            if point['p95_ms'] > slo * 1000 or point['failure_rate'] > max_failure_rate:
+                return point
+        return None
+
+class VirtualUser:
+    """Пользователь, который проигрывает один диалог с паузами на размышление"""
+    
+    def __init__(self, user_id: int, dialog: dict, harness: BotHarness, report: LoadReport, args, rng: random.Random):
+        self.user_id = user_id
+        self.dialog = dialog
+        self.harness = harness
+        self.report = report
+        self.args = args
+        self.rng = rng
+    
+    async def _exchange(self, kind: str, text: str = None, contact: dict = None):
+        try:
+            latency, reply = await self.harness.request(self.user_id, text=text, contact=contact,
+                                                        timeout=self.args.timeout)
+        except asyncio.TimeoutError:
+            self.report.record(kind, None)
+            return
+        self.report.record(kind, latency, error=reply.startswith(ERROR_REPLY_PREFIXES))
+    
+    async def run(self):
+        self.report.active_users += 1
+        try:
+            for index, turn in enumerate(self.dialog['turns']):
+                if 'pause' in turn:
+                    await asyncio.sleep(turn['pause'])
+                    continue
+                if index:
+                    await asyncio.sleep(self.rng.uniform(self.args.think_min, self.args.think_max))
+                
+                if turn.get('contact'):
+                    contact = {'phone_number': f"+7916{self.user_id % 10 ** 7:07d}", 'first_name': 'Нагрузка',
+                               'user_id': self.user_id}
+                    await self._exchange('contact_button', contact=contact)
+                elif 'burst' in turn:
+                    # Сообщения подряд, не дожидаясь ответов
+                    await asyncio.gather(*(self._exchange('burst', text=text) for text in turn['burst']))
+                else:
+                    await self._exchange(turn_kind(turn['text']), text=turn['text'])
+        finally:
+            self.report.active_users -= 1
+            self.report.finished_users += 1
+
+def history_footprint(bot_module) -> tuple:
+    """Пользователей в истории диалогов и ее размер в байтах (все арендаторы)"""
+    users = 0
+    size = 0
+    for tenant in bot_module.container.tenant_registry.tenants:
+        histories = dict(tenant.history_manager.histories)
+        users += len(histories)
+        size += deep_sizeof(histories)
+    return users, size
+
+async def run_load(args) -> dict:
+    dialogs = load_dialogs(args.dialogs) if args.dialogs else None
+    harness = BotHarness(
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        contact_ratio=args.contact_ratio,
+        llm_error_ratio=args.llm_error_ratio,
+        send_latency=args.send_latency,
+        respect_limits=args.respect_limits,
+        log_level=logging.INFO if args.verbose else logging.WARNING
+    )
+    await harness.start()
+    dialogs = dialogs or builtin_dialogs()
+    rng = random.Random(args.seed)
+    report = LoadReport()
+    rss_before = get_rss()
+    history_before = history_footprint(harness.bot_module)
+    
+    async def sample_timeline():
+        while True:
+            await asyncio.sleep(args.interval)
+            report.close_interval(*history_footprint(harness.bot_module))
+    
+    async def user_session(index: int, offset: float):
+        await asyncio.sleep(offset)
+        dialog = dialogs[index % len(dialogs)]
+        for _ in range(args.iterations):
+            await VirtualUser(300000 + index, dialog, harness, report, args, rng).run()
+    
+    sampler = asyncio.create_task(sample_timeline())
+    try:
+        offsets = start_offsets(args.users, args.profile, args.ramp, args.steps)
+        await asyncio.gather(*(user_session(index, offset) for index, offset in enumerate(offsets)))
+        elapsed = time.perf_counter() - report.started
+    finally:
+        sampler.cancel()
+        report.close_interval(*history_footprint(harness.bot_module))
+        history_after = history_footprint(harness.bot_module)
+        rss_after = get_rss()
+        await harness.stop()
+    
+    kinds = sorted(report.latencies.keys() | report.timeouts.keys())
+    peak_history = max(report.timeline, key=lambda point: point['history_bytes'])
+    return {
+        'users': args.users,
+        'profile': args.profile,
+        'ramp_s': args.ramp,
+        'elapsed_s': round(elapsed, 1),
+        'dialogs': [dialog['name'] for dialog in dialogs],
+        'latency': report.summary(kinds),
+        'history': {
+            'users_before': history_before[0],
+            'users_after': history_after[0],
+            'bytes_before': history_before[1],
+            'bytes_after': history_after[1],
+            'bytes_peak': peak_history['history_bytes'],
+            'bytes_per_user': round(history_after[1] / history_after[0]) if history_after[0] else 0
+        },
+        'rss_before': rss_before,
+        'rss_after': rss_after,
+        'breaking_point': report.breaking_point(args.slo, args.max_failure_rate),
+        'timeline': report.timeline,
+        'telegram_calls': dict(harness.telegram.stats),
+        'llm_calls': dict(harness.llm.stats)
+    }
+
+def print_report(result: dict, slo: float):
+    print(f"Пользователей: {result['users']}, профиль: {result['profile']} (разгон {result['ramp_s']} с), "
+          f"время: {result['elapsed_s']} с")
+    print(f"Диалоги: {', '.join(result['dialogs'])}")
+    print()
+    print(f"{'реплика':<16} {'ответов':>8} {'ошибок':>7} {'таймаут':>8} {'доля':>7} "
+          f"{'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'max мс':>9}")
+    for kind, row in result['latency'].items():
+        print(f"{kind:<16} {row['replies']:>8} {row['errors']:>7} {row['timeouts']:>8} {row['failure_rate']:>7.1%} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['max_ms']:>9}")
+    print()
+    
+    history = result['history']
+    print(f"История диалогов: {history['users_before']} -> {history['users_after']} пользователей, "
+          f"{format_bytes(history['bytes_before'])} -> {format_bytes(history['bytes_after'])} "
+          f"(пик {format_bytes(history['bytes_peak'])}, {format_bytes(history['bytes_per_user'])} на пользователя)")
+    if result['rss_before'] is not None and result['rss_after'] is not None:
+        print(f"RSS процесса: {format_bytes(result['rss_before'])} -> {format_bytes(result['rss_after'])}")
+    print()
+    
+    print(f"{'t, с':>7} {'активных':>9} {'ответов/с':>10} {'p95 мс':>9} {'ошибки':>7} {'история':>10}")
+    for point in result['timeline']:
+        print(f"{point['t_s']:>7} {point['active_users']:>9} {point['rps']:>10} {point['p95_ms']:>9} "
+              f"{point['failure_rate']:>7.1%} {format_bytes(point['history_bytes']):>10}")
+    print()
+    
+    point = result['breaking_point']
+    if point:
+        print(f"⚠️ Предел: на {point['t_s']} с при {point['active_users']} активных пользователях "
+              f"p95 {point['p95_ms']} мс, ошибок {point['failure_rate']:.1%} (SLO p95 {slo} с)")
+    else:
+        print(f"✅ SLO выдержан на всем прогоне (p95 <= {slo} с)")
+    print(f"Вызовы Telegram API: {result['telegram_calls']}")
+    print(f"Вызовы LLM: {result['llm_calls']}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузка многоходовыми диалогами против локальных заглушек")
+    parser.add_argument('--users', type=int, default=100, help="Число виртуальных пользователей")
+    parser.add_argument('--profile', choices=PROFILES, default='linear', help="Профиль подключения пользователей")
+    parser.add_argument('--ramp', type=float, default=30, help="Длительность разгона, с")
+    parser.add_argument('--steps', type=int, default=5, help="Число ступеней для профиля step")
+    parser.add_argument('--iterations', type=int, default=1, help="Сколько раз каждый пользователь проходит диалог")
+    parser.add_argument('--dialogs', help="JSON-файл с диалогами (по умолчанию встроенные)")
+    parser.add_argument('--think-min', type=float, default=1.0, help="Минимальная пауза между репликами, с")
+    parser.add_argument('--think-max', type=float, default=3.0, help="Максимальная пауза между репликами, с")
+    parser.add_argument('--llm-latency', type=float, default=0.8, help="Средняя задержка LLM, с")
+    parser.add_argument('--llm-jitter', type=float, default=0.3, help="Разброс задержки LLM (сигма), с")
+    parser.add_argument('--llm-error-ratio', type=float, default=0.0, help="Доля ответов LLM с ошибкой 500")
+    parser.add_argument('--contact-ratio', type=float, default=0.05, help="Доля ответов LLM с блоком контактов")
+    parser.add_argument('--send-latency', type=float, default=0.02, help="Задержка sendMessage в заглушке Telegram, с")
+    parser.add_argument('--respect-limits', action='store_true', help="Не снимать глобальный лимит отправки")
+    parser.add_argument('--timeout', type=float, default=60, help="Сколько ждать ответа на реплику, с")
+    parser.add_argument('--interval', type=float, default=5, help="Интервал таймлайна, с")
+    parser.add_argument('--slo', type=float, default=5.0, help="Допустимый p95 времени ответа, с")
+    parser.add_argument('--max-failure-rate', type=float, default=0.05, help="Допустимая доля ошибок и таймаутов")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="Вывести результат в JSON")
+    parser.add_argument('--verbose', action='store_true', help="Не приглушать логи бота")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = asyncio.run(run_load(args))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result, args.slo)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки чистых функций, которые выполняются на каждом сообщении
+
+Каждый случай прогоняет набор типичных русскоязычных входов; время - лучшее
+из нескольких повторов в микросекундах на один прогон набора. Результаты
+сравниваются с сохраненными базовыми значениями (benchmarks/microbench_baseline.json):
+если функция стала медленнее больше чем на порог, скрипт завершается с кодом 1,
+поэтому его можно ставить в CI или перед деплоем.
+
+Базовые значения зависят от машины. Поэтому каждый замер чередуется с эталонной
+нагрузкой на чистом Python, ее время сохраняется рядом с базовым значением, и при
+сравнении база масштабируется на отношение скоростей (другая машина, троттлинг,
+соседи по серверу).
+
+Запуск из корня проекта:
+    python -m benchmarks.microbench                 # сравнить с базой
+    python -m benchmarks.microbench --save          # записать новую базу
+    python -m benchmarks.microbench --threshold 10 --filter kb_
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(PROJECT_ROOT, 'benchmarks', 'microbench_baseline.json')
+DEFAULT_THRESHOLD = float(os.getenv('MICROBENCH_THRESHOLD', '20'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+USER_MESSAGES = [
+    "Здравствуйте! Сколько стоит лендинг для салона красоты?",
+    "Меня зовут Анна, телефон +7 (916) 123-45-67, перезвоните после обеда",
+    "Нужен чат-бот с интеграцией в amoCRM, почта anna.petrova@example.ru",
+    "А какие гарантии вы даете? И сколько времени занимает разработка?",
+    "8 903 555 12 34 - это мой номер, Сергей",
+    "Добрый вечер, хотим автоматизировать запись клиентов в стоматологию",
+    "Расскажите о компании",
+    "ок",
+]
+
+AI_RESPONSES = [
+    "**Отличный вопрос!** Стоимость лендинга начинается от *30 000 рублей*.\n\n\n"
+    "### Что входит\n- дизайн\n- адаптивная верстка\n- `форма заявки`\n\nПодробнее: [наш сайт](https://example.com)",
+    "Спасибо, Анна! Передали ваши контакты менеджеру, он свяжется с вами в течение часа.\n\n"
+    "===КОНТАКТЫ===\nИМЯ: Анна\nТЕЛЕФОН: +7 (916) 123-45-67\nEMAIL: anna.petrova@example.ru\n"
+    "КОММЕНТАРИЙ: Лендинг для салона красоты, перезвонить после обеда\n===КОНЕЦ КОНТАКТОВ===",
+    "AI-ассистент отвечает клиентам 24/7, квалифицирует заявки и передает их менеджеру. "
+    "Интеграция с CRM занимает от 5 рабочих дней.",
+]
+
+KB_QUERIES = [
+    "сколько стоит сайт",
+    "нужен бот для магазина",
+    "интеграция с crm",
+    "Сколько времени занимает разработка?",
+    "какие гарантии",
+    "расскажите о компании",
+    "привет",
+]
+
+def build_cases() -> List[Tuple[str, Callable[[], object]]]:
+    """Случаи бенчмарка: имя -> функция, прогоняющая набор входов один раз"""
+    from services.ai_service import AIService
+    from services.knowledge_service import KnowledgeService
+    from utils.ai_contact_parser import AIContactParser
+    from utils.contact_parser import ContactParser
+    from utils.text_utils import split_long_message
+    
+    knowledge = KnowledgeService(os.path.join(PROJECT_ROOT, 'knowledge_base'))
+    contact_parser = ContactParser()
+    ai_contact_parser = AIContactParser()
+    clean_response = AIService._clean_response
+    long_answer = '\n\n'.join(AI_RESPONSES * 20) + '\n' + knowledge.get_prices_info() * 3
+    faq_questions = [item['question'] for item in knowledge.faq.get('frequently_asked_questions', [])][:5]
+    
+    return [
+        ('split_long_message_short', lambda: [split_long_message(text) for text in AI_RESPONSES]),
+        ('split_long_message_long', lambda: split_long_message(long_answer)),
+        ('clean_response', lambda: [clean_response(None, text) for text in AI_RESPONSES]),
+        ('extract_contacts_from_ai_response',
+         lambda: [ai_contact_parser.extract_contacts_from_ai_response(text) for text in AI_RESPONSES]),
+        ('contact_extract_phone', lambda: [contact_parser._extract_phone(text) for text in USER_MESSAGES]),
+        ('contact_extract_fast', lambda: [contact_parser.extract_contacts_fast(text) for text in USER_MESSAGES]),
+        ('kb_search_knowledge', lambda: [knowledge.search_knowledge(query) for query in KB_QUERIES]),
+        ('kb_get_prices_info', knowledge.get_prices_info),
+        ('kb_get_company_info', knowledge.get_company_info),
+        ('kb_get_service_details',
+         lambda: [knowledge.get_service_details(key) for key in ('landing_page', 'ai_assistant', 'crm_integration')]),
+        ('kb_get_faq_answer', lambda: [knowledge.get_faq_answer(question) for question in faq_questions]),
+    ]
+
+def _calibrate(func: Callable[[], object], min_time: float) -> int:
+    """Число вызовов, которое выполняется не быстрее min_time (как в timeit)"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return loops
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+def _best_of(func: Callable[[], object], loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return (time.perf_counter() - started) / loops
+
+def measure(func: Callable[[], object], repeat: int = 7, min_time: float = 0.05) -> Tuple[float, float]:
+    """
+    Лучшее время одного вызова функции и эталонной нагрузки в микросекундах.
+    Замеры чередуются, поэтому колебания скорости машины во время прогона
+    одинаково влияют на оба значения и сокращаются в их отношении
+    """
+    loops = _calibrate(func, min_time)
+    reference_loops = _calibrate(reference_workload, min_time)
+    best = reference_best = float('inf')
+    for _ in range(repeat):
+        reference_best = min(reference_best, _best_of(reference_workload, reference_loops))
+        best = min(best, _best_of(func, loops))
+    return best * 1e6, reference_best * 1e6
+
+def reference_workload():
+    """Эталонная нагрузка на чистом Python (строки, словари, сортировка) для сравнения скоростей машин"""
+    words = [f"слово{i % 97}" for i in range(500)]
+    counts: Dict[str, int] = {}
+    for word in words:
+        counts[word.upper()] = counts.get(word.upper(), 0) + 1
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_baseline(path: str, results: Dict[str, Tuple[float, float]]):
+    data = {
+        'machine': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform()
+        },
+        'cases': {
+            name: {'us': round(value, 3), 'reference_us': round(reference, 3)}
+            for name, (value, reference) in results.items()
+        }
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+def compare(results: Dict[str, Tuple[float, float]], baseline: dict, threshold: float) -> List[str]:
+    """
+    Печатает сравнение с базой и возвращает имена случаев с регрессией.
+    Базовое время масштабируется на отношение текущего и базового времени эталонной нагрузки
+    """
+    cases = baseline.get('cases', {})
+    regressions = []
+    print(f"{'случай':<36} {'мкс':>10} {'база мкс':>10} {'скорость':>9} {'изменение':>10}")
+    for name, (value, reference) in results.items():
+        if name not in cases:
+            print(f"{name:<36} {value:>10.2f} {'-':>10} {'-':>9} {'нет базы':>10}")
+            continue
+        scale = reference / cases[name]['reference_us']
+        expected = cases[name]['us'] * scale
+        change = (value - expected) / expected * 100
+        mark = ''
+        if change > threshold:
+            regressions.append(name)
+            mark = ' ❌'
+        print(f"{name:<36} {value:>10.2f} {expected:>10.2f} {scale:>8.2f}x {change:>+9.1f}%{mark}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций с проверкой регрессий")
+    parser.add_argument('--save', action='store_true', help="Сохранить результаты как новую базу")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Файл базовых значений")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимое замедление, %% (по умолчанию MICROBENCH_THRESHOLD или 20)")
+    parser.add_argument('--filter', default='', help="Запускать только случаи, содержащие подстроку")
+    parser.add_argument('--repeat', type=int, default=7, help="Число повторов замера")
+    return parser.parse_args()
+
+def main() -> int:
+    args = parse_args()
+    if args.save and args.filter:
+        # База сохраняется целиком, чтобы в ней не смешивались замеры разных прогонов
+        print("--save нельзя сочетать с --filter")
+        return 1
+    cases = [(name, func) for name, func in build_cases() if args.filter in name]
+    if not cases:
+        print(f"Нет случаев, содержащих '{args.filter}'")
+        return 1
+    
+    results = {name: measure(func, repeat=args.repeat) for name, func in cases}
+    
+    if args.save:
+        save_baseline(args.baseline, results)
+        for name, (value, _) in results.items():
+            print(f"{name:<36} {value:>10.2f} мкс")
+        print(f"База сохранена: {args.baseline}")
+        return 0
+    
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"Нет базы {args.baseline}, запустите с --save")
+        return 1
+    
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"❌ Замедление больше {args.threshold:.0f}%: {', '.join(regressions)}")
+        return 1
+    print(f"✅ Регрессий больше {args.threshold:.0f}% нет")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
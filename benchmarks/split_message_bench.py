@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк split_long_message (инварианты разбиения проверяются в tests/test_text_utils.py)
+
+Запуск из корня проекта:
+    python -m benchmarks.split_message_bench
+"""
+
+import random
+import time
+
+from utils.text_utils import split_long_message, TELEGRAM_MAX_MESSAGE_LENGTH
+
+ALPHABET = list("абвгдеёжзийклмнопрстуфхцчшщьыэюя ABCxyz0123456789,.!?") + ["\n", "\n\n", ". ", "💰", "🎯", "👨‍💼", "•"]
+
+def random_text(rng: random.Random, length: int) -> str:
+    """Случайный текст с кириллицей, эмодзи и разделителями"""
+    return ''.join(rng.choice(ALPHABET) for _ in range(length))
+
+def benchmark(sizes=(10_000, 100_000, 1_000_000), repeat: int = 5):
+    """Время разбиения в зависимости от длины текста (должно расти линейно)"""
+    rng = random.Random(1)
+    print(f"{'символов':>10} {'частей':>8} {'мс':>10} {'мкс/1000 симв.':>16}")
+    for size in sizes:
+        text = random_text(rng, size)
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            parts = split_long_message(text, TELEGRAM_MAX_MESSAGE_LENGTH)
+            best = min(best, time.perf_counter() - started)
+        print(f"{size:>10} {len(parts):>8} {best * 1000:>10.2f} {best * 1e9 / size:>16.1f}")
+
+if __name__ == "__main__":
+    benchmark()
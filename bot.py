@@ -2,109 +2,356 @@ import json
 import os
 import logging
 import asyncio
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
-from aiogram.types import FSInputFile
+import secrets
+from aiogram import Dispatcher, types, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, FSInputFile
 from datetime import datetime
 
 from settings.config import Config
+from settings.production import ProductionConfig
 from settings.texts import (
     SERVICE_BTN_TXT, ABOUT_BTN_TXT, PRICE_BTN_TXT, FAQ_BTN_TXT, CONSULTATION_BTN_TXT,
     BACK_BTN_TXT, WELCOME_TEXT,
     CONSULTATION_TEXT, BACK_TEXT, CONTACT_RECEIVED_TEXT,
-    CONTACT_NOTIFICATION_TEMPLATE, ADMIN_ONLY_TEXT, STATS_TEXT,
+    CONTACT_NOTIFICATION_TEMPLATE, ADMIN_ONLY_TEXT, OPERATOR_ONLY_TEXT, STATS_TEXT, STATS_OPERATOR_TEXT,
     NO_CONTACTS_TEXT, EXPORT_SUCCESS_TEXT, EXPORT_ERROR_TEXT,
     FILE_NOT_FOUND_TEXT, CLEAR_HISTORY_TEXT, ERROR_TEXT,
-    CONTACT_MANUAL_SAVED_TEXT, CONTACT_MANUAL_INCOMPLETE_TEXT, CONTACT_HELP_TEXT
+    CONTACT_MANUAL_SAVED_TEXT, CONTACT_MANUAL_INCOMPLETE_TEXT, CONTACT_HELP_TEXT,
+    CONTACT_SAVED_CONFIRMATION_TEXT, LOOP_STATS_TEXT, LOOP_MONITOR_DISABLED_TEXT,
+    MEMORY_HELP_TEXT, MEMORY_REPORT_CAPTION, BROADCAST_HELP_TEXT, BROADCAST_DRAFT_TEXT, BROADCAST_TOO_LONG_TEXT,
+    BROADCAST_NO_DRAFT_TEXT, BROADCAST_NO_JOBS_TEXT, BROADCAST_ALREADY_RUNNING_TEXT, BROADCAST_NOT_RUNNING_TEXT,
+    BROADCAST_NOT_STOPPED_TEXT, BROADCAST_STOPPING_TEXT, BROADCAST_CANCELLED_TEXT,
+    USAGE_TEXT, USER_USAGE_TEXT, USAGE_QUOTA_STATES, USAGE_NO_DATA_TEXT
 )
 from components.keyboards import Keyboards
 from services.ai_service import ai_service
+from services.analytics import analytics
+from services.background_tasks import background_tasks
+from services.broadcast import broadcast_store, broadcaster, ChatRegistryMiddleware, DRAFT, STOPPED
+from services.container import container
 from services.history_manager import history_manager
-from services.notification_service import NotificationService
-from services.contact_manager import ContactManager
+from services.log_pipeline import log_pipeline
+from services.loop_monitor import loop_monitor
+from services.memory_inspector import memory_inspector
+from services.metrics import metrics, MetricsMiddleware, CONTACTS_SAVED, HISTORY_SIZE, SEND_QUEUE_DEPTH
+from services.http_pools import get_connection_stats, warm_up_telegram, warm_up_openrouter
+from services.shared_store import shared_store
+from services.shutdown import shutdown, dropped_background, UpdateTrackingMiddleware
+from services.startup_profiler import startup_profiler
+from services.telegram_session import BotSession
+from services.tracing import span, TracingMiddleware
+from services.transcripts import log_message as log_transcript
+from services.tenants import Tenant, TenantRegistry, TenantMiddleware
+from services.usage_tracker import usage_tracker, QUOTA_OK
+from services.web_server import create_web_app, add_metrics_handler, add_webhook_handler, start_web_server
 from utils.ai_contact_parser import ai_contact_parser
-from utils.text_utils import split_long_message, truncate_text
+from utils.contact_parser import contact_parser
+from utils.text_utils import TELEGRAM_MAX_MESSAGE_LENGTH, split_long_message, truncate_text, utf16_length
 
-from services.knowledge_service import knowledge_service
+logger = logging.getLogger(__name__)
 
-# Инициализируем сервисы
-contact_manager = ContactManager()
-notification_service = None
+# Общая HTTP-сессия Telegram для ботов всех арендаторов
+container.register('telegram_session', BotSession)
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Реестр арендаторов (брендов): без tenants.json работает один бот из .env.
+# У каждого арендатора свои бот, очередь отправки, индикатор набора, контакты и история.
+# Боты и сессия создаются при старте (on_startup), а не при импорте модуля
+container.register(
+    'tenant_registry',
+    lambda: TenantRegistry.from_config(container.telegram_session, container.knowledge_service, history_manager)
 )
-logger = logging.getLogger(__name__)
 
-# Создаем бота и диспетчер
-bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
+# Общий для всех арендаторов диспетчер
 dp = Dispatcher()
+dp.update.outer_middleware(UpdateTrackingMiddleware(shutdown))
+dp.update.outer_middleware(TenantMiddleware(lambda: container.tenant_registry))
+dp.update.outer_middleware(TracingMiddleware())
+dp.message.outer_middleware(ChatRegistryMiddleware(broadcast_store))
+dp.message.middleware(MetricsMiddleware())
 
-async def send_typing_action(chat_id: int, duration: int = 5):
-    """Отправляет индикатор набора сообщения"""
-    try:
-        await bot.send_chat_action(chat_id, "typing")
-        await asyncio.sleep(min(duration, 5))
-    except Exception as e:
-        logger.error(f"Ошибка при отправке индикатора набора: {e}")
+def get_history_size() -> dict:
+    """Размер хранилищ истории всех арендаторов для метрик"""
+    managers = {id(tenant.history_manager): tenant.history_manager for tenant in container.tenant_registry.tenants}
+    users = sum(len(manager.histories) for manager in managers.values())
+    messages = sum(len(history) for manager in managers.values() for history in list(manager.histories.values()))
+    return {('users',): users, ('messages',): messages}
+
+HISTORY_SIZE.set_function(get_history_size)
+
+def get_send_queue_depth() -> dict:
+    """Глубина очередей отправки арендаторов для метрик"""
+    return {(tenant.name,): tenant.send_queue.depth for tenant in container.tenant_registry.tenants}
+
+SEND_QUEUE_DEPTH.set_function(get_send_queue_depth)
 
-async def safe_send_message(chat_id: int, text: str, reply_markup=None, **kwargs):
+async def safe_send_message(tenant: Tenant, chat_id: int, text: str, reply_markup=None, **kwargs):
     """Безопасная отправка сообщения с обработкой ошибок"""
     try:
-        # Разбиваем длинные сообщения
+        # Разбиваем длинные сообщения, части уходят через очередь арендатора строго по порядку
         message_parts = split_long_message(text)
         
-        for i, part in enumerate(message_parts):
-            if i == 0:
-                await bot.send_message(chat_id, part, reply_markup=reply_markup, **kwargs)
-            else:
-                await bot.send_message(chat_id, part, **kwargs)
-        return True
+        with span('send'):
+            return await tenant.send_queue.send_parts(chat_id, message_parts, reply_markup=reply_markup, **kwargs)
     except Exception as e:
         logger.error(f"Ошибка при отправке сообщения: {e}")
         return False
 
+async def process_new_contact(tenant: Tenant, contact_data: dict):
+    """Сохраняет контакт и уведомляет админа (выполняется в фоне после ответа пользователю)"""
+    # Запись файлов выполняем в отдельном потоке, чтобы не блокировать цикл событий.
+    # Запись отдается потоку сразу и доводится до конца, даже если при остановке бота задачу отменят
+    with span('save_contact'):
+        saving = asyncio.get_running_loop().run_in_executor(None, tenant.contact_manager.save_contact, contact_data)
+        await asyncio.shield(saving)
+    CONTACTS_SAVED.inc(contact_data.get('source', 'unknown'))
+    analytics.record_contact(tenant.name)
+    
+    with span('notify'):
+        await tenant.notification_service.notify_new_contact(contact_data)
+
+async def save_dialog_history(tenant: Tenant, user_id: int, user_message: str, response: str):
+    """Сохраняет реплики диалога в историю (выполняется в фоне после ответа пользователю)"""
+    tenant.history_manager.add_message(user_id, "user", user_message)
+    tenant.history_manager.add_message(user_id, "assistant", response)
+
 # Команда start
 @dp.message(Command("start"))
-async def cmd_start(message: types.Message):
+async def cmd_start(message: types.Message, tenant: Tenant):
     try:
-        history_manager.clear_history(message.from_user.id)
-        await safe_send_message(message.chat.id, WELCOME_TEXT, reply_markup=Keyboards.get_main_keyboard())
+        tenant.history_manager.clear_history(message.from_user.id)
+        await safe_send_message(tenant, message.chat.id, WELCOME_TEXT, reply_markup=Keyboards.get_main_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в команде start: {e}")
 
 # Команда для админа - статистика
 @dp.message(Command("stats"))
-async def cmd_stats(message: types.Message):
+async def cmd_stats(message: types.Message, tenant: Tenant):
     """Показывает статистику бота (только для админа)"""
     try:
-        if str(message.from_user.id) != Config.ADMIN_CHAT_ID:
+        if not tenant.is_admin(message.from_user.id):
             await message.answer(ADMIN_ONLY_TEXT)
             return
         
-        contacts_count = contact_manager.get_contacts_count()
+        contacts_count = tenant.contact_manager.get_contacts_count()
+        # Фоновые задачи и соединения общие для всех арендаторов процесса - их видит только оператор
+        operator_stats = ''
+        if tenant.is_operator(message.from_user.id):
+            connection_stats = get_connection_stats()
+            operator_stats = STATS_OPERATOR_TEXT.format(
+                background_in_flight=background_tasks.in_flight,
+                background_failed=background_tasks.stats['failed'],
+                telegram_reused=connection_stats['telegram']['reused'],
+                telegram_requests=connection_stats['telegram']['requests'],
+                openrouter_reused=connection_stats['openrouter']['reused'],
+                openrouter_requests=connection_stats['openrouter']['requests']
+            )
         
         formatted_stats = STATS_TEXT.format(
             contacts_count=contacts_count,
+            local_regex_count=await shared_store.get(tenant.counter_key('contact_extraction.local_regex')),
+            ai_extraction_count=await shared_store.get(tenant.counter_key('contact_extraction.ai_extraction')),
+            send_queue_depth=tenant.send_queue.depth,
+            send_failed_count=tenant.send_queue.stats['failed'],
+            retry_after_count=tenant.send_queue.stats['retry_after'],
+            token_usage=await usage_tracker.render_today(tenant.name),
+            operator_stats=operator_stats,
+            sliding_windows=analytics.render(tenant.name),
             current_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         )
         
-        await safe_send_message(message.chat.id, formatted_stats)
+        await safe_send_message(tenant, message.chat.id, formatted_stats)
     except Exception as e:
         logger.error(f"Ошибка в команде stats: {e}")
 
+def format_usage_day(day: int) -> str:
+    """День YYYYMMDD из статистики токенов в виде ДД.ММ"""
+    return f"{day % 100:02d}.{day // 100 % 100:02d}"
+
+# Команда для админа - расход токенов LLM по пользователям
+@dp.message(Command("usage"))
+async def cmd_usage(message: types.Message, tenant: Tenant, command: CommandObject):
+    """Расход токенов: /usage - по дням и самые активные пользователи, /usage <user_id> - пользователь (только для админа)"""
+    try:
+        if not tenant.is_admin(message.from_user.id):
+            await message.answer(ADMIN_ONLY_TEXT)
+            return
+        
+        args = (command.args or '').strip()
+        if args.lstrip('-').isdigit():
+            user_id = int(args)
+            days = await usage_tracker.user_days(tenant.name, user_id)
+            report = USER_USAGE_TEXT.format(
+                user_id=user_id,
+                days='\n'.join(f"{format_usage_day(day)}: {usage.describe()}" for day, usage in days)
+                or USAGE_NO_DATA_TEXT,
+                quota=USAGE_QUOTA_STATES[await usage_tracker.quota(tenant.name, user_id)]
+            )
+        else:
+            async def top(days: int) -> str:
+                users = await usage_tracker.top_users(tenant.name, days=days)
+                return '\n'.join(f"{user_id}: {usage.describe()}" for user_id, usage in users) or USAGE_NO_DATA_TEXT
+            
+            report = USAGE_TEXT.format(
+                days='\n'.join(
+                    f"{format_usage_day(day)}: {usage.describe()}, пользователей {users}"
+                    for day, users, usage in await usage_tracker.daily_totals(tenant.name)
+                ) or USAGE_NO_DATA_TEXT,
+                top_today=await top(1),
+                top_week=await top(7),
+                soft_limit=Config.USER_TOKENS_SOFT_LIMIT or 'нет',
+                hard_limit=Config.USER_TOKENS_HARD_LIMIT or 'нет'
+            )
+        
+        await safe_send_message(tenant, message.chat.id, report)
+    except Exception as e:
+        logger.error(f"Ошибка в команде usage: {e}")
+
+# Команда для админа - задержка цикла событий и блокирующий код
+@dp.message(Command("loop"))
+async def cmd_loop(message: types.Message, tenant: Tenant):
+    """Показывает задержку цикла событий и худшие блокирующие места (только для оператора: цикл общий)"""
+    try:
+        if not tenant.is_operator(message.from_user.id):
+            await message.answer(OPERATOR_ONLY_TEXT)
+            return
+        
+        if not Config.LOOP_MONITOR_ENABLED:
+            await message.answer(LOOP_MONITOR_DISABLED_TEXT)
+            return
+        
+        await safe_send_message(tenant, message.chat.id, LOOP_STATS_TEXT.format(report=loop_monitor.report()))
+    except Exception as e:
+        logger.error(f"Ошибка в команде loop: {e}")
+
+def get_memory_structures() -> dict:
+    """Собственные структуры бота (всех арендаторов процесса) для отчета /memory"""
+    structures = {}
+    for tenant in container.tenant_registry.tenants:
+        kb = tenant.knowledge_service
+        structures[f"{tenant.name}: база знаний"] = [kb.prices, kb.faq, kb.services, kb.company_info]
+        structures[f"{tenant.name}: очередь отправки"] = [tenant.send_queue.chat_queues, tenant.send_queue.chat_buckets]
+        structures[f"{tenant.name}: неотправленные уведомления"] = tenant.notification_service.undelivered
+    structures["Сериализованные клавиатуры"] = Keyboards.serialized_cache()
+    structures["Метрики"] = {name: metric.values for name, metric in metrics.metrics.items()}
+    structures["Монитор цикла событий"] = [loop_monitor.offenders, loop_monitor.recent_lags]
+    structures["Ошибки фоновых задач"] = background_tasks.errors
+    structures["Реестр чатов: записанные чаты"] = broadcast_store.known
+    structures["Расход токенов за сегодня"] = usage_tracker.today
+    return structures
+
+# Команда для оператора - память процесса (tracemalloc, снимки, размеры структур)
+@dp.message(Command("memory"))
+async def cmd_memory(message: types.Message, tenant: Tenant, command: CommandObject):
+    """
+    Отчеты о памяти: /memory [start|stop|top|snapshot|diff|help]. Только для оператора:
+    память общая для процесса, а отчет перечисляет структуры всех арендаторов
+    """
+    try:
+        if not tenant.is_operator(message.from_user.id):
+            await message.answer(OPERATOR_ONLY_TEXT)
+            return
+        
+        args = (command.args or '').split()
+        action = args[0].lower() if args else ''
+        number = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+        
+        # Снимки и обход структур занимают заметное время - считаем вне цикла событий
+        if action == 'start':
+            report = memory_inspector.start(number or 1)
+        elif action == 'stop':
+            report = memory_inspector.stop()
+        elif action == 'top':
+            report = await asyncio.to_thread(memory_inspector.top, number or 15)
+        elif action == 'snapshot':
+            report = await asyncio.to_thread(memory_inspector.snapshot)
+        elif action == 'diff':
+            report = await asyncio.to_thread(memory_inspector.diff, number or 15)
+        elif action == 'help':
+            report = MEMORY_HELP_TEXT
+        else:
+            history_managers = {
+                tenant.name: tenant.history_manager
+                for tenant in {id(t.history_manager): t for t in container.tenant_registry.tenants}.values()
+            }
+            report = await asyncio.to_thread(memory_inspector.summary, get_memory_structures(), history_managers)
+        
+        # Длинный отчет отправляем файлом, чтобы не резать его на много сообщений
+        if utf16_length(report) > TELEGRAM_MAX_MESSAGE_LENGTH:
+            filename = f"memory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            await message.answer_document(
+                document=BufferedInputFile(report.encode('utf-8'), filename=filename),
+                caption=MEMORY_REPORT_CAPTION
+            )
+        else:
+            await safe_send_message(tenant, message.chat.id, report)
+    except Exception as e:
+        logger.error(f"Ошибка в команде memory: {e}")
+
+# Команда для админа - рассылка всем, кто писал боту
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: types.Message, tenant: Tenant, command: CommandObject):
+    """Рассылка: /broadcast <текст>, затем /broadcast go; status, stop, resume, cancel (только для админа)"""
+    try:
+        if not tenant.is_admin(message.from_user.id):
+            await message.answer(ADMIN_ONLY_TEXT)
+            return
+        
+        args = (command.args or '').strip()
+        action = args.lower()
+        job = broadcast_store.latest_job(tenant.name)
+        running = broadcast_store.running_jobs(tenant.name)
+        
+        if action in ('go', 'resume'):
+            # Одновременно у арендатора идет не больше одной рассылки (в любом из процессов);
+            # остановленная рассылка может еще дописывать начатые отправки
+            if running or (job and broadcaster.is_active(job.id)):
+                await message.answer(BROADCAST_ALREADY_RUNNING_TEXT.format(id=(running[0] if running else job).id))
+            elif action == 'go' and (job is None or job.status != DRAFT):
+                await message.answer(BROADCAST_NO_DRAFT_TEXT)
+            elif action == 'resume' and (job is None or job.status != STOPPED):
+                await message.answer(BROADCAST_NOT_STOPPED_TEXT)
+            else:
+                # Ход рассылки приходит отдельным сообщением от исполнителя
+                job.progress_chat_id = message.chat.id
+                broadcaster.start(tenant, job)
+        elif action == 'stop':
+            if not running:
+                await message.answer(BROADCAST_NOT_RUNNING_TEXT)
+            else:
+                broadcaster.stop(running[0])
+                await message.answer(BROADCAST_STOPPING_TEXT.format(id=running[0].id))
+        elif action == 'cancel':
+            if job is None or job.status != DRAFT:
+                await message.answer(BROADCAST_NO_DRAFT_TEXT)
+            else:
+                broadcast_store.delete_job(job.id)
+                await message.answer(BROADCAST_CANCELLED_TEXT.format(id=job.id))
+        elif action == 'status':
+            await safe_send_message(tenant, message.chat.id, broadcaster.render(job) if job else BROADCAST_NO_JOBS_TEXT)
+        elif not args:
+            await safe_send_message(tenant, message.chat.id, BROADCAST_HELP_TEXT)
+        elif utf16_length(args) > TELEGRAM_MAX_MESSAGE_LENGTH:
+            await message.answer(BROADCAST_TOO_LONG_TEXT.format(limit=TELEGRAM_MAX_MESSAGE_LENGTH))
+        else:
+            # Сначала черновик с числом получателей: рассылку нельзя отозвать, запуск - отдельной командой
+            job = broadcast_store.create_job(tenant.name, args)
+            await safe_send_message(tenant, message.chat.id, BROADCAST_DRAFT_TEXT.format(
+                id=job.id, recipients=broadcast_store.count_chats(tenant.name), text=args
+            ))
+    except Exception as e:
+        logger.error(f"Ошибка в команде broadcast: {e}")
+
 # Команда для экспорта контактов
 @dp.message(Command("export_contacts"))
-async def cmd_export_contacts(message: types.Message):
+async def cmd_export_contacts(message: types.Message, tenant: Tenant):
     """Экспортирует контакты в файл (только для админа)"""
     try:
-        if str(message.from_user.id) != Config.ADMIN_CHAT_ID:
+        if not tenant.is_admin(message.from_user.id):
             await message.answer(ADMIN_ONLY_TEXT)
             return
         
-        contacts_count = contact_manager.get_contacts_count()
+        contacts_count = tenant.contact_manager.get_contacts_count()
         
         if contacts_count == 0:
             await message.answer(NO_CONTACTS_TEXT)
@@ -112,8 +359,8 @@ async def cmd_export_contacts(message: types.Message):
         
         export_filename = f"contacts_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         
-        if os.path.exists(contact_manager.contacts_file):
-            file = FSInputFile(contact_manager.contacts_file, filename=export_filename)
+        if os.path.exists(tenant.contact_manager.contacts_file):
+            file = FSInputFile(tenant.contact_manager.contacts_file, filename=export_filename)
             await message.answer_document(
                 document=file,
                 caption=EXPORT_SUCCESS_TEXT.format(count=contacts_count)
@@ -126,32 +373,32 @@ async def cmd_export_contacts(message: types.Message):
 
 # Команда для сброса истории диалога
 @dp.message(Command("clear_history"))
-async def cmd_clear_history(message: types.Message):
+async def cmd_clear_history(message: types.Message, tenant: Tenant):
     """Сбрасывает историю диалога для пользователя"""
     try:
         user_id = message.from_user.id
-        history_manager.clear_history(user_id)
+        tenant.history_manager.clear_history(user_id)
         await message.answer(CLEAR_HISTORY_TEXT)
     except Exception as e:
         logger.error(f"Ошибка в команде clear_history: {e}")
 
 # Команда помощи по контактам
 @dp.message(Command("contact_help"))
-async def cmd_contact_help(message: types.Message):
+async def cmd_contact_help(message: types.Message, tenant: Tenant):
     """Показывает справку по вводу контактных данных"""
     try:
-        await safe_send_message(message.chat.id, CONTACT_HELP_TEXT, reply_markup=Keyboards.get_main_keyboard())
+        await safe_send_message(tenant, message.chat.id, CONTACT_HELP_TEXT, reply_markup=Keyboards.get_main_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в команде contact_help: {e}")
 
 # Команда /prices
 @dp.message(Command("prices"))
 @dp.message(F.text == PRICE_BTN_TXT)
-async def cmd_prices(message: types.Message):
+async def cmd_prices(message: types.Message, tenant: Tenant):
     """Показывает информацию о ценах"""
     try:
-        prices_info = knowledge_service.get_prices_info()
-        await safe_send_message(message.chat.id, prices_info, reply_markup=Keyboards.get_main_keyboard())
+        prices_info = tenant.knowledge_service.get_prices_info()
+        await safe_send_message(tenant, message.chat.id, prices_info, reply_markup=Keyboards.get_main_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в команде prices: {e}")
         await message.answer(ERROR_TEXT, reply_markup=Keyboards.get_main_keyboard())
@@ -159,11 +406,11 @@ async def cmd_prices(message: types.Message):
 # Команда /services
 @dp.message(Command("services"))
 @dp.message(F.text == SERVICE_BTN_TXT)
-async def cmd_services(message: types.Message):
+async def cmd_services(message: types.Message, tenant: Tenant):
     """Показывает информацию об услугах компании"""
     try:
-        services_info = knowledge_service.get_service_details("all")
-        await safe_send_message(message.chat.id, services_info, reply_markup=Keyboards.get_main_keyboard())
+        services_info = tenant.knowledge_service.get_service_details("all")
+        await safe_send_message(tenant, message.chat.id, services_info, reply_markup=Keyboards.get_main_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в команде services: {e}")
         await message.answer(ERROR_TEXT, reply_markup=Keyboards.get_main_keyboard())
@@ -171,10 +418,10 @@ async def cmd_services(message: types.Message):
 # Команда /faq
 @dp.message(Command("faq"))
 @dp.message(F.text == FAQ_BTN_TXT)
-async def cmd_faq(message: types.Message):
+async def cmd_faq(message: types.Message, tenant: Tenant):
     """Показывает частые вопросы"""
     try:
-        faq_list = knowledge_service.faq.get('frequently_asked_questions', [])
+        faq_list = tenant.knowledge_service.faq.get('frequently_asked_questions', [])
         faq_text = "❓ ЧАСТО ЗАДАВАЕМЫЕ ВОПРОСЫ:\n\n"
         
         for i, item in enumerate(faq_list[:10], 1):  # Показываем первые 10 вопросов
@@ -183,7 +430,7 @@ async def cmd_faq(message: types.Message):
         
         faq_text += "Задайте свой вопрос, и я с радостью на него отвечу!"
         
-        await safe_send_message(message.chat.id, faq_text, reply_markup=Keyboards.get_main_keyboard())
+        await safe_send_message(tenant, message.chat.id, faq_text, reply_markup=Keyboards.get_main_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в команде faq: {e}")
         await message.answer(ERROR_TEXT, reply_markup=Keyboards.get_main_keyboard())
@@ -191,11 +438,11 @@ async def cmd_faq(message: types.Message):
 # Команда /company
 @dp.message(Command("company"))
 @dp.message(F.text == ABOUT_BTN_TXT)
-async def cmd_company(message: types.Message):
+async def cmd_company(message: types.Message, tenant: Tenant):
     """Показывает информацию о компании"""
     try:
-        company_info = knowledge_service.get_company_info()
-        await safe_send_message(message.chat.id, company_info, reply_markup=Keyboards.get_main_keyboard())
+        company_info = tenant.knowledge_service.get_company_info()
+        await safe_send_message(tenant, message.chat.id, company_info, reply_markup=Keyboards.get_main_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в команде company: {e}")
         await message.answer(ERROR_TEXT, reply_markup=Keyboards.get_main_keyboard())
@@ -203,22 +450,22 @@ async def cmd_company(message: types.Message):
 # Обработчики кнопок
 # ОБНОВЛЕННЫЙ ОБРАБОТЧИК - теперь сразу запрашивает контакт
 @dp.message(F.text == CONSULTATION_BTN_TXT)
-async def handle_consultation_request(message: types.Message):
+async def handle_consultation_request(message: types.Message, tenant: Tenant):
     try:
-        await safe_send_message(message.chat.id, CONSULTATION_TEXT, reply_markup=Keyboards.get_contact_keyboard())
+        await safe_send_message(tenant, message.chat.id, CONSULTATION_TEXT, reply_markup=Keyboards.get_contact_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в обработчике консультации: {e}")
 
 @dp.message(F.text == BACK_BTN_TXT)
-async def handle_back(message: types.Message):
+async def handle_back(message: types.Message, tenant: Tenant):
     try:
-        await safe_send_message(message.chat.id, BACK_TEXT, reply_markup=Keyboards.get_main_keyboard())
+        await safe_send_message(tenant, message.chat.id, BACK_TEXT, reply_markup=Keyboards.get_main_keyboard())
     except Exception as e:
         logger.error(f"Ошибка в обработчике назад: {e}")
 
 # Обработчик контактов (кнопка)
 @dp.message(F.contact)
-async def handle_contact(message: types.Message):
+async def handle_contact(message: types.Message, tenant: Tenant):
     try:
         contact = message.contact
         
@@ -226,23 +473,29 @@ async def handle_contact(message: types.Message):
             'first_name': contact.first_name or '',
             'last_name': contact.last_name or '',
             'phone_number': contact.phone_number,
+            'email': '',
             'username': message.from_user.username or 'не указан',
             'user_id': message.from_user.id,
             'source': 'contact_button'
         }
         
-        contact_manager.save_contact(contact_data)
-        
-        if notification_service:
-            await notification_service.notify_new_contact(contact_data)
-        
-        await safe_send_message(message.chat.id, CONTACT_RECEIVED_TEXT, reply_markup=Keyboards.get_main_keyboard())
+        try:
+            # Сначала отвечаем пользователю, сохранение и уведомление - в фоне
+            await safe_send_message(tenant, message.chat.id, CONTACT_RECEIVED_TEXT, reply_markup=Keyboards.get_main_keyboard())
+        finally:
+            background_tasks.spawn(
+                process_new_contact(tenant, contact_data), name=f"contact-{message.from_user.id}", critical=True
+            )
     except Exception as e:
         logger.error(f"Ошибка в обработчике контактов: {e}")
 
 # Обработчик ключевых слов для консультации
-@dp.message(F.text.contains("консультаци") | F.text.contains("запис") | F.text.contains("свяжит"))
-async def handle_consultation_keywords(message: types.Message):
+def has_no_contacts(message: types.Message) -> bool:
+    """Фильтр: в сообщении нет телефона или email (такие сообщения - уже заявка)"""
+    return not contact_parser.extract_contacts_fast(message.text)
+
+@dp.message(F.text.contains("консультаци") | F.text.contains("запис") | F.text.contains("свяжит"), has_no_contacts)
+async def handle_consultation_keywords(message: types.Message, tenant: Tenant):
     """Обработчик ключевых слов, связанных с консультацией"""
     user_message_lower = message.text.lower()
     
@@ -251,9 +504,6 @@ async def handle_consultation_keywords(message: types.Message):
     has_consultation_intent = any(keyword in user_message_lower for keyword in consultation_keywords)
     
     if has_consultation_intent:
-        # Показываем индикатор набора
-        asyncio.create_task(send_typing_action(message.chat.id, 2))
-        
         response = """🎯 Отлично, что хотите получить консультацию!
 
 🚀 Нажмите кнопку «📅 Запись на консультацию» в основном меню
@@ -261,98 +511,300 @@ async def handle_consultation_keywords(message: types.Message):
 📅 Консультация бесплатная (30-60 минут)
 👨‍💼 Специалист свяжется в течение 2 часов"""
         
-        await safe_send_message(message.chat.id, response, reply_markup=Keyboards.get_main_keyboard())
+        await safe_send_message(tenant, message.chat.id, response, reply_markup=Keyboards.get_main_keyboard())
         return True
     
     return False
 
 # Обработчик всех остальных текстовых сообщений с ИИ-распознаванием контактов
 @dp.message(F.text)
-async def handle_text(message: types.Message):
-    # Сначала проверяем, не обработано ли сообщение как намерение консультации
-    if await handle_consultation_keywords(message):
-        return
-    
+async def handle_text(message: types.Message, tenant: Tenant):
     user_id = message.from_user.id
     user_message = message.text
     
-    typing_task = asyncio.create_task(send_typing_action(message.chat.id, 10))
+    # Переписка для офлайн-дозаполнения контактов (backfill_contacts.py)
+    if Config.LOG_TRANSCRIPTS:
+        log_transcript(tenant.name, message.from_user, user_message)
+    
+    # Быстрый путь: ищем телефон и email прямо в сообщении пользователя, до запроса к ИИ
+    with span('contact_parse_local'):
+        local_contact_info = contact_parser.extract_contacts_fast(user_message)
+    
+    # Проверяем, не обработано ли сообщение как намерение консультации (если контактов нет)
+    if not local_contact_info and await handle_consultation_keywords(message, tenant):
+        return
     
     try:
-        chat_history = history_manager.get_user_history(user_id)
-        ai_response = await ai_service.get_ai_response(user_message, chat_history)
-        typing_task.cancel()
-        
-        # Пытаемся извлечь контактные данные из ответа ИИ
-        contact_info = ai_contact_parser.extract_contacts_from_ai_response(ai_response)
-        
-        response_to_user = ai_response
-        
-        if contact_info and contact_info['success']:
-            # Сохраняем контактные данные
-            user_data = {
-                'first_name': message.from_user.first_name or '',
-                'last_name': message.from_user.last_name or '',
-                'username': message.from_user.username or 'не указан',
-                'user_id': user_id
-            }
-            
-            # Используем имя из ИИ, если оно найдено, иначе из Telegram
-            contact_name = contact_info.get('name') or user_data['first_name']
+        user_data = {
+            'first_name': message.from_user.first_name or '',
+            'last_name': message.from_user.last_name or '',
+            'username': message.from_user.username or 'не указан',
+            'user_id': user_id
+        }
+        
+        contact_data = None
+        
+        if local_contact_info:
+            shared_store.incr(tenant.counter_key('contact_extraction.local_regex'))
             
             contact_data = {
-                'first_name': contact_name,
+                'first_name': local_contact_info.get('name') or user_data['first_name'],
                 'last_name': user_data['last_name'],
-                'phone_number': contact_info.get('phone', ''),
-                'email': contact_info.get('email', ''),
+                'phone_number': local_contact_info.get('phone', ''),
+                'email': local_contact_info.get('email', ''),
                 'username': user_data['username'],
                 'user_id': user_data['user_id'],
-                'additional_info': contact_info.get('comment', ''),
-                'source': 'ai_extraction'
+                'additional_info': local_contact_info.get('additional_info', ''),
+                'source': 'local_regex'
             }
+        
+        # Индикатор набора обновляется, пока ИИ готовит ответ и пока очередь не доставит его в чат
+        # Админ работает без квоты токенов
+        quota = QUOTA_OK if tenant.is_admin(user_id) else await usage_tracker.quota(tenant.name, user_id)
+        async with tenant.typing_manager.typing(message.chat.id):
+            chat_history = tenant.history_manager.get_user_history(user_id)
+            ai_response = await ai_service.get_ai_response(
+                user_message, chat_history, contacts_saved=bool(local_contact_info),
+                knowledge=tenant.knowledge_service, system_prompt=tenant.system_prompt,
+                user_id=user_id, tenant=tenant.name, quota=quota
+            )
             
-            contact_manager.save_contact(contact_data)
+            # Пытаемся извлечь контактные данные из ответа ИИ
+            with span('contact_parse_ai'):
+                contact_info = ai_contact_parser.extract_contacts_from_ai_response(ai_response)
             
-            # Отправляем уведомление админу
-            if notification_service:
-                await notification_service.notify_new_contact(contact_data)
+            response_to_user = ai_response
             
-            # Используем очищенный ответ для пользователя
-            response_to_user = contact_info.get('clean_response', ai_response)
+            if contact_info and contact_info['success']:
+                shared_store.incr(tenant.counter_key('contact_extraction.ai_extraction'))
+                
+                # Используем очищенный ответ для пользователя
+                response_to_user = contact_info.get('clean_response', ai_response)
+                
+                # Если контакт уже найден быстрым путем, повторно его не сохраняем
+                if contact_data is None:
+                    # Используем имя из ИИ, если оно найдено, иначе из Telegram
+                    contact_name = contact_info.get('name') or user_data['first_name']
+                    
+                    contact_data = {
+                        'first_name': contact_name,
+                        'last_name': user_data['last_name'],
+                        'phone_number': contact_info.get('phone', ''),
+                        'email': contact_info.get('email', ''),
+                        'username': user_data['username'],
+                        'user_id': user_data['user_id'],
+                        'additional_info': contact_info.get('comment', ''),
+                        'source': 'ai_extraction'
+                    }
             
             # Добавляем подтверждение о сохранении контакта
-            if contact_info.get('phone') or contact_info.get('email'):
-                confirmation = "\n\n✅ Ваши контактные данные сохранены! Мы свяжемся с вами в ближайшее время."
-                response_to_user += confirmation
-        
-        # Сохраняем в историю
-        history_manager.add_message(user_id, "user", user_message)
-        history_manager.add_message(user_id, "assistant", response_to_user)
-        
-        # Отправляем ответ пользователю
-        await safe_send_message(message.chat.id, response_to_user, reply_markup=Keyboards.get_main_keyboard())
+            if contact_data and (contact_data['phone_number'] or contact_data['email']):
+                response_to_user += CONTACT_SAVED_CONFIRMATION_TEXT
+            
+            try:
+                # Сначала отвечаем пользователю
+                await safe_send_message(tenant, message.chat.id, response_to_user, reply_markup=Keyboards.get_main_keyboard())
+            finally:
+                # Сохранение контакта, уведомление админа и история выполняются в фоне.
+                # Контакт ставится в работу даже если отправка ответа не удалась
+                if contact_data:
+                    background_tasks.spawn(
+                        process_new_contact(tenant, contact_data), name=f"contact-{user_id}", critical=True
+                    )
         
+        background_tasks.spawn(
+            save_dialog_history(tenant, user_id, user_message, response_to_user), name=f"history-{user_id}"
+        )
+    
     except Exception as e:
         logger.error(f"Ошибка при обработке сообщения: {e}")
-        typing_task.cancel()
-        await safe_send_message(message.chat.id, ERROR_TEXT, reply_markup=Keyboards.get_main_keyboard())
+        analytics.record_error(tenant.name)
+        await safe_send_message(tenant, message.chat.id, ERROR_TEXT, reply_markup=Keyboards.get_main_keyboard())
+
+async def warm_up_ai():
+    """Создает клиент OpenRouter в потоке (импорт openai не блокирует цикл) и прогревает соединение"""
+    client = await asyncio.to_thread(container.get, 'openrouter_client')
+    return await warm_up_openrouter(client)
+
+async def on_startup(notify_started: bool = True, resume_broadcasts: bool = True):
+    """
+    Проверка настроек и инициализация сервисов всех арендаторов перед приемом апдейтов.
+    resume_broadcasts - продолжить прерванные рассылки (при шардировании - только в одном воркере)
+    """
+    with startup_profiler.phase('config'):
+        Config.validate()
+    
+    if Config.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    
+    with startup_profiler.phase('tenants'):
+        tenant_registry = container.tenant_registry
+    
+    # Открываем соединения заранее, чтобы первый ответ не ждал DNS и TLS
+    if Config.HTTP_WARMUP:
+        with startup_profiler.phase('warm_up'):
+            await asyncio.gather(warm_up_ai(), *(warm_up_telegram(bot) for bot in tenant_registry.bots()))
+    
+    with startup_profiler.phase('tenants_start'):
+        for tenant in tenant_registry.tenants:
+            await tenant.start(notify_started=notify_started)
+    
+    if resume_broadcasts and not startup_profiler.profile_mode:
+        broadcaster.resume(tenant_registry.tenants)
+
+async def on_shutdown(runner=None):
+    """
+    Плавная остановка: дообработка начатых апдейтов и фоновых задач, отправка очередей
+    сообщений и уведомлений (все - в пределах SHUTDOWN_DRAIN_TIMEOUT), затем закрытие
+    HTTP-сервера и сессий. В конце в лог пишется отчет о брошенной работе
+    """
+    # Остановка могла начаться не по сигналу (ошибка, конец polling) - новые апдейты тоже не принимаем
+    if not shutdown.stopping:
+        shutdown.request_stop('завершение работы')
+    shutdown.start_deadline(Config.SHUTDOWN_DRAIN_TIMEOUT)
+    dropped = {}
+    
+    # Рассылки не дожидаемся: прогресс сохраняется, после перезапуска они продолжатся
+    await broadcaster.close()
+    # Начатые апдейты ставят в фон сохранение контактов и истории, поэтому сначала ждем их
+    dropped['апдейтов'] = await shutdown.drain_updates(shutdown.remaining())
+    dropped['фоновых задач'] = dropped_background(await background_tasks.drain(shutdown.remaining()))
+    # Расход токенов и счетчики, накопленные в памяти, и отметки о чатах дописываем в базу
+    await usage_tracker.flush()
+    await shared_store.flush()
+    await broadcast_store.flush()
+    # Сервисы, которые не успели создаться (ошибка при старте), не создаем ради закрытия
+    if container.is_initialized('tenant_registry'):
+        tenants = container.tenant_registry.tenants
+        await asyncio.gather(*(tenant.close(shutdown.remaining()) for tenant in tenants))
+        dropped['частей сообщений'] = sum(tenant.send_queue.stats['dropped'] for tenant in tenants)
+        # Сами контакты уже в файле, не ушло только уведомление админу
+        dropped['уведомлений о контактах'] = sum(
+            tenant.notification_service.pending + tenant.notification_service.dropped for tenant in tenants
+        )
+    
+    # HTTP-сервер закрываем после дообработки: webhook до конца отвечает 503, а /health сообщает об остановке
+    if runner:
+        await runner.cleanup()
+    # Сессия общая для всех ботов - закрываем один раз
+    if container.is_initialized('telegram_session'):
+        await container.telegram_session.close()
+    await ai_service.close()
+    await loop_monitor.stop()
+    shutdown.report(dropped)
+
+async def report_ready(mode: str):
+    """Отмечает готовность к приему апдейтов; в режиме --profile-startup печатает отчет и останавливает бота"""
+    startup_profiler.mark_ready(mode)
+    if startup_profiler.profile_mode:
+        print(startup_profiler.report(container.init_times))
+        if mode == 'polling':
+            # Вызываемся из startup-обработчика, до старта цикла polling: stop_polling ждет его
+            # завершения, поэтому остановку запускаем в фоне, а не ждем здесь
+            background_tasks.spawn(dp.stop_polling(), name='profile-startup-stop')
 
-# Обновляем функцию main для инициализации сервисов
+# Диспетчер вызывает startup-обработчики в start_polling непосредственно перед первым getUpdates
+@dp.startup()
+async def on_polling_started():
+    await report_ready('polling')
+
+def get_health_info() -> dict:
+    """Состояние бота для эндпоинта /health"""
+    return {
+        'mode': Config.BOT_MODE,
+        'tenants': len(container.tenant_registry.tenants),
+        'send_queue_depth': sum(tenant.send_queue.depth for tenant in container.tenant_registry.tenants),
+        'background_in_flight': background_tasks.in_flight,
+        'updates_in_flight': len(shutdown.updates),
+        'broadcasts_running': len(broadcaster.tasks),
+        'log_records_dropped': log_pipeline.dropped,
+        'connections': get_connection_stats()
+    }
+
+def get_webhook_path(tenant: Tenant) -> str:
+    """Путь webhook арендатора: у единственного арендатора - WEBHOOK_PATH без суффикса"""
+    if len(container.tenant_registry.tenants) == 1:
+        return Config.WEBHOOK_PATH
+    return f"{Config.WEBHOOK_PATH.rstrip('/')}/{tenant.name}"
+
+# Запуск в режиме long polling
 async def main():
     logger.info("Запускаем бота с упрощенным процессом записи...")
-    
-    global notification_service
-    notification_service = NotificationService(bot)
+    runner = None
     
     try:
-        await notification_service.notify_bot_started()
-        await dp.start_polling(bot)
+        # Сигналы обрабатываем сами: по SIGTERM/SIGINT polling останавливается, а сессию
+        # закрывает on_shutdown после дообработки начатых апдейтов
+        shutdown.install_signal_handlers()
+        await on_startup()
+        
+        # В режиме polling HTTP-сервер нужен только для /metrics (и /health)
+        if ProductionConfig.ENABLE_METRICS:
+            app = create_web_app(get_health_info)
+            add_metrics_handler(app, metrics)
+            runner = await start_web_server(app, Config.WEBAPP_HOST, Config.WEBAPP_PORT)
+        
+        polling = dp.start_polling(*container.tenant_registry.bots(), handle_signals=False, close_bot_session=False)
+        await shutdown.run_until_stopped(polling, stop=dp.stop_polling)
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
-        await bot.session.close()
+        await on_shutdown(runner)
+
+# Запуск в режиме webhook
+async def main_webhook():
+    logger.info("Запускаем бота в режиме webhook...")
+    
+    if not Config.WEBHOOK_BASE_URL:
+        raise ValueError("WEBHOOK_BASE_URL не найден в .env файле (обязателен для BOT_MODE=webhook)")
+    
+    # Без заданного секрета генерируем случайный: webhook переустанавливается при каждом запуске
+    secret_token = Config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    runner = None
+    
+    try:
+        shutdown.install_signal_handlers()
+        await on_startup()
+        if shutdown.stopping:
+            # Сигнал пришел во время запуска: не перехватываем webhook у нового экземпляра
+            return
+        
+        app = create_web_app(get_health_info)
+        if ProductionConfig.ENABLE_METRICS:
+            add_metrics_handler(app, metrics)
+        for tenant in container.tenant_registry.tenants:
+            add_webhook_handler(app, dp, tenant.bot, get_webhook_path(tenant), secret_token)
+        with startup_profiler.phase('web_server'):
+            runner = await start_web_server(app, Config.WEBAPP_HOST, Config.WEBAPP_PORT)
+        
+        with startup_profiler.phase('set_webhook'):
+            for tenant in container.tenant_registry.tenants:
+                await tenant.bot.set_webhook(
+                    url=Config.WEBHOOK_BASE_URL.rstrip('/') + get_webhook_path(tenant),
+                    secret_token=secret_token,
+                    allowed_updates=dp.resolve_used_update_types()
+                )
+        logger.info("Webhook установлен, ожидаем апдейты")
+        await report_ready('webhook')
+        if startup_profiler.profile_mode:
+            return
+        
+        # Работаем до SIGTERM/SIGINT; webhook при этом остается открытым и отвечает 503,
+        # чтобы Telegram повторил апдейты, пока бот дообрабатывает начатое
+        await shutdown.wait()
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info("Бот остановлен")
+    except Exception as e:
+        logger.error(f"Критическая ошибка: {e}")
+    finally:
+        await on_shutdown(runner)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # Логирование настраивает точка входа (здесь или run.py), а не импорт модуля
+    log_pipeline.start()
+    try:
+        asyncio.run(main_webhook() if Config.BOT_MODE == 'webhook' else main())
+    finally:
+        log_pipeline.stop()
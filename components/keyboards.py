@@ -1,17 +1,48 @@
 """
 Файл с клавиатурами бота
 """
+import json
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
 from aiogram import types
+from pydantic import ConfigDict
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
 from settings.texts import (
     SERVICE_BTN_TXT, ABOUT_BTN_TXT, PRICE_BTN_TXT, FAQ_BTN_TXT, CONSULTATION_BTN_TXT,
     BACK_BTN_TXT, CONTACT_BTN_TXT
 )
 
+# Готовый JSON неизменяемых клавиатур для Bot API: id(markup) -> str
+_serialized_keyboards: Dict[int, str] = {}
+
+class FrozenKeyboardButton(types.KeyboardButton):
+    """KeyboardButton, который нельзя изменить после создания"""
+    model_config = ConfigDict(frozen=True)
+
+class FrozenReplyKeyboardMarkup(types.ReplyKeyboardMarkup):
+    """
+    ReplyKeyboardMarkup, который нельзя изменить после создания: заморожены и сама
+    клавиатура, и ряды (кортежи), и кнопки. Иначе закешированный по id JSON мог бы устареть
+    """
+    model_config = ConfigDict(frozen=True)
+    keyboard: Tuple[Tuple[FrozenKeyboardButton, ...], ...]
+
+def _freeze(markup: types.ReplyKeyboardMarkup) -> FrozenReplyKeyboardMarkup:
+    """Замораживает клавиатуру и запоминает ее JSON, чтобы не сериализовать при каждой отправке"""
+    frozen_markup = FrozenReplyKeyboardMarkup.model_validate(markup.model_dump(exclude_none=True))
+    _serialized_keyboards[id(frozen_markup)] = json.dumps(frozen_markup.model_dump(exclude_none=True))
+    return frozen_markup
+
 class Keyboards:
-    """Класс для управления клавиатурами бота"""
+    """
+    Класс для управления клавиатурами бота.
+    Клавиатуры не меняются во время работы, поэтому каждая строится один раз
+    и дальше переиспользуется в замороженном виде
+    """
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_main_keyboard():
         """Основная клавиатура - убрали кнопку "Задать вопрос" """
         builder = ReplyKeyboardBuilder()
@@ -23,20 +54,32 @@ class Keyboards:
             types.KeyboardButton(text=FAQ_BTN_TXT)
         )
         builder.adjust(1, 2)  # Консультация отдельно, остальные по 2 в ряду
-        return builder.as_markup(resize_keyboard=True)
+        return _freeze(builder.as_markup(resize_keyboard=True))
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_contact_keyboard():
         """Клавиатура для запроса контактных данных"""
         builder = ReplyKeyboardBuilder()
         builder.add(types.KeyboardButton(text=CONTACT_BTN_TXT, request_contact=True))
         builder.add(types.KeyboardButton(text=BACK_BTN_TXT))
         builder.adjust(1)  # По одной кнопке в ряду
-        return builder.as_markup(resize_keyboard=True)
+        return _freeze(builder.as_markup(resize_keyboard=True))
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_back_keyboard():
         """Простая клавиатура только с кнопкой Назад"""
         builder = ReplyKeyboardBuilder()
         builder.add(types.KeyboardButton(text=BACK_BTN_TXT))
-        return builder.as_markup(resize_keyboard=True)
\ No newline at end of file
+        return _freeze(builder.as_markup(resize_keyboard=True))
+    
+    @staticmethod
+    def get_serialized(markup) -> Optional[str]:
+        """Возвращает готовый JSON клавиатуры или None, если клавиатура не из кеша"""
+        return _serialized_keyboards.get(id(markup))
+    
+    @staticmethod
+    def serialized_cache() -> Dict[int, str]:
+        """Кеш готового JSON клавиатур (для отчета о памяти)"""
+        return _serialized_keyboards
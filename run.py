@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
 """
 Скрипт для запуска бота в production-режиме
+
+    python run.py                    # запуск
+    python run.py --profile-startup  # отчет о времени старта (импорт, сервисы, этапы) и выход
 """
 
 import os
 import sys
+
+# Хук замера импортов ставим до всех остальных импортов, чтобы их время тоже попало в отчет
+PROFILE_STARTUP = '--profile-startup' in sys.argv
+if PROFILE_STARTUP:
+    from services.startup_profiler import startup_profiler
+    startup_profiler.enable()
+
 import logging
 from dotenv import load_dotenv
 
@@ -12,30 +22,39 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Проверяем, что мы в production-режиме
-if os.getenv('ENVIRONMENT') != 'production':
+if os.getenv('ENVIRONMENT') != 'production' and not PROFILE_STARTUP:
     print("⚠️  Запуск в production-режиме. Установите ENVIRONMENT=production")
     sys.exit(1)
 
-# Настраиваем логирование для production
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/bot.log'),
-        logging.StreamHandler()
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
 def main():
     """Основная функция запуска"""
+    mode = os.getenv('BOT_MODE', 'polling').lower()
+    workers = int(os.getenv('BOT_WORKERS', '1'))
+    # Несколько воркеров: фронт-процесс распределяет апдейты по user_id
+    # (профиль старта снимается для одного процесса)
+    sharded = workers > 1 and not PROFILE_STARTUP
+    
+    # Логи пишет отдельный поток (консоль и файл с ротацией), при шардировании - для всех воркеров.
+    # Настраиваем здесь, а не при импорте: воркеры (spawn) импортируют этот модуль заново
+    from services.log_pipeline import log_pipeline
+    log_pipeline.start(multiprocess=sharded)
+    
     try:
         logger.info("Запускаем бота в production-режиме...")
+        logger.info(f"Режим получения апдейтов: {mode}, воркеров: {workers}")
+        
+        if sharded:
+            from services.sharding import run_sharded
+            run_sharded(workers, mode)
+            return
         
-        # Импортируем и запускаем бота
-        from bot import main as bot_main
+        # Импортируем и запускаем бота в режиме из BOT_MODE (polling или webhook)
         import asyncio
+        from bot import main, main_webhook
+        
+        bot_main = main_webhook if mode == 'webhook' else main
         
         asyncio.run(bot_main())
         
@@ -44,6 +63,9 @@ def main():
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
         sys.exit(1)
+    finally:
+        # Дописываем очередь логов до выхода
+        log_pipeline.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,26 +1,59 @@
 import logging
 import re
-from openai import AsyncOpenAI
+import time
+from typing import TYPE_CHECKING, Optional
 from settings.config import Config
-from settings.prompts import SYSTEM_PROMPT, CONTACT_EXTRACTION_PROMPT
-from services.knowledge_service import knowledge_service
+from settings.prompts import SYSTEM_PROMPT, CONTACT_EXTRACTION_PROMPT, CONTACTS_SAVED_PROMPT
+from settings.texts import QUOTA_EXCEEDED_TEXT
+from services.container import container
+from services.http_pools import create_openrouter_http_client
+from services.analytics import analytics
+from services.metrics import KB_LOOKUPS, LLM_ERRORS, LLM_QUOTA_DOWNGRADES, observe_llm_usage
+from services.tracing import span
+from services.usage_tracker import usage_tracker, QUOTA_OK, QUOTA_SOFT, QUOTA_HARD
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
+# Длина ответа LLM: обычная и для пользователя на мягкой квоте
+MAX_TOKENS = 1500
+SOFT_QUOTA_MAX_TOKENS = 500
+
+def create_openrouter_client() -> "AsyncOpenAI":
+    """Клиент OpenRouter; openai импортируется здесь, а не при импорте модуля (это заметная часть времени старта)"""
+    from openai import AsyncOpenAI
+    
+    return AsyncOpenAI(
+        base_url=Config.OPENROUTER_BASE_URL,
+        api_key=Config.OPENROUTER_API_KEY,
+        default_headers={
+            "HTTP-Referer": "https://github.com",
+            "X-Title": "Telegram Business Bot"
+        },
+        # Пул соединений, keep-alive и таймауты настраиваются через .env
+        http_client=create_openrouter_http_client()
+    )
+
+container.register('openrouter_client', create_openrouter_client)
+
 class AIService:
     """Сервис для работы с ИИ через OpenRouter"""
     
     def __init__(self):
-        self.client = AsyncOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=Config.OPENROUTER_API_KEY,
-            default_headers={
-                "HTTP-Referer": "https://github.com",
-                "X-Title": "Telegram Business Bot"
-            }
-        )
         self.model = "deepseek/deepseek-chat-v3.1:free"
     
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """Клиент OpenRouter из контейнера (создается при первом запросе или при прогреве)"""
+        return container.openrouter_client
+    
+    async def close(self):
+        """Закрывает пул соединений, если клиент был создан"""
+        if container.is_initialized('openrouter_client'):
+            await container.openrouter_client.close()
+    
     def _clean_response(self, text: str) -> str:
         """Очищает ответ от Markdown разметки и лишних символов"""
         if not text:
@@ -39,16 +72,33 @@ class AIService:
         
         return text
     
-    async def get_ai_response(self, user_message: str, chat_history: list = None) -> str:
+    async def get_ai_response(self, user_message: str, chat_history: list = None, contacts_saved: bool = False,
+                              knowledge=None, system_prompt: str = None, user_id: int = None,
+                              tenant: str = 'default', quota: str = QUOTA_OK) -> str:
         """
-        Получает ответ от ИИ на основе сообщения пользователя и истории диалога
+        Получает ответ от ИИ на основе сообщения пользователя и истории диалога.
+        contacts_saved=True означает, что контакты уже извлечены локально и ИИ
+        нужен только разговорный ответ без блока ===КОНТАКТЫ===.
+        knowledge и system_prompt задают базу знаний и промпт арендатора (бренда).
+        С user_id расход токенов записывается на пользователя арендатора tenant;
+        quota - состояние его дневной квоты (см. usage_tracker)
         """
         try:
             # Сначала проверяем базу знаний
-            knowledge_response = knowledge_service.search_knowledge(user_message)
+            with span('search_knowledge'):
+                knowledge_response = (knowledge or container.knowledge_service).search_knowledge(user_message)
+            KB_LOOKUPS.inc('hit' if knowledge_response else 'miss')
+            analytics.record_knowledge(tenant, bool(knowledge_response))
+            
+            # Квота исчерпана: отвечаем из базы знаний без запроса к LLM
+            if quota == QUOTA_HARD or (quota == QUOTA_SOFT and knowledge_response):
+                LLM_QUOTA_DOWNGRADES.inc(quota)
+                return knowledge_response or QUOTA_EXCEEDED_TEXT
             
             # Формируем сообщения для API
-            messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+            messages = [{"role": "system", "content": system_prompt or SYSTEM_PROMPT}]
+            if contacts_saved:
+                messages.append({"role": "system", "content": CONTACTS_SAVED_PROMPT})
             
             # Добавляем информацию из базы знаний если есть
             if knowledge_response:
@@ -63,25 +113,39 @@ class AIService:
                 messages.append({"role": "user", "content": user_message})
             
             # Отправляем запрос к API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=1500,
-                temperature=0.4
-            )
+            started = time.perf_counter()
+            try:
+                with span('openrouter'):
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=SOFT_QUOTA_MAX_TOKENS if quota == QUOTA_SOFT else MAX_TOKENS,
+                        temperature=0.4
+                    )
+            except Exception:
+                LLM_ERRORS.inc(self.model, 'reply')
+                raise
+            duration = time.perf_counter() - started
+            usage = getattr(response, 'usage', None)
+            observe_llm_usage(self.model, 'reply', duration, usage, tenant)
+            if user_id is not None:
+                usage_tracker.record(tenant, user_id, usage, duration)
             
             # Очищаем ответ от разметки
-            clean_response = self._clean_response(response.choices[0].message.content)
+            with span('clean_response'):
+                clean_response = self._clean_response(response.choices[0].message.content)
             
             return clean_response
             
         except Exception as e:
             logger.error(f"Ошибка при обращении к OpenRouter: {e}")
+            analytics.record_error(tenant)
             return "Извините, в настоящее время у меня технические проблемы. Пожалуйста, попробуйте позже или свяжитесь с консультантом напрямую."
     
-    async def extract_contacts(self, user_message: str) -> str:
+    async def extract_contacts(self, user_message: str) -> Optional[str]:
         """
-        Специальный запрос к ИИ только для извлечения контактов
+        Специальный запрос к ИИ только для извлечения контактов.
+        None - запрос не удался (в отличие от ответа НЕТ_КОНТАКТОВ его стоит повторить)
         """
         try:
             messages = [
@@ -89,18 +153,25 @@ class AIService:
                 {"role": "user", "content": user_message}
             ]
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=500,
-                temperature=0.3
-            )
+            started = time.perf_counter()
+            try:
+                with span('openrouter_contacts'):
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=500,
+                        temperature=0.3
+                    )
+            except Exception:
+                LLM_ERRORS.inc(self.model, 'contact_extraction')
+                raise
+            observe_llm_usage(self.model, 'contact_extraction', time.perf_counter() - started, getattr(response, 'usage', None))
             
             return response.choices[0].message.content
             
         except Exception as e:
             logger.error(f"Ошибка при извлечении контактов: {e}")
-            return "НЕТ_КОНТАКТОВ"
+            return None
 
 # Создаем глобальный экземпляр сервиса
 ai_service = AIService()
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""
+Аналитика в скользящих окнах (5 минут, 1 час, 24 часа) для /stats
+
+Каждое окно - кольцевой буфер фиксированного числа корзин по времени.
+Событие обновляет одну корзину за O(1), а сводка обходит фиксированное число
+корзин, поэтому стоимость не зависит от трафика. Активные пользователи считаются
+битовым скетчем (linear counting), задержки LLM - гистограммой с логарифмическими
+границами, так что и память на корзину постоянна. Новый пользователь окна - тот,
+чьего бита еще нет ни в одной корзине окна, поэтому конверсия считается без
+глобального множества id (и после перезапуска не искажается)
+"""
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Границы гистограммы задержек LLM: от 50 мс до ~100 с с шагом ~25%
+LATENCY_BOUNDS = tuple(0.05 * 1.25 ** i for i in range(35))
+
+# Размер битового скетча активных пользователей (оценка точна до нескольких тысяч в окне)
+USERS_SKETCH_BITS = 8192
+
+def _user_bit(user_id: int) -> int:
+    # Перемешиваем id (Фибоначчиево хеширование), чтобы соседние id не шли в соседние биты
+    return 1 << (((user_id * 11400714819323198485) & 0xFFFFFFFFFFFFFFFF) >> 51) % USERS_SKETCH_BITS
+
+def _estimate_users(sketch: int) -> int:
+    """Оценка числа уникальных пользователей по битовой маске (linear counting)"""
+    zero_bits = USERS_SKETCH_BITS - bin(sketch).count('1')
+    if zero_bits == 0:
+        return USERS_SKETCH_BITS  # скетч насыщен, оценка снизу
+    return round(-USERS_SKETCH_BITS * math.log(zero_bits / USERS_SKETCH_BITS))
+
+class Bucket:
+    """Агрегаты за один интервал времени"""
+    
+    __slots__ = ('epoch', 'messages', 'errors', 'kb_hits', 'kb_lookups', 'new_users', 'contacts',
+                 'users', 'latency_counts')
+    
+    def __init__(self):
+        self.reset(-1)
+    
+    def reset(self, epoch: int):
+        self.epoch = epoch
+        self.messages = 0
+        self.errors = 0
+        self.kb_hits = 0
+        self.kb_lookups = 0
+        self.new_users = 0
+        self.contacts = 0
+        self.users = 0
+        self.latency_counts = [0] * (len(LATENCY_BOUNDS) + 1)
+
+class SlidingWindow:
+    """Окно длиной size корзин по bucket_seconds секунд"""
+    
+    def __init__(self, name: str, bucket_seconds: int, size: int, started_at: float):
+        self.name = name
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.started_at = started_at
+        self.buckets = [Bucket() for _ in range(size)]
+        # Биты пользователей всех корзин окна, кроме текущей: пересчитываются раз в bucket_seconds
+        self.history_users = 0
+        self.history_epoch = -1
+    
+    @property
+    def duration(self) -> int:
+        return self.bucket_seconds * self.size
+    
+    def current(self, now: float) -> Bucket:
+        """Корзина для текущего момента (устаревшая корзина кольца обнуляется)"""
+        epoch = int(now // self.bucket_seconds)
+        bucket = self.buckets[epoch % self.size]
+        if bucket.epoch != epoch:
+            bucket.reset(epoch)
+        return bucket
+    
+    def seen_user(self, bucket: Bucket, bit: int) -> bool:
+        """Был ли пользователь (бит скетча) в окне до текущего сообщения; bucket - текущая корзина"""
+        if self.history_epoch != bucket.epoch:
+            oldest = bucket.epoch - self.size + 1
+            self.history_users = 0
+            for other in self.buckets:
+                if oldest <= other.epoch < bucket.epoch:
+                    self.history_users |= other.users
+            self.history_epoch = bucket.epoch
+        return bool((self.history_users | bucket.users) & bit)
+    
+    def live_buckets(self, now: float) -> List[Bucket]:
+        """Корзины, попадающие в окно"""
+        oldest = int(now // self.bucket_seconds) - self.size + 1
+        return [bucket for bucket in self.buckets if bucket.epoch >= oldest]
+    
+    def summary(self, now: float) -> dict:
+        """Сводка по окну за фиксированное число операций"""
+        buckets = self.live_buckets(now)
+        messages = sum(b.messages for b in buckets)
+        errors = sum(b.errors for b in buckets)
+        kb_hits = sum(b.kb_hits for b in buckets)
+        kb_lookups = sum(b.kb_lookups for b in buckets)
+        new_users = sum(b.new_users for b in buckets)
+        contacts = sum(b.contacts for b in buckets)
+        users = 0
+        latency_counts = [0] * (len(LATENCY_BOUNDS) + 1)
+        for b in buckets:
+            users |= b.users
+            for i, count in enumerate(b.latency_counts):
+                latency_counts[i] += count
+        
+        # Для неполного окна (бот запущен недавно) скорость считаем по фактическому времени работы, но не меньше минуты
+        covered = min(self.duration, max(now - self.started_at, 60))
+        return {
+            'messages_per_minute': messages / (covered / 60),
+            'active_users': _estimate_users(users),
+            'llm_p50': _percentile(latency_counts, 0.50),
+            'llm_p95': _percentile(latency_counts, 0.95),
+            'kb_ratio': kb_hits / kb_lookups if kb_lookups else 0.0,
+            'error_rate': errors / messages if messages else 0.0,
+            'conversion': min(contacts / new_users, 1.0) if new_users else 0.0,
+            'messages': messages,
+            'new_users': new_users,
+            'contacts': contacts
+        }
+
+def _percentile(counts: List[int], q: float) -> Optional[float]:
+    """Перцентиль по гистограмме (верхняя граница корзины), None - нет данных"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        cumulative += count
+        if cumulative >= rank:
+            return LATENCY_BOUNDS[i] if i < len(LATENCY_BOUNDS) else LATENCY_BOUNDS[-1]
+    return LATENCY_BOUNDS[-1]
+
+class Analytics:
+    """
+    Регистратор событий бота сразу для всех окон. Окна у каждого арендатора свои
+    (создаются при первом событии): админ бренда видит только свой трафик
+    """
+    
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started_at = clock()
+        self.tenants: Dict[str, List[SlidingWindow]] = {}
+    
+    def _windows(self, tenant: str) -> List[SlidingWindow]:
+        windows = self.tenants.get(tenant)
+        if windows is None:
+            windows = self.tenants[tenant] = [
+                SlidingWindow('5 мин', 5, 60, self.started_at),
+                SlidingWindow('1 час', 60, 60, self.started_at),
+                SlidingWindow('24 часа', 900, 96, self.started_at),
+            ]
+        return windows
+    
+    def _buckets(self, tenant: str) -> List[Bucket]:
+        now = self.clock()
+        return [window.current(now) for window in self._windows(tenant)]
+    
+    def record_message(self, tenant: str, user_id: int):
+        """Входящее сообщение пользователя"""
+        bit = _user_bit(user_id)
+        now = self.clock()
+        for window in self._windows(tenant):
+            bucket = window.current(now)
+            # Впервые в этом окне (при совпадении бита с другим пользователем - оценка снизу, как у скетча)
+            if not window.seen_user(bucket, bit):
+                bucket.new_users += 1
+            bucket.messages += 1
+            bucket.users |= bit
+    
+    def record_error(self, tenant: str):
+        """Ошибка при обработке сообщения"""
+        for bucket in self._buckets(tenant):
+            bucket.errors += 1
+    
+    def record_knowledge(self, tenant: str, hit: bool):
+        """Поиск по базе знаний: hit - найден готовый короткий ответ"""
+        for bucket in self._buckets(tenant):
+            bucket.kb_lookups += 1
+            if hit:
+                bucket.kb_hits += 1
+    
+    def record_llm(self, tenant: str, duration: float):
+        """Длительность запроса к LLM"""
+        index = _latency_index(duration)
+        for bucket in self._buckets(tenant):
+            bucket.latency_counts[index] += 1
+    
+    def record_contact(self, tenant: str):
+        """Сохраненный контакт (конверсия)"""
+        for bucket in self._buckets(tenant):
+            bucket.contacts += 1
+    
+    def summaries(self, tenant: str) -> List[Tuple[str, Dict]]:
+        now = self.clock()
+        return [(window.name, window.summary(now)) for window in self._windows(tenant)]
+    
+    def render(self, tenant: str) -> str:
+        """Текстовый блок для /stats арендатора"""
+        lines = []
+        for name, summary in self.summaries(tenant):
+            p50 = f"{summary['llm_p50']:.1f}" if summary['llm_p50'] is not None else '-'
+            p95 = f"{summary['llm_p95']:.1f}" if summary['llm_p95'] is not None else '-'
+            users = summary['active_users']
+            users = f"{users}+" if users >= USERS_SKETCH_BITS else str(users)
+            lines.append(
+                f"⏱ {name}: {summary['messages_per_minute']:.1f} сообщ./мин, "
+                f"пользователей {users}, LLM p50/p95 {p50}/{p95} с, "
+                f"база знаний {summary['kb_ratio']:.0%}, ошибки {summary['error_rate']:.1%}, "
+                f"конверсия {summary['conversion']:.0%} ({summary['contacts']}/{summary['new_users']})"
+            )
+        return '\n'.join(lines)
+
+def _latency_index(duration: float) -> int:
+    """Номер корзины гистограммы задержек за O(1): границы идут геометрической прогрессией"""
+    if duration <= LATENCY_BOUNDS[0]:
+        return 0
+    index = math.ceil(math.log(duration / LATENCY_BOUNDS[0], 1.25) - 1e-9)
+    return min(index, len(LATENCY_BOUNDS))
+
+# Глобальный экземпляр аналитики
+analytics = Analytics()
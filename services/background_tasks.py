@@ -0,0 +1,108 @@
+"""
+Супервизор фоновых задач (побочные эффекты после ответа пользователю)
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import List, Optional, Set
+
+from settings.config import Config
+from services.tracing import hold_current_trace
+
+logger = logging.getLogger(__name__)
+
+class BackgroundTasks:
+    """
+    Запускает фоновые задачи с ограничением параллельности,
+    перехватывает и запоминает ошибки, ведет счетчики и умеет дождаться
+    завершения всех задач при остановке бота
+    """
+    
+    def __init__(self, max_concurrency: int = None, max_critical: int = None, max_errors: int = 20):
+        self.max_concurrency = max_concurrency or Config.BACKGROUND_MAX_CONCURRENCY
+        self.max_critical = max_critical or Config.BACKGROUND_CRITICAL_MAX_CONCURRENCY
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        # У критичных задач свой, больший лимит: обычные задачи не задерживают сохранение лидов
+        self.critical_semaphore: Optional[asyncio.Semaphore] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.critical: Set[asyncio.Task] = set()
+        self.errors = deque(maxlen=max_errors)  # последние ошибки: (имя задачи, текст ошибки)
+        self.stats = {'started': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+    
+    @property
+    def in_flight(self) -> int:
+        """Количество запущенных, но еще не завершенных задач"""
+        return len(self.tasks)
+    
+    def spawn(self, coro, name: str, critical: bool = False) -> asyncio.Task:
+        """
+        Запускает корутину в фоне под присмотром супервизора.
+        Критичные задачи (сохранение лидов) ограничены своим лимитом параллельности,
+        а при остановке бота drain ждет их дольше обычных (SHUTDOWN_CRITICAL_TIMEOUT)
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.critical_semaphore = asyncio.Semaphore(self.max_critical)
+        # Этапы фоновой задачи попадают в трассу апдейта, который ее запустил
+        release_trace = hold_current_trace()
+        task = asyncio.create_task(self._run(coro, name, release_trace, critical), name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        if critical:
+            self.critical.add(task)
+            task.add_done_callback(self.critical.discard)
+        self.stats['started'] += 1
+        return task
+    
+    async def _run(self, coro, name: str, release_trace=None, critical: bool = False):
+        """Выполняет задачу с учетом лимита параллельности и перехватом ошибок"""
+        try:
+            async with (self.critical_semaphore if critical else self.semaphore):
+                await coro
+            self.stats['completed'] += 1
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            raise
+        except Exception as e:
+            self.stats['failed'] += 1
+            self.errors.append((name, str(e)))
+            logger.error(f"Ошибка в фоновой задаче {name}: {e}")
+        finally:
+            # Если задачу отменили до старта, корутина так и не была запущена
+            coro.close()
+            if release_trace:
+                release_trace()
+    
+    async def drain(self, timeout: float = None) -> List[str]:
+        """
+        Дожидается завершения фоновых задач не дольше timeout секунд.
+        Незавершенные обычные задачи отменяются, критичным дается еще SHUTDOWN_CRITICAL_TIMEOUT
+        секунд, после чего отменяются и они; возвращает имена отмененных
+        """
+        timeout = timeout if timeout is not None else Config.SHUTDOWN_DRAIN_TIMEOUT
+        if not self.tasks:
+            return []
+        
+        done, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        critical = pending & self.critical
+        cancelled = pending - critical
+        for task in cancelled:
+            logger.warning(f"Фоновая задача {task.get_name()} не завершилась за {timeout:.1f} с и будет отменена")
+            task.cancel()
+        if cancelled:
+            await asyncio.gather(*cancelled, return_exceptions=True)
+        if critical:
+            extra = Config.SHUTDOWN_CRITICAL_TIMEOUT
+            logger.warning(f"Критичных фоновых задач не завершилось за {timeout:.1f} с: {len(critical)}, ждем еще {extra:.1f} с")
+            _, stuck = await asyncio.wait(critical, timeout=extra)
+            # Зависшая запись (диск, сеть) не должна держать остановку, пока оркестратор не убьет процесс
+            for task in stuck:
+                logger.error(f"Критичная фоновая задача {task.get_name()} не завершилась за {timeout + extra:.1f} с и будет отменена")
+                task.cancel()
+            if stuck:
+                await asyncio.gather(*stuck, return_exceptions=True)
+            cancelled |= stuck
+        return sorted(task.get_name() for task in cancelled)
+
+# Глобальный экземпляр супервизора
+background_tasks = BackgroundTasks()
@@ -0,0 +1,517 @@
+"""
+Рассылки админа всем, кто писал боту
+
+Реестр чатов (SQLite, общий для процессов-воркеров) пополняется каждым входящим
+сообщением в личном чате, включая /start (запись идет в отдельном потоке).
+Пользователь, заблокировавший бота, возвращается в рассылки, когда пишет снова;
+если блокировку отметил другой воркер - после /start. Рассылку выполняет пул воркеров
+с общим темпом BROADCAST_RATE сообщений в секунду; каждое сообщение берет еще
+и токен глобального лимита арендатора, поэтому вместе с ответами пользователям
+рассылка не превышает лимит Telegram. Чаты обходятся по возрастанию id,
+а граница, до которой все чаты обработаны, сохраняется каждые
+BROADCAST_CHECKPOINT_EVERY чатов и при остановке бота вместе с чатами,
+обработанными за ней (воркеры обгоняют чат, ждущий flood wait). После перезапуска
+рассылка продолжается с этой границы: при плавной остановке повторно сообщение
+получат только чаты, отправка в которые была прервана (не больше
+BROADCAST_WORKERS), после аварии - не больше BROADCAST_CHECKPOINT_EVERY
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+from aiogram.types import TelegramObject
+
+from settings.config import Config
+from settings.texts import BROADCAST_PROGRESS_TEXT, BROADCAST_STATES
+from services.metrics import BROADCAST_MESSAGES
+from services.send_queue import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Статусы рассылки
+DRAFT = 'draft'
+RUNNING = 'running'
+STOPPED = 'stopped'
+DONE = 'done'
+
+# Сколько чатов читать из реестра за один запрос
+CHATS_BATCH_SIZE = 500
+
+def format_duration(seconds: float) -> str:
+    """Длительность для отчета: 45 с, 3 мин 5 с, 2 ч 10 мин"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} с"
+    if seconds < 3600:
+        return f"{seconds // 60} мин {seconds % 60} с"
+    return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+
+class BroadcastJob:
+    """Рассылка и ее прогресс (строка таблицы broadcasts)"""
+    
+    FIELDS = ('id', 'tenant', 'text', 'status', 'cursor', 'total', 'sent', 'blocked', 'failed',
+              'elapsed', 'created_at', 'finished_at', 'progress_chat_id', 'ahead')
+    
+    def __init__(self, id: int, tenant: str, text: str, status: str = DRAFT, cursor: int = 0, total: int = 0,
+                 sent: int = 0, blocked: int = 0, failed: int = 0, elapsed: float = 0.0,
+                 created_at: float = 0.0, finished_at: Optional[float] = None, progress_chat_id: Optional[int] = None,
+                 ahead: Dict[int, str] = None):
+        self.id = id
+        self.tenant = tenant
+        self.text = text
+        self.status = status
+        self.cursor = cursor  # все чаты с id не больше cursor уже обработаны
+        self.total = total
+        self.sent = sent
+        self.blocked = blocked
+        self.failed = failed
+        self.elapsed = elapsed  # секунды работы рассылки (без времени, пока бот был остановлен)
+        self.created_at = created_at
+        self.finished_at = finished_at
+        self.progress_chat_id = progress_chat_id  # куда отправлять ход рассылки
+        self.ahead = ahead or {}  # чаты за границей, уже обработанные: id -> результат (sent, blocked, failed)
+    
+    @property
+    def processed(self) -> int:
+        return self.sent + self.blocked + self.failed
+    
+    def render(self) -> str:
+        """Текст о ходе рассылки: счетчики, скорость и оценка оставшегося времени"""
+        total = max(self.total, self.processed)
+        rate = self.processed / self.elapsed if self.elapsed > 0 else 0.0
+        if self.status in (DONE, DRAFT):
+            eta = '0 с' if self.status == DONE else '-'
+        else:
+            eta = format_duration((total - self.processed) / rate) if rate else '-'
+        return BROADCAST_PROGRESS_TEXT.format(
+            id=self.id,
+            state=BROADCAST_STATES.get(self.status, self.status),
+            processed=self.processed,
+            total=total,
+            percent=self.processed / total if total else 1.0,
+            sent=self.sent,
+            blocked=self.blocked,
+            failed=self.failed,
+            rate=rate,
+            elapsed=format_duration(self.elapsed),
+            eta=eta
+        )
+
+class BroadcastStore:
+    """
+    Реестр чатов и прогресс рассылок в SQLite (режим WAL): как и счетчики
+    shared_store, корректно работает с несколькими процессами-воркерами
+    """
+    
+    def __init__(self, path: str = "data/broadcast.db"):
+        self.path = path
+        self._local = threading.local()  # у каждого потока свое соединение
+        # Чаты, уже записанные этим процессом: повторные сообщения не пишут в базу
+        self.known: Set[Tuple[str, int]] = set()
+        # Отметки о чатах пишет по очереди отдельный поток: цикл событий не ждет блокировок SQLite
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='broadcast-db')
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, создавая его при необходимости"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chats ("
+                "tenant TEXT NOT NULL, chat_id INTEGER NOT NULL, first_seen REAL NOT NULL, "
+                "blocked INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (tenant, chat_id))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS broadcasts ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, tenant TEXT NOT NULL, text TEXT NOT NULL, "
+                "status TEXT NOT NULL, cursor INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0, "
+                "sent INTEGER NOT NULL DEFAULT 0, blocked INTEGER NOT NULL DEFAULT 0, "
+                "failed INTEGER NOT NULL DEFAULT 0, elapsed REAL NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, finished_at REAL, progress_chat_id INTEGER, ahead TEXT NOT NULL DEFAULT '{}')"
+            )
+            self._local.connection = connection
+        return connection
+    
+    def add_chat(self, tenant: str, chat_id: int, restart: bool = False):
+        """
+        Записывает чат в реестр; restart - пользователь прислал /start. Пользователь,
+        заблокировавший бота, опять получает рассылки, когда пишет снова. Отметку
+        блокировки мог поставить другой воркер, поэтому /start снимает ее в базе
+        всегда, без оглядки на known
+        """
+        key = (tenant, chat_id)
+        if key in self.known and not restart:
+            return
+        self.known.add(key)
+        self._executor.submit(self._write_chat, tenant, chat_id)
+    
+    def _write_chat(self, tenant: str, chat_id: int):
+        try:
+            self._connection().execute(
+                "INSERT INTO chats (tenant, chat_id, first_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(tenant, chat_id) DO UPDATE SET blocked = 0",
+                (tenant, chat_id, time.time())
+            )
+        except sqlite3.Error as e:
+            # Следующее сообщение из чата попробует записать его снова
+            self.known.discard((tenant, chat_id))
+            logger.error(f"Ошибка при записи чата {chat_id} в реестр: {e}")
+    
+    def mark_blocked(self, tenant: str, chat_id: int):
+        """Исключает чат из рассылок: пользователь заблокировал бота или удален"""
+        self.known.discard((tenant, chat_id))
+        self._executor.submit(self._write_blocked, tenant, chat_id)
+    
+    def _write_blocked(self, tenant: str, chat_id: int):
+        try:
+            self._connection().execute(
+                "UPDATE chats SET blocked = 1 WHERE tenant = ? AND chat_id = ?", (tenant, chat_id)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при отметке чата {chat_id} как недоступного: {e}")
+    
+    async def flush(self):
+        """Ждет записи отметок о чатах, поставленных в очередь (при остановке бота)"""
+        await asyncio.wrap_future(self._executor.submit(lambda: None))
+    
+    def count_chats(self, tenant: str, after: int = 0) -> int:
+        """Число доступных чатов арендатора с id больше after"""
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM chats WHERE tenant = ? AND blocked = 0 AND chat_id > ?", (tenant, after)
+        ).fetchone()
+        return row[0]
+    
+    def chats_after(self, tenant: str, after: int, limit: int) -> List[int]:
+        """Следующие limit доступных чатов по возрастанию id"""
+        rows = self._connection().execute(
+            "SELECT chat_id FROM chats WHERE tenant = ? AND blocked = 0 AND chat_id > ? ORDER BY chat_id LIMIT ?",
+            (tenant, after, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+    
+    def _select_jobs(self, where: str, params: tuple) -> List[BroadcastJob]:
+        rows = self._connection().execute(
+            f"SELECT {', '.join(BroadcastJob.FIELDS)} FROM broadcasts WHERE {where}", params
+        ).fetchall()
+        jobs = []
+        for row in rows:
+            values = dict(zip(BroadcastJob.FIELDS, row))
+            values['ahead'] = {int(chat_id): result for chat_id, result in json.loads(values['ahead']).items()}
+            jobs.append(BroadcastJob(**values))
+        return jobs
+    
+    def create_job(self, tenant: str, text: str) -> BroadcastJob:
+        """Создает черновик рассылки; прежний черновик арендатора удаляется"""
+        connection = self._connection()
+        connection.execute("DELETE FROM broadcasts WHERE tenant = ? AND status = ?", (tenant, DRAFT))
+        cursor = connection.execute(
+            "INSERT INTO broadcasts (tenant, text, status, created_at) VALUES (?, ?, ?, ?)",
+            (tenant, text, DRAFT, time.time())
+        )
+        return BroadcastJob(cursor.lastrowid, tenant, text, created_at=time.time())
+    
+    def latest_job(self, tenant: str) -> Optional[BroadcastJob]:
+        """Последняя рассылка арендатора"""
+        jobs = self._select_jobs("tenant = ? ORDER BY id DESC LIMIT 1", (tenant,))
+        return jobs[0] if jobs else None
+    
+    def running_jobs(self, tenant: str = None) -> List[BroadcastJob]:
+        """Рассылки в статусе running (у одного арендатора или у всех)"""
+        if tenant is None:
+            return self._select_jobs("status = ? ORDER BY id", (RUNNING,))
+        return self._select_jobs("status = ? AND tenant = ? ORDER BY id", (RUNNING, tenant))
+    
+    def job_status(self, job_id: int) -> Optional[str]:
+        row = self._connection().execute("SELECT status FROM broadcasts WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+    
+    def set_status(self, job: BroadcastJob, status: str):
+        job.status = status
+        if status == DONE:
+            job.finished_at = time.time()
+        self._connection().execute(
+            "UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ?", (status, job.finished_at, job.id)
+        )
+    
+    def save_progress(self, job: BroadcastJob):
+        """Контрольная точка: граница обработанных чатов и счетчики (статус не меняется)"""
+        self._connection().execute(
+            "UPDATE broadcasts SET cursor = ?, total = ?, sent = ?, blocked = ?, failed = ?, elapsed = ?, "
+            "progress_chat_id = ?, ahead = ? WHERE id = ?",
+            (job.cursor, job.total, job.sent, job.blocked, job.failed, job.elapsed, job.progress_chat_id,
+             json.dumps(job.ahead), job.id)
+        )
+    
+    def delete_job(self, job_id: int):
+        self._connection().execute("DELETE FROM broadcasts WHERE id = ?", (job_id,))
+
+class ChatRegistryMiddleware(BaseMiddleware):
+    """Записывает личные чаты, из которых пишут боту, в реестр для рассылок"""
+    
+    def __init__(self, store: BroadcastStore):
+        self.store = store
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if event.chat.type == 'private':
+            restart = (event.text or '').startswith('/start')
+            self.store.add_chat(data['tenant'].name, event.chat.id, restart=restart)
+        return await handler(event, data)
+
+class BroadcastRun:
+    """Выполнение рассылки в этом процессе (после перезапуска создается заново с сохраненной границы)"""
+    
+    def __init__(self, store: BroadcastStore, tenant, job: BroadcastJob):
+        self.store = store
+        self.tenant = tenant
+        self.job = job
+        # Общий темп всех воркеров рассылки; TelegramRetryAfter ставит на паузу их всех
+        self.bucket = TokenBucket(Config.BROADCAST_RATE, Config.BROADCAST_RATE)
+        self.dispatched = deque()  # чаты, отданные воркерам, по возрастанию id
+        self.since_checkpoint = 0
+        self.stopped = False  # /broadcast stop: новые чаты воркерам больше не отдаются
+        self.exhausted = False  # все чаты реестра отданы воркерам
+        self.started = time.monotonic()
+        self.elapsed_before = job.elapsed
+        self.retry_after = 0
+        self.progress_message_id: Optional[int] = None
+    
+    async def execute(self):
+        """Рассылает по всем чатам после границы; при отмене сохраняет прогресс"""
+        await self._send_progress()
+        queue = asyncio.Queue(Config.BROADCAST_WORKERS * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue), name=f"broadcast-{self.job.id}-worker-{i}")
+            for i in range(Config.BROADCAST_WORKERS)
+        ]
+        reporter = asyncio.create_task(self._report_progress(), name=f"broadcast-{self.job.id}-progress")
+        try:
+            await self._produce(queue)
+            await queue.join()
+        finally:
+            for task in workers + [reporter]:
+                task.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            self.checkpoint()
+        
+        # Остановленная рассылка, успевшая обработать все чаты, тоже завершена
+        self.store.set_status(self.job, DONE if self.exhausted and not self.dispatched else STOPPED)
+        logger.info(
+            f"Рассылка #{self.job.id} {BROADCAST_STATES[self.job.status]}: доставлено {self.job.sent}, "
+            f"бот заблокирован {self.job.blocked}, ошибок {self.job.failed}, flood wait {self.retry_after}, "
+            f"за {format_duration(self.job.elapsed)}"
+        )
+        await self._send_progress(final=True)
+    
+    async def _produce(self, queue: asyncio.Queue):
+        """Отдает воркерам чаты после границы порциями из реестра"""
+        after = self.job.cursor
+        while not self.stopped:
+            batch = self.store.chats_after(self.tenant.name, after, CHATS_BATCH_SIZE)
+            if not batch:
+                self.exhausted = True
+                return
+            for chat_id in batch:
+                if self.stopped:
+                    return
+                self.dispatched.append(chat_id)
+                if chat_id in self.job.ahead:
+                    # Обработан до перезапуска и уже учтен в счетчиках
+                    self._complete(chat_id, self.job.ahead[chat_id], counted=True)
+                else:
+                    await queue.put(chat_id)
+            after = batch[-1]
+    
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            chat_id = await queue.get()
+            # Чаты, взятые после /broadcast stop, и отправки, прерванные остановкой бота,
+            # остаются за границей и будут обработаны, когда рассылку продолжат
+            if not self.stopped:
+                result = await self._deliver(chat_id)
+                BROADCAST_MESSAGES.inc(result)
+                self._complete(chat_id, result)
+            queue.task_done()
+    
+    async def _deliver(self, chat_id: int) -> str:
+        """Отправляет сообщение в чат; возвращает sent, blocked или failed"""
+        attempt = 0
+        while True:
+            await self.tenant.send_queue.acquire(self.bucket)
+            try:
+                await self.tenant.bot.send_message(chat_id, self.job.text)
+                return 'sent'
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.retry_after += 1
+                logger.warning(f"Рассылка #{self.job.id}: flood control, пауза {e.retry_after} с (попытка {attempt})")
+                if attempt > Config.SEND_MAX_RETRIES:
+                    return 'failed'
+                self.tenant.send_queue.flood_wait(self.bucket, e.retry_after)
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота или удалил аккаунт - больше ему не пишем
+                self.store.mark_blocked(self.tenant.name, chat_id)
+                return 'blocked'
+            except TelegramBadRequest as e:
+                if 'chat not found' in str(e).lower():
+                    self.store.mark_blocked(self.tenant.name, chat_id)
+                    return 'blocked'
+                logger.warning(f"Рассылка #{self.job.id}: не удалось отправить в чат {chat_id}: {e}")
+                return 'failed'
+            except TelegramNetworkError as e:
+                attempt += 1
+                if attempt > Config.SEND_MAX_RETRIES:
+                    logger.warning(f"Рассылка #{self.job.id}: сетевая ошибка при отправке в чат {chat_id}: {e}")
+                    return 'failed'
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except Exception as e:
+                logger.error(f"Рассылка #{self.job.id}: ошибка при отправке в чат {chat_id}: {e}")
+                return 'failed'
+    
+    def _complete(self, chat_id: int, result: str, counted: bool = False):
+        """Учитывает обработанный чат и сдвигает границу по непрерывному префиксу обработанных"""
+        if not counted:
+            setattr(self.job, result, getattr(self.job, result) + 1)
+        self.job.ahead[chat_id] = result
+        while self.dispatched and self.dispatched[0] in self.job.ahead:
+            self.job.cursor = self.dispatched.popleft()
+            del self.job.ahead[self.job.cursor]
+        self.since_checkpoint += 1
+        if self.since_checkpoint >= Config.BROADCAST_CHECKPOINT_EVERY:
+            self.checkpoint()
+    
+    def refresh_elapsed(self):
+        self.job.elapsed = self.elapsed_before + time.monotonic() - self.started
+    
+    def checkpoint(self):
+        """Сохраняет прогресс; заодно замечает остановку рассылки из другого процесса"""
+        self.since_checkpoint = 0
+        self.refresh_elapsed()
+        # Заблокировавшие бота чаты за границей из реестра больше не читаются - забываем их, когда граница их прошла
+        self.job.ahead = {chat_id: result for chat_id, result in self.job.ahead.items() if chat_id > self.job.cursor}
+        try:
+            self.store.save_progress(self.job)
+            if self.store.job_status(self.job.id) == STOPPED:
+                self.stopped = True
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при сохранении прогресса рассылки #{self.job.id}: {e}")
+    
+    async def _report_progress(self):
+        """Раз в BROADCAST_PROGRESS_INTERVAL секунд сохраняет прогресс и обновляет сообщение о ходе рассылки"""
+        while True:
+            await asyncio.sleep(Config.BROADCAST_PROGRESS_INTERVAL)
+            self.checkpoint()
+            await self._send_progress()
+    
+    async def _send_progress(self, final: bool = False):
+        """Первое и итоговое сообщения отправляются заново (с уведомлением), промежуточные - правкой"""
+        chat_id = self.job.progress_chat_id or self.tenant.admin_chat_id
+        if not chat_id:
+            return
+        text = self.job.render()
+        try:
+            if final:
+                await self.tenant.send_queue.send_message(chat_id, text)
+            elif self.progress_message_id is None:
+                message = await self.tenant.bot.send_message(chat_id, text)
+                self.progress_message_id = message.message_id
+            else:
+                await self.tenant.bot.edit_message_text(text, chat_id=chat_id, message_id=self.progress_message_id)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить ход рассылки #{self.job.id}: {e}")
+
+class Broadcaster:
+    """Запускает, останавливает и продолжает после перезапуска рассылки этого процесса"""
+    
+    def __init__(self, store: BroadcastStore):
+        self.store = store
+        self.runs: Dict[int, BroadcastRun] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+    
+    def is_active(self, job_id: int) -> bool:
+        """Рассылка выполняется этим процессом (в том числе дописывает начатое после остановки)"""
+        return job_id in self.tasks
+    
+    def start(self, tenant, job: BroadcastJob):
+        """Запускает рассылку в фоне (или продолжает ее с сохраненной границы)"""
+        # Получатели - уже обработанные плюс доступные чаты после границы (реестр мог пополниться),
+        # кроме обработанных за границей: они уже учтены
+        counted_ahead = sum(1 for result in job.ahead.values() if result != 'blocked')
+        job.total = job.processed + self.store.count_chats(tenant.name, job.cursor) - counted_ahead
+        self.store.set_status(job, RUNNING)
+        self.store.save_progress(job)
+        run = BroadcastRun(self.store, tenant, job)
+        self.runs[job.id] = run
+        self.tasks[job.id] = asyncio.create_task(self._execute(run), name=f"broadcast-{job.id}")
+        logger.info(f"Рассылка #{job.id} ({tenant.name}) запущена: получателей {job.total}, обработано {job.processed}")
+    
+    async def _execute(self, run: BroadcastRun):
+        try:
+            await run.execute()
+        except asyncio.CancelledError:
+            logger.info(
+                f"Рассылка #{run.job.id} прервана остановкой бота на {run.job.processed} из {run.job.total}, "
+                f"продолжится после перезапуска"
+            )
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка в рассылке #{run.job.id}: {e}")
+        finally:
+            self.runs.pop(run.job.id, None)
+            self.tasks.pop(run.job.id, None)
+    
+    def render(self, job: BroadcastJob) -> str:
+        """Ход рассылки; для рассылки этого процесса - текущие, а не сохраненные счетчики"""
+        run = self.runs.get(job.id)
+        if run is None:
+            return job.render()
+        run.refresh_elapsed()
+        return run.job.render()
+    
+    def stop(self, job: BroadcastJob):
+        """
+        Останавливает рассылку: воркеры дописывают начатые отправки. Рассылку другого
+        процесса-воркера останавливает статус в базе (замечается на контрольной точке)
+        """
+        self.store.set_status(job, STOPPED)
+        run = self.runs.get(job.id)
+        if run is not None:
+            run.stopped = True
+            run.job.status = STOPPED
+    
+    def resume(self, tenants: list):
+        """Продолжает рассылки, прерванные остановкой или падением бота"""
+        by_name = {tenant.name: tenant for tenant in tenants}
+        for job in self.store.running_jobs():
+            tenant = by_name.get(job.tenant)
+            if tenant is None or job.id in self.tasks:
+                continue
+            logger.info(f"Продолжаем рассылку #{job.id} после перезапуска")
+            self.start(tenant, job)
+    
+    async def close(self):
+        """Прерывает рассылки при остановке бота; прогресс сохраняется, статус остается running"""
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# Глобальные реестр чатов и исполнитель рассылок
+broadcast_store = BroadcastStore()
+broadcaster = Broadcaster(broadcast_store)
@@ -0,0 +1,226 @@
+"""
+Дозаполнение контактов из сохраненных переписок
+
+Основной промпт иногда пропускает контакты, и такие лиды теряются. Здесь
+переписки (см. services/transcripts.py) читаются потоково, локальные регулярные
+выражения отбирают сообщения-кандидаты (похожие на телефон цифры или "@"),
+и только они уходят в отдельный запрос извлечения контактов (extract_contacts).
+Запросы идут параллельно, но не больше concurrency одновременно и не чаще rate
+в секунду. Найденные контакты добавляются в контакты арендатора пачками и без
+дубликатов (по телефону и email). После каждой пачки позиция в каждом файле
+сохраняется, поэтому прерванный запуск продолжается с того же места, а
+неудавшиеся запросы повторяются при следующем запуске
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.ai_service import ai_service
+from services.contact_manager import ContactManager
+from services.send_queue import TokenBucket
+from services.transcripts import TranscriptMessage, file_key, fingerprint, read_messages
+from utils.ai_contact_parser import ai_contact_parser
+from utils.contact_parser import CONTACT_HINT_PATTERN, EMAIL_PATTERN, contact_parser
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних сообщений пользователя отправлять вместе с кандидатом (имя часто пишут отдельно)
+CONTEXT_MESSAGES = 3
+# Кандидатов между сохранениями прогресса
+BATCH_SIZE = 200
+# Попыток запроса к LLM на одного кандидата в рамках запуска
+MAX_ATTEMPTS = 3
+
+class BackfillState:
+    """
+    Прогресс по файлам (ключ - устройство и inode): сколько сообщений обработано и какие
+    не удались. Вместе с прогрессом хранится хэш начала файла: если inode достался
+    другому файлу (старый лог удален), прогресс не подхватывается
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.sources: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.sources = json.load(f).get('sources', {})
+    
+    def resolve(self, path: str) -> str:
+        """Ключ файла; прогресс, сохраненный для другого файла с тем же inode, сбрасывается"""
+        key = file_key(path)
+        source = self.sources.get(key)
+        if source is not None and fingerprint(path, source['header_size'])[1] != source['header']:
+            del self.sources[key]
+        return key
+    
+    def position(self, key: str) -> int:
+        return self.sources.get(key, {}).get('position', 0)
+    
+    def failed(self, key: str) -> Set[int]:
+        return set(self.sources.get(key, {}).get('failed', []))
+    
+    def update(self, key: str, path: str, position: int, failed: Set[int]):
+        header_size, header = fingerprint(path)
+        self.sources[key] = {
+            'path': path, 'position': position, 'failed': sorted(failed),
+            'header_size': header_size, 'header': header
+        }
+    
+    def save(self):
+        """Сохраняет прогресс через временный файл (прерывание не оставит файл записанным наполовину)"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_file = f"{self.path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'sources': self.sources}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.path)
+
+class ContactBackfill:
+    """Поиск пропущенных контактов в переписках и их слияние с контактами арендатора"""
+    
+    def __init__(self, contact_manager: ContactManager, tenant: str = 'default', bot_id: Optional[int] = None,
+                 concurrency: int = 8, rate: float = 5.0, use_llm: bool = True, dry_run: bool = False):
+        self.contact_manager = contact_manager
+        self.tenant = tenant
+        self.bot_id = bot_id
+        self.use_llm = use_llm
+        self.dry_run = dry_run
+        self.state = BackfillState(os.path.join(contact_manager.data_dir, 'backfill_state.json'))
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.bucket = TokenBucket(rate, max(1.0, rate))
+        self.found: List[dict] = []  # контакты пробного запуска (dry_run)
+        self.stats = {
+            'files': 0, 'messages': 0, 'candidates': 0, 'llm_requests': 0,
+            'extracted': 0, 'added': 0, 'duplicates': 0, 'failed': 0
+        }
+    
+    async def run(self, files: List[str]) -> dict:
+        """Обрабатывает файлы по порядку и возвращает статистику"""
+        started = time.perf_counter()
+        for path in files:
+            try:
+                await self._process_file(path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Ошибка при чтении {path}: {e}")
+        self.stats['elapsed'] = round(time.perf_counter() - started, 1)
+        return self.stats
+    
+    async def _process_file(self, path: str):
+        key = self.state.resolve(path)
+        position = self.state.position(key)
+        failed = self.state.failed(key)
+        contexts: Dict[int, deque] = {}
+        batch: List[Tuple[int, TranscriptMessage, str]] = []
+        consumed = 0
+        self.stats['files'] += 1
+        
+        for index, message in enumerate(read_messages(path, self.bot_id)):
+            consumed = index + 1
+            if message.tenant is not None and message.tenant != self.tenant:
+                continue
+            context = contexts.setdefault(message.user_id, deque(maxlen=CONTEXT_MESSAGES))
+            context.append(message.text)
+            # Уже обработанные в прошлых запусках сообщения нужны только для контекста
+            if index < position and index not in failed:
+                continue
+            self.stats['messages'] += 1
+            if not CONTACT_HINT_PATTERN.search(message.text):
+                continue
+            self.stats['candidates'] += 1
+            batch.append((index, message, '\n'.join(context)))
+            if len(batch) >= BATCH_SIZE:
+                await self._flush(batch, key, path, consumed, failed)
+                batch = []
+        
+        await self._flush(batch, key, path, max(position, consumed), failed)
+        logger.info(f"Файл {path} обработан: {self.stats}")
+    
+    async def _flush(self, batch: List[Tuple[int, TranscriptMessage, str]], key: str, path: str,
+                     position: int, failed: Set[int]):
+        """Извлекает контакты пачки кандидатов, добавляет новые и сохраняет прогресс"""
+        results = await asyncio.gather(*(self._extract(message, context) for _, message, context in batch))
+        contacts = []
+        for (index, message, _), (ok, contact_data) in zip(batch, results):
+            if not ok:
+                failed.add(index)
+                self.stats['failed'] += 1
+                continue
+            failed.discard(index)
+            if contact_data:
+                contacts.append(contact_data)
+        self.stats['extracted'] += len(contacts)
+        
+        if self.dry_run:
+            self.found.extend(contacts)
+            return
+        added = self.contact_manager.merge_contacts(contacts) if contacts else 0
+        self.stats['added'] += added
+        self.stats['duplicates'] += len(contacts) - added
+        self.state.update(key, path, position, failed)
+        self.state.save()
+    
+    async def _extract(self, message: TranscriptMessage, context: str) -> Tuple[bool, Optional[dict]]:
+        """(удался ли запрос, контакт в формате ContactManager или None)"""
+        if not self.use_llm:
+            info = contact_parser.extract_contacts_fast(message.text)
+            return True, info and self._contact_data(message, info['name'], info['phone'], info['email'])
+        
+        async with self.semaphore:
+            for attempt in range(MAX_ATTEMPTS):
+                await self._acquire()
+                self.stats['llm_requests'] += 1
+                response = await ai_service.extract_contacts(context)
+                if response is not None:
+                    break
+                if attempt < MAX_ATTEMPTS - 1:
+                    await asyncio.sleep(2 ** attempt)
+            else:
+                return False, None
+        
+        info = ai_contact_parser.extract_contacts_from_ai_response(response)
+        if not info:
+            return True, None
+        return True, self._contact_data(message, info['name'], info['phone'], info['email'], context)
+    
+    async def _acquire(self):
+        """Ждет разрешения на запрос к LLM (не чаще rate в секунду)"""
+        while True:
+            wait = self.bucket.wait_time(time.monotonic())
+            if wait <= 0:
+                self.bucket.consume()
+                return
+            await asyncio.sleep(wait)
+    
+    def _contact_data(self, message: TranscriptMessage, name: str, phone: str, email: str,
+                      context: str = None) -> Optional[dict]:
+        """
+        Контакт для ContactManager. Телефон и email от LLM принимаются, только если
+        они действительно есть в переписке: модель не должна их выдумывать
+        """
+        digits = re.sub(r'\D', '', phone or '')
+        email = (email or '').strip().lower()
+        if context is not None:
+            context_digits = [re.sub(r'\D', '', line) for line in context.split('\n')]
+            if len(digits) < 10 or not any(digits[-10:] in line for line in context_digits):
+                phone, digits = '', ''
+            if not EMAIL_PATTERN.fullmatch(email) or email not in context.lower():
+                email = ''
+        if not digits and not email:
+            return None
+        # На месте имени модель пишет "не указано", если его нет
+        if not name or name.lower().startswith('не '):
+            name = message.first_name
+        return {
+            'first_name': name,
+            'last_name': message.last_name,
+            'phone_number': phone if digits else '',
+            'email': email,
+            'username': message.username or 'не указан',
+            'user_id': message.user_id,
+            'additional_info': message.text,
+            'source': 'backfill'
+        }
@@ -1,20 +1,48 @@
 import json
 import csv
 import os
+import re
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from typing import List, Set
 from settings.config import Config
 
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессная блокировка недоступна
+    fcntl = None
+
+def contact_keys(contact_data: dict) -> Set[str]:
+    """Ключи для поиска дубликатов: последние 10 цифр телефона и email в нижнем регистре"""
+    keys = set()
+    digits = re.sub(r'\D', '', contact_data.get('phone_number') or '')
+    if len(digits) >= 10:
+        keys.add(f"phone:{digits[-10:]}")
+    email = (contact_data.get('email') or '').strip().lower()
+    if email:
+        keys.add(f"email:{email}")
+    return keys
+
 class ContactManager:
     """Менеджер для работы с контактами клиентов"""
     
-    def __init__(self):
-        self.contacts_file = "data/contacts.json"
-        self.csv_file = "data/contacts.csv"
-        self._ensure_data_directory()
+    def __init__(self, data_dir: str = "data"):
+        self.data_dir = data_dir
+        self.contacts_file = os.path.join(data_dir, "contacts.json")
+        self.csv_file = os.path.join(data_dir, "contacts.csv")
+        self.lock_file = os.path.join(data_dir, "contacts.lock")
+        # Контакты могут сохраняться из фоновых потоков и из нескольких процессов-воркеров:
+        # запись файлов выполняется по очереди
+        self._lock = threading.Lock()
+        # Папка создается при первой записи, а не при создании менеджера (импорт и старт без файловых операций)
+        self._data_dir_ready = False
     
     def _ensure_data_directory(self):
         """Создает папку data если ее нет"""
-        os.makedirs("data", exist_ok=True)
+        if not self._data_dir_ready:
+            os.makedirs(self.data_dir, exist_ok=True)
+            self._data_dir_ready = True
     
     def save_contact(self, contact_data: dict):
         """Сохраняет контакт в JSON и CSV"""
@@ -23,17 +51,69 @@ class ContactManager:
             contact_data['timestamp'] = datetime.now().isoformat()
             contact_data['source'] = contact_data.get('source', 'manual')  # manual или contact_button
             
-            # Сохраняем в JSON
-            self._save_to_json(contact_data)
-            
-            # Сохраняем в CSV
-            self._save_to_csv(contact_data)
+            self._ensure_data_directory()
+            with self._lock, self._process_lock():
+                # Сохраняем в JSON
+                self._save_to_json([contact_data])
+                
+                # Сохраняем в CSV
+                self._save_to_csv([contact_data])
             
             return True
         except Exception as e:
             print(f"Ошибка при сохранении контакта: {e}")
             return False
     
+    def merge_contacts(self, contacts: List[dict]) -> int:
+        """
+        Добавляет пачку контактов одной записью файлов, пропуская те, чей телефон
+        или email уже есть среди сохраненных. Возвращает число добавленных
+        """
+        self._ensure_data_directory()
+        with self._lock, self._process_lock():
+            known = set()
+            for saved in self._load_contacts():
+                known |= contact_keys(saved)
+            
+            added = []
+            timestamp = datetime.now().isoformat()
+            for contact_data in contacts:
+                keys = contact_keys(contact_data)
+                if not keys or keys & known:
+                    continue
+                known |= keys
+                contact_data['timestamp'] = contact_data.get('timestamp') or timestamp
+                contact_data['source'] = contact_data.get('source', 'manual')
+                added.append(contact_data)
+            
+            if added:
+                self._save_to_json(added)
+                self._save_to_csv(added)
+        return len(added)
+    
+    def _load_contacts(self) -> list:
+        """Читает сохраненные контакты из JSON"""
+        if not os.path.exists(self.contacts_file):
+            return []
+        with open(self.contacts_file, 'r', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return []
+    
+    @contextmanager
+    def _process_lock(self):
+        """Межпроцессная блокировка файлов контактов (flock)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
     def save_manual_contact(self, user_data: dict, contact_info: dict):
         """Сохраняет контакт, введенный вручную"""
         contact_data = {
@@ -49,27 +129,22 @@ class ContactManager:
         
         return self.save_contact(contact_data)
     
-    def _save_to_json(self, contact_data: dict):
-        """Сохраняет контакт в JSON файл"""
-        contacts = []
-        
+    def _save_to_json(self, new_contacts: List[dict]):
+        """Сохраняет контакты в JSON файл"""
         # Читаем существующие контакты
-        if os.path.exists(self.contacts_file):
-            with open(self.contacts_file, 'r', encoding='utf-8') as f:
-                try:
-                    contacts = json.load(f)
-                except json.JSONDecodeError:
-                    contacts = []
+        contacts = self._load_contacts()
         
-        # Добавляем новый контакт
-        contacts.append(contact_data)
+        # Добавляем новые контакты
+        contacts.extend(new_contacts)
         
-        # Сохраняем обратно
-        with open(self.contacts_file, 'w', encoding='utf-8') as f:
+        # Сохраняем обратно через временный файл: читатели никогда не видят файл записанным наполовину
+        tmp_file = f"{self.contacts_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
             json.dump(contacts, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.contacts_file)
     
-    def _save_to_csv(self, contact_data: dict):
-        """Сохраняет контакт в CSV файл"""
+    def _save_to_csv(self, new_contacts: List[dict]):
+        """Сохраняет контакты в CSV файл"""
         file_exists = os.path.exists(self.csv_file)
         
         with open(self.csv_file, 'a', newline='', encoding='utf-8') as f:
@@ -82,17 +157,18 @@ class ContactManager:
                     'Email', 'Username', 'User ID', 'Source', 'Additional Info'
                 ])
             
-            writer.writerow([
-                contact_data['timestamp'],
-                contact_data['first_name'],
-                contact_data['last_name'],
-                contact_data['phone_number'],
-                contact_data['email'],
-                contact_data['username'],
-                contact_data['user_id'],
-                contact_data.get('source', 'unknown'),
-                contact_data.get('additional_info', '')
-            ])
+            for contact_data in new_contacts:
+                writer.writerow([
+                    contact_data['timestamp'],
+                    contact_data['first_name'],
+                    contact_data['last_name'],
+                    contact_data['phone_number'],
+                    contact_data['email'],
+                    contact_data['username'],
+                    contact_data['user_id'],
+                    contact_data.get('source', 'unknown'),
+                    contact_data.get('additional_info', '')
+                ])
     
     def get_contacts_count(self) -> int:
         """Возвращает количество сохраненных контактов"""
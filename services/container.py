@@ -0,0 +1,63 @@
+"""
+Контейнер приложения: ленивое создание сервисов
+
+Модули не создают тяжелые объекты при импорте (клиент OpenRouter, боты,
+HTTP-сессия, база знаний). Вместо этого фабрика регистрируется в контейнере,
+а объект создается при первом обращении (container.tenant_registry) и дальше
+переиспользуется. Время создания каждого сервиса запоминается для отчета
+о старте (run.py --profile-startup)
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class Container:
+    """Реестр фабрик и созданных по требованию сервисов"""
+    
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        # Сервис может создаваться из потока (прогрев клиента OpenRouter), фабрики вызывают друг друга
+        self._lock = threading.RLock()
+        self.init_times: Dict[str, float] = {}  # имя -> секунды (вместе с вложенными сервисами)
+    
+    def register(self, name: str, factory: Callable[[], Any]):
+        """Регистрирует фабрику сервиса; объект будет создан при первом обращении"""
+        self._factories[name] = factory
+    
+    def get(self, name: str) -> Any:
+        """Возвращает сервис, создавая его при первом обращении"""
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            if name not in self._factories:
+                raise KeyError(f"Сервис {name} не зарегистрирован в контейнере")
+            started = time.perf_counter()
+            instance = self._factories[name]()
+            self.init_times[name] = time.perf_counter() - started
+            self._instances[name] = instance
+            logger.debug(f"Сервис {name} создан за {self.init_times[name] * 1000:.1f} мс")
+            return instance
+    
+    def is_initialized(self, name: str) -> bool:
+        """Создан ли сервис (например, чтобы не создавать его только ради закрытия)"""
+        return name in self._instances
+    
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self.get(name)
+        except KeyError as e:
+            raise AttributeError(str(e)) from None
+
+# Глобальный контейнер приложения
+container = Container()
@@ -0,0 +1,140 @@
+"""
+Общие настройки пулов HTTP-соединений, прогрев и статистика переиспользования
+
+Telegram (aiohttp) и OpenRouter (httpx) держат keep-alive соединения открытыми,
+DNS-ответы кэшируются. При старте соединения открываются заранее, чтобы первое
+сообщение пользователя не платило за DNS и TLS-рукопожатие
+"""
+import logging
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+import aiohttp
+
+from settings.config import Config
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+class ConnectionStats:
+    """Счетчики запросов и новых соединений; переиспользованные = запросы - новые"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = 0
+        self.new_connections = 0
+        self.connect_time_total = 0.0
+        self.warmup_time = None
+    
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.new_connections, 0)
+    
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'new_connections': self.new_connections,
+            'reused': self.reused,
+            'reuse_ratio': round(self.reused / self.requests, 3) if self.requests else 0.0,
+            'avg_connect_ms': round(self.connect_time_total / self.new_connections * 1000, 1) if self.new_connections else 0.0,
+            'warmup_ms': round(self.warmup_time * 1000, 1) if self.warmup_time is not None else None
+        }
+
+telegram_stats = ConnectionStats('telegram')
+openrouter_stats = ConnectionStats('openrouter')
+
+def get_connection_stats() -> dict:
+    """Статистика соединений для /health и /stats"""
+    return {stats.name: stats.as_dict() for stats in (telegram_stats, openrouter_stats)}
+
+# --- Telegram (aiohttp) ---
+
+def telegram_connector_options() -> dict:
+    """Параметры TCPConnector для сессии aiogram"""
+    return {
+        'limit': Config.TELEGRAM_POOL_LIMIT,
+        'ttl_dns_cache': Config.DNS_CACHE_TTL,
+        'use_dns_cache': True,
+        'keepalive_timeout': Config.TELEGRAM_KEEPALIVE_TIMEOUT
+    }
+
+def create_telegram_trace_config(stats: ConnectionStats = telegram_stats) -> aiohttp.TraceConfig:
+    """TraceConfig, считающий запросы и открытие новых соединений"""
+    
+    async def on_request_start(session, context, params):
+        stats.requests += 1
+    
+    async def on_connection_create_start(session, context, params):
+        context.connect_started = time.perf_counter()
+    
+    async def on_connection_create_end(session, context, params):
+        stats.new_connections += 1
+        started = getattr(context, 'connect_started', None)
+        if started is not None:
+            stats.connect_time_total += time.perf_counter() - started
+    
+    trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=lambda trace_request_ctx: SimpleNamespace())
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+# --- OpenRouter (httpx) ---
+
+def create_openrouter_http_client(stats: ConnectionStats = openrouter_stats) -> "httpx.AsyncClient":
+    """httpx-клиент для AsyncOpenAI с настроенным пулом и подсчетом новых соединений"""
+    import httpx
+    
+    async def on_request(request: httpx.Request):
+        stats.requests += 1
+        connect_started = []
+        
+        # httpcore сообщает об открытии TCP-соединения только для новых соединений
+        async def trace(event_name: str, info: dict):
+            if event_name == 'connection.connect_tcp.started':
+                connect_started.append(time.perf_counter())
+            elif event_name == 'connection.connect_tcp.complete':
+                stats.new_connections += 1
+                if connect_started:
+                    stats.connect_time_total += time.perf_counter() - connect_started.pop()
+        
+        request.extensions['trace'] = trace
+    
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=Config.OPENROUTER_POOL_LIMIT,
+            max_keepalive_connections=Config.OPENROUTER_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=Config.OPENROUTER_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(Config.OPENROUTER_REQUEST_TIMEOUT, connect=Config.OPENROUTER_CONNECT_TIMEOUT),
+        event_hooks={'request': [on_request]}
+    )
+
+# --- Прогрев ---
+
+async def warm_up_telegram(bot) -> bool:
+    """Открывает соединение с Telegram заранее (getMe)"""
+    started = time.perf_counter()
+    try:
+        await bot.get_me()
+        telegram_stats.warmup_time = time.perf_counter() - started
+        logger.info(f"Соединение с Telegram прогрето за {telegram_stats.warmup_time * 1000:.0f} мс")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка прогрева соединения с Telegram: {e}")
+        return False
+
+async def warm_up_openrouter(client) -> bool:
+    """Открывает соединение с OpenRouter заранее (список моделей, без расхода токенов)"""
+    started = time.perf_counter()
+    try:
+        await client.with_options(max_retries=0).models.list()
+        openrouter_stats.warmup_time = time.perf_counter() - started
+        logger.info(f"Соединение с OpenRouter прогрето за {openrouter_stats.warmup_time * 1000:.0f} мс")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка прогрева соединения с OpenRouter: {e}")
+        return False
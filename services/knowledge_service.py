@@ -3,13 +3,15 @@ import os
 import logging
 from typing import Dict, List, Optional, Any
 
+from services.container import container
+
 logger = logging.getLogger(__name__)
 
 class KnowledgeService:
     """Сервис для работы с базой знаний"""
     
-    def __init__(self):
-        self.base_path = "knowledge_base"
+    def __init__(self, base_path: str = "knowledge_base"):
+        self.base_path = base_path
         self.load_all_knowledge()
     
     def load_all_knowledge(self):
@@ -194,5 +196,5 @@ class KnowledgeService:
         
         return None
 
-# Создаем глобальный экземпляр сервиса
-knowledge_service = KnowledgeService()
\ No newline at end of file
+# База знаний по умолчанию загружается при первом обращении (container.knowledge_service)
+container.register('knowledge_service', KnowledgeService)
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Неблокирующее логирование: QueueHandler -> очередь -> QueueListener в отдельном потоке
+
+Обработчики бота только кладут запись в ограниченную очередь, а запись в файл
+(с ротацией по размеру или по времени) и в консоль выполняет поток слушателя.
+Если во время шквала ошибок очередь переполнена, записи отбрасываются
+со счетчиком, а не тормозят обработку сообщений. При BOT_WORKERS > 1 очередь
+межпроцессная: воркеры кладут в нее записи, а пишет их один слушатель во фронте,
+поэтому ротацию файла выполняет только один процесс
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime
+from typing import List, Optional
+
+from settings.config import Config
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Несколько процессов пишут в один файл - указываем, чья запись
+MULTIPROCESS_TEXT_FORMAT = '%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+
+# Стандартные поля LogRecord; все остальное пришло через extra= и попадает в JSON как есть
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON (поля extra= сохраняются)"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.processName,
+            'message': record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in data:
+                data[key] = value
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при переполненной очереди отбрасывает запись, а не ждет"""
+    
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Подставляет аргументы в сообщение и превращает исключение в текст, чтобы запись
+        можно было передать в другой поток или процесс. В отличие от базового класса
+        traceback остается отдельным полем (exc_text), а не склеивается с сообщением
+        """
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _Listener(logging.handlers.QueueListener):
+    """Слушатель, которому не мешает переполненная очередь при остановке"""
+    
+    def enqueue_sentinel(self):
+        # put_nowait базового класса упал бы на полной очереди; поток слушателя ее разбирает, ждать недолго
+        self.queue.put(self._sentinel)
+
+class LogPipeline:
+    """Настройка корневого логгера и жизненный цикл потока-слушателя"""
+    
+    def __init__(self):
+        self.queue = None
+        self.handler: Optional[DroppingQueueHandler] = None
+        self.listener: Optional[_Listener] = None
+        self.targets: List[logging.Handler] = []
+    
+    @property
+    def dropped(self) -> int:
+        """Сколько записей отброшено из-за переполненной очереди"""
+        return self.handler.dropped if self.handler else 0
+    
+    def _formatter(self, multiprocess: bool) -> logging.Formatter:
+        if Config.LOG_FORMAT == 'json':
+            return JsonFormatter()
+        return logging.Formatter(MULTIPROCESS_TEXT_FORMAT if multiprocess else TEXT_FORMAT)
+    
+    def _file_handler(self, path: str) -> logging.Handler:
+        """Файловый обработчик с ротацией по размеру или по времени"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if Config.LOG_ROTATION == 'time':
+            return logging.handlers.TimedRotatingFileHandler(
+                path, when=Config.LOG_ROTATE_WHEN, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'
+            )
+        return logging.handlers.RotatingFileHandler(
+            path, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    
+    def start(self, log_file: str = None, level: str = None, multiprocess: bool = False):
+        """
+        Направляет корневой логгер в очередь и запускает поток записи в консоль и файл.
+        multiprocess - очередь межпроцессная, ее можно передать воркерам (см. attach)
+        """
+        if self.listener is not None:
+            return
+        log_file = Config.LOG_FILE if log_file is None else log_file
+        formatter = self._formatter(multiprocess)
+        self.targets = [logging.StreamHandler()]
+        if log_file:
+            self.targets.append(self._file_handler(log_file))
+        for target in self.targets:
+            target.setFormatter(formatter)
+        
+        if multiprocess:
+            import multiprocessing
+            self.queue = multiprocessing.get_context('spawn').Queue(Config.LOG_QUEUE_SIZE)
+        else:
+            self.queue = queue.Queue(Config.LOG_QUEUE_SIZE)
+        self.listener = _Listener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+        self.attach(self.queue, level)
+        atexit.register(self.stop)
+    
+    def attach(self, log_queue, level: str = None):
+        """Заменяет обработчики корневого логгера на запись в очередь (в воркере - в очередь фронта)"""
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        self.handler = DroppingQueueHandler(log_queue)
+        root.addHandler(self.handler)
+        root.setLevel(level or Config.LOG_LEVEL)
+    
+    def stop(self):
+        """
+        Дописывает все записи из очереди и останавливает поток. Записи, сделанные
+        после остановки (завершение интерпретатора), пишутся напрямую
+        """
+        if self.listener is None:
+            return
+        listener, self.listener = self.listener, None
+        listener.stop()
+        
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        for target in self.targets:
+            root.addHandler(target)
+        if self.handler.dropped:
+            logging.getLogger(__name__).warning(
+                f"Очередь логов переполнялась, отброшено записей: {self.handler.dropped}"
+            )
+
+# Глобальный конвейер логирования
+log_pipeline = LogPipeline()
@@ -0,0 +1,243 @@
+"""
+Мониторинг задержки цикла событий и поиск блокирующих вызовов
+
+Сторожевой поток каждые interval секунд ставит в цикл пинг (call_soon_threadsafe)
+и меряет, через сколько цикл его выполнит (lag). Если цикл не ответил за threshold,
+сторож снимает стек потока цикла прямо во время блокировки - это и есть код,
+который блокирует цикл. Места блокировок копятся в рейтинге "худших нарушителей"
+для логов и админ-команды /loop.
+
+В отладочном режиме (LOOP_DEBUG) дополнительно включается debug-режим asyncio
+(медленные callback'и) и предупреждения о синхронном открытии файлов в потоке цикла
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from settings.config import Config
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = metrics.histogram(
+    'bot_event_loop_lag_seconds', 'Задержка цикла событий относительно запланированного пробуждения',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = metrics.counter(
+    'bot_event_loop_stalls_total', 'Блокировки цикла событий дольше порога LOOP_LAG_THRESHOLD'
+)
+
+# Каталог проекта: в стеке блокировки ищем самый глубокий кадр нашего кода
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _offender_location(frames: List[traceback.FrameSummary]) -> str:
+    """Самое глубокое место в коде проекта (иначе - самый глубокий кадр вообще)"""
+    for frame in reversed(frames):
+        if frame.filename.startswith(PROJECT_ROOT) and 'site-packages' not in frame.filename:
+            return f"{os.path.relpath(frame.filename, PROJECT_ROOT)}:{frame.lineno} ({frame.name})"
+    if frames:
+        frame = frames[-1]
+        return f"{frame.filename}:{frame.lineno} ({frame.name})"
+    return 'unknown'
+
+class LoopMonitor:
+    """Измеряет задержку цикла событий и запоминает, какой код его блокировал"""
+    
+    def __init__(self, interval: float = None, threshold: float = None, debug: bool = None, top_size: int = 10):
+        self.interval = interval if interval is not None else Config.LOOP_LAG_INTERVAL
+        self.threshold = threshold if threshold is not None else Config.LOOP_LAG_THRESHOLD
+        self.debug = debug if debug is not None else Config.LOOP_DEBUG
+        self.top_size = top_size
+        
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        
+        self.recent_lags = deque(maxlen=1200)  # последние измерения (при interval 0.25 с - около 5 минут)
+        self.max_lag = 0.0
+        self.stalls = 0
+        # место блокировки -> {'count', 'max', 'total', 'stack'}
+        self.offenders: Dict[str, dict] = {}
+        # Сторож и цикл работают в разных потоках: блокировка, снятая сторожем, и рейтинг мест
+        # меняются только под lock. Каждый пинг получает номер, и снятая блокировка
+        # (номер пинга, место) засчитывается только ответу на этот пинг
+        self.lock = threading.Lock()
+        self._probe_seq = 0
+        self._pending_stall: Optional[Tuple[int, str]] = None
+        self._file_io_seen: Dict[str, int] = {}
+        self._in_file_io_hook = False
+    
+    def start(self):
+        """Запускает сторожевой поток для текущего цикла событий"""
+        if self.watchdog:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.watchdog = threading.Thread(target=self._watch, name='loop-monitor-watchdog', daemon=True)
+        self.watchdog.start()
+        
+        if self.debug:
+            self.loop.set_debug(True)
+            self.loop.slow_callback_duration = self.threshold
+            _install_file_io_hook(self)
+        
+        logger.info(f"Мониторинг цикла событий запущен: порог {self.threshold * 1000:.0f} мс"
+                    f"{', отладка блокирующего ввода-вывода включена' if self.debug else ''}")
+    
+    async def stop(self):
+        """Останавливает сторожевой поток"""
+        self.stopped.set()
+        if self.watchdog:
+            await asyncio.to_thread(self.watchdog.join, 1)
+            self.watchdog = None
+    
+    def _pong(self, seq: int, posted: float, done: threading.Event):
+        """Ответ на пинг сторожа номер seq, выполняется в цикле событий"""
+        lag = time.monotonic() - posted
+        with self.lock:
+            # Под lock: сторож либо уже записал блокировку этого пинга, либо увидит done и не запишет
+            done.set()
+            location = None
+            if self._pending_stall is not None and self._pending_stall[0] <= seq:
+                if self._pending_stall[0] == seq:
+                    location = self._pending_stall[1]
+                self._pending_stall = None
+        self._record_lag(lag, location)
+    
+    def _record_lag(self, lag: float, location: Optional[str] = None):
+        self.recent_lags.append(lag)
+        LOOP_LAG.observe(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+        
+        if lag < self.threshold:
+            return
+        
+        self.stalls += 1
+        LOOP_STALLS.inc()
+        if location is None:
+            # Сторож не успел снять стек (блокировка закончилась раньше, чем истек порог ожидания пинга)
+            location = 'unknown (стек не снят)'
+        with self.lock:
+            offender = self.offenders.setdefault(location, {'count': 0, 'max': 0.0, 'total': 0.0, 'stack': ''})
+            offender['count'] += 1
+            offender['total'] += lag
+            offender['max'] = max(offender['max'], lag)
+        logger.warning(f"Цикл событий был заблокирован на {lag * 1000:.0f} мс: {location}")
+    
+    def _watch(self):
+        """Поток-сторож: пингует цикл и снимает стек потока цикла, если тот не отвечает"""
+        while not self.stopped.wait(self.interval):
+            done = threading.Event()
+            self._probe_seq += 1
+            seq = self._probe_seq
+            try:
+                self.loop.call_soon_threadsafe(self._pong, seq, time.monotonic(), done)
+            except RuntimeError:
+                # Цикл уже закрыт
+                return
+            if done.wait(self.threshold):
+                continue
+            
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None and not done.is_set():
+                frames = traceback.extract_stack(frame)
+                location = _offender_location(frames)
+                stack = ''.join(traceback.format_list(frames[-15:]))
+                with self.lock:
+                    # Пока снимали стек, цикл мог ответить: тогда стек уже не о блокировке этого пинга
+                    if done.is_set():
+                        continue
+                    offender = self.offenders.setdefault(location, {'count': 0, 'max': 0.0, 'total': 0.0, 'stack': ''})
+                    offender['stack'] = stack
+                    self._pending_stall = (seq, location)
+                logger.warning(f"Цикл событий не отвечает дольше {self.threshold * 1000:.0f} мс, "
+                               f"блокирующий код:\n{stack}")
+            
+            # Ждем, пока цикл освободится (длительность блокировки запишет _pong)
+            while not done.wait(self.interval):
+                if self.stopped.is_set():
+                    return
+    
+    def flag_file_io(self, path, mode):
+        """Audit-хук: предупреждает о синхронном открытии файла в потоке цикла (режим отладки)"""
+        if not self.debug or self._in_file_io_hook or threading.get_ident() != self.loop_thread_id:
+            return
+        # Исходники и байткод читают импорт и linecache (в том числе debug-режим asyncio) - это не наш I/O
+        if isinstance(path, str) and path.endswith(('.py', '.pyc')):
+            return
+        # Логирование само может открывать файлы - защищаемся от повторного входа
+        self._in_file_io_hook = True
+        try:
+            # Без чтения исходников (lookup_lines=False): linecache тоже открывает файлы
+            frames = list(reversed(traceback.StackSummary.extract(
+                traceback.walk_stack(sys._getframe(2)), lookup_lines=False
+            )))
+            location = _offender_location(frames)
+            seen = self._file_io_seen.get(location, 0)
+            self._file_io_seen[location] = seen + 1
+            # Каждое место сообщаем один раз, дальше только считаем
+            if seen == 0:
+                logger.warning(f"Синхронный файловый ввод-вывод в цикле событий: open({path!r}, {mode!r}) в {location}")
+        finally:
+            self._in_file_io_hook = False
+    
+    def percentile(self, q: float) -> float:
+        """Перцентиль задержки по последним измерениям"""
+        if not self.recent_lags:
+            return 0.0
+        ordered = sorted(self.recent_lags)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+    
+    def worst_offenders(self, limit: int = None) -> List[tuple]:
+        """Места блокировок, отсортированные по суммарному времени блокировки"""
+        with self.lock:
+            ranked = sorted(self.offenders.items(), key=lambda item: item[1]['total'], reverse=True)
+        return ranked[:limit or self.top_size]
+    
+    def report(self) -> str:
+        """Текстовый отчет для админ-команды /loop"""
+        lines = [
+            f"Задержка цикла: p50 {self.percentile(0.5) * 1000:.1f} мс, p99 {self.percentile(0.99) * 1000:.1f} мс, "
+            f"максимум {self.max_lag * 1000:.0f} мс",
+            f"Блокировок дольше {self.threshold * 1000:.0f} мс: {self.stalls}"
+        ]
+        offenders = self.worst_offenders()
+        if offenders:
+            lines.append("")
+            lines.append("Худшие места:")
+            for location, offender in offenders:
+                lines.append(f"• {location} - {offender['count']} раз, максимум {offender['max'] * 1000:.0f} мс, "
+                             f"всего {offender['total'] * 1000:.0f} мс")
+        if self._file_io_seen:
+            lines.append("")
+            lines.append("Синхронное открытие файлов в цикле:")
+            for location, count in sorted(self._file_io_seen.items(), key=lambda item: item[1], reverse=True)[:self.top_size]:
+                lines.append(f"• {location} - {count} раз")
+        return '\n'.join(lines)
+
+_file_io_hook_installed = False
+
+def _install_file_io_hook(monitor: LoopMonitor):
+    """Ставит audit-хук на open (хуки нельзя снять, поэтому ставим один раз)"""
+    global _file_io_hook_installed
+    if _file_io_hook_installed:
+        return
+    _file_io_hook_installed = True
+    
+    def hook(event, args):
+        if event == 'open' and monitor.debug:
+            monitor.flag_file_io(args[0], args[1])
+    
+    sys.addaudithook(hook)
+
+# Глобальный экземпляр монитора
+loop_monitor = LoopMonitor()
@@ -0,0 +1,171 @@
+"""
+Инспектор памяти для админ-команды /memory
+
+Включает и выключает tracemalloc, показывает топ мест выделения памяти,
+сравнивает снимки и считает размеры собственных структур бота
+(история диалогов, база знаний, кэши и очереди)
+"""
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Служебные кадры, которые не интересны в отчетах
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+def format_bytes(size: float) -> str:
+    """Размер в человекочитаемом виде"""
+    for unit in ('Б', 'КБ', 'МБ'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """Приблизительный размер объекта вместе со вложенными контейнерами и строками"""
+    seen = seen if seen is not None else set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(list(current.keys()))
+            stack.extend(list(current.values()))
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(list(current))
+    return total
+
+def get_rss() -> Optional[int]:
+    """Текущий RSS процесса в байтах (Linux), иначе None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class MemoryInspector:
+    """Управляет tracemalloc и строит отчеты о памяти"""
+    
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.baseline_time: Optional[datetime] = None
+    
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+    
+    def start(self, frames: int = 1) -> str:
+        """Включает tracemalloc (frames - глубина стека для каждого выделения)"""
+        if self.tracing:
+            return f"tracemalloc уже включен (кадров: {tracemalloc.get_traceback_limit()})"
+        tracemalloc.start(frames)
+        self.baseline = None
+        logger.info(f"tracemalloc включен, кадров: {frames}")
+        return f"tracemalloc включен, кадров стека: {frames}. Снимок для сравнения: /memory snapshot"
+    
+    def stop(self) -> str:
+        """Выключает tracemalloc и освобождает его данные"""
+        if not self.tracing:
+            return "tracemalloc не включен"
+        tracemalloc.stop()
+        self.baseline = None
+        logger.info("tracemalloc выключен")
+        return "tracemalloc выключен"
+    
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+    
+    def snapshot(self) -> str:
+        """Запоминает снимок как базовый для последующего сравнения"""
+        if not self.tracing:
+            return "Сначала включите tracemalloc: /memory start"
+        self.baseline = self._take_snapshot()
+        self.baseline_time = datetime.now()
+        size = sum(stat.size for stat in self.baseline.statistics('filename'))
+        return f"Снимок сохранен ({format_bytes(size)} под наблюдением). Сравнение: /memory diff"
+    
+    def top(self, limit: int = 15, key_type: str = 'lineno') -> str:
+        """Топ мест выделения памяти"""
+        if not self.tracing:
+            return "Сначала включите tracemalloc: /memory start"
+        stats = self._take_snapshot().statistics(key_type)
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Под наблюдением: {format_bytes(current)} (пик {format_bytes(peak)})", "", f"Топ-{limit} мест выделения:"]
+        for index, stat in enumerate(stats[:limit], 1):
+            frame = stat.traceback[0]
+            lines.append(f"{index}. {frame.filename}:{frame.lineno} - {format_bytes(stat.size)} ({stat.count} блоков)")
+        return '\n'.join(lines)
+    
+    def diff(self, limit: int = 15) -> str:
+        """Разница с базовым снимком: где память выросла сильнее всего"""
+        if not self.tracing:
+            return "Сначала включите tracemalloc: /memory start"
+        if self.baseline is None:
+            return "Нет базового снимка: /memory snapshot"
+        current = self._take_snapshot()
+        stats = current.compare_to(self.baseline, 'lineno')
+        total_diff = sum(stat.size_diff for stat in stats)
+        lines = [
+            f"Изменение с {self.baseline_time.strftime('%H:%M:%S')}: {'+' if total_diff >= 0 else ''}{format_bytes(total_diff)}",
+            "",
+            f"Топ-{limit} изменений:"
+        ]
+        for index, stat in enumerate(stats[:limit], 1):
+            frame = stat.traceback[0]
+            sign = '+' if stat.size_diff >= 0 else ''
+            lines.append(f"{index}. {frame.filename}:{frame.lineno} - {sign}{format_bytes(stat.size_diff)} "
+                         f"(всего {format_bytes(stat.size)}, {sign}{stat.count_diff} блоков)")
+        return '\n'.join(lines)
+    
+    def summary(self, structures: Dict[str, object], history_managers: Dict[str, object] = None,
+                object_types_limit: int = 10) -> str:
+        """Общая картина: RSS, tracemalloc, размеры структур бота и самые частые типы объектов"""
+        rss = get_rss()
+        lines = [f"RSS процесса: {format_bytes(rss) if rss is not None else 'неизвестно'}"]
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"tracemalloc: {format_bytes(current)} (пик {format_bytes(peak)})")
+        else:
+            lines.append("tracemalloc: выключен (/memory start)")
+        
+        if history_managers:
+            lines.append("")
+            lines.append("История диалогов:")
+            for name, manager in history_managers.items():
+                histories = dict(manager.histories)
+                messages = sum(len(history) for history in histories.values())
+                lines.append(f"• {name}: {len(histories)} пользователей, {messages} сообщений, "
+                             f"{format_bytes(deep_sizeof(histories))}")
+        
+        lines.append("")
+        lines.append("Структуры бота:")
+        for name, obj in structures.items():
+            lines.append(f"• {name}: {format_bytes(deep_sizeof(obj))}")
+        
+        objects = gc.get_objects()
+        lines.append("")
+        lines.append(f"Самые частые объекты (gc, {len(objects)} всего):")
+        type_counts = Counter(type(obj).__name__ for obj in objects)
+        del objects
+        for type_name, count in type_counts.most_common(object_types_limit):
+            lines.append(f"• {type_name}: {count}")
+        return '\n'.join(lines)
+
+# Глобальный экземпляр инспектора
+memory_inspector = MemoryInspector()
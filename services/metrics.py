@@ -0,0 +1,247 @@
+"""
+Метрики бота в формате Prometheus (text exposition format 0.0.4)
+
+Запись метрики - это обращение к словарю и пара арифметических операций,
+без блокировок и без форматирования строк, поэтому ее можно делать на каждом апдейте.
+Текст для /metrics собирается только по запросу скрейпера
+"""
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+from services.analytics import analytics
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    """Экранирует значение метки: обратный слеш, кавычки и переносы строк"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple, extra: str = '') -> str:
+    """Форматирует метки {name="value",...}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """Базовая метрика с именем, описанием и набором меток"""
+    
+    type_name = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+    
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self.samples()
+    
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """Монотонно растущий счетчик. Значения меток передаются позиционно: inc('hit')"""
+    
+    type_name = 'counter'
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+        self.values: Dict[Tuple, float] = {}
+    
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def get(self, *label_values) -> float:
+        return self.values.get(label_values, 0)
+    
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in list(self.values.items())
+        ]
+
+class Gauge(Metric):
+    """
+    Текущее значение. Можно выставлять вручную (set) или задать функцию,
+    которая вычисляет значения в момент скрейпа: {значения_меток: число}
+    """
+    
+    type_name = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        super().__init__(name, documentation, label_names)
+        self.values: Dict[Tuple, float] = {}
+        self.function = function
+    
+    def set(self, value: float, *label_values):
+        self.values[label_values] = value
+    
+    def set_function(self, function: Callable[[], Dict[Tuple, float]]):
+        self.function = function
+    
+    def samples(self) -> List[str]:
+        values = dict(self.values)
+        if self.function:
+            try:
+                values.update(self.function())
+            except Exception as e:
+                logger.error(f"Ошибка при вычислении метрики {self.name}: {e}")
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин"""
+    
+    type_name = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # значения меток -> [счетчики по корзинам (+Inf последней), сумма, количество]
+        self.values: Dict[Tuple, list] = {}
+    
+    def observe(self, value: float, *label_values):
+        state = self.values.get(label_values)
+        if state is None:
+            state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        # Храним попадания в каждую корзину, накопительные суммы считаем при рендере
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+    
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+    
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+    
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+    
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+              function: Optional[Callable[[], Dict[Tuple, float]]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names, function))
+    
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+    
+    def render(self) -> str:
+        """Текст для эндпоинта /metrics"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Глобальный реестр и метрики бота
+metrics = MetricsRegistry()
+
+HANDLER_LATENCY = metrics.histogram(
+    'bot_handler_duration_seconds', 'Время обработки сообщения по обработчику (команда или кнопка)', ('handler',)
+)
+HANDLER_ERRORS = metrics.counter(
+    'bot_handler_errors_total', 'Необработанные исключения в обработчиках', ('handler',)
+)
+LLM_LATENCY = metrics.histogram(
+    'bot_llm_request_duration_seconds', 'Длительность запросов к LLM', ('model', 'kind')
+)
+LLM_TOKENS = metrics.counter(
+    'bot_llm_tokens_total', 'Токены LLM по модели и типу (prompt/completion)', ('model', 'type')
+)
+LLM_QUOTA_DOWNGRADES = metrics.counter(
+    'bot_llm_quota_downgrades_total', 'Ответы без запроса к LLM из-за дневной квоты пользователя', ('quota',)
+)
+LLM_ERRORS = metrics.counter(
+    'bot_llm_errors_total', 'Ошибки запросов к LLM', ('model', 'kind')
+)
+KB_LOOKUPS = metrics.counter(
+    'bot_knowledge_lookups_total', 'Поиск по базе знаний: hit - найден готовый ответ, miss - нет', ('result',)
+)
+CONTACTS_SAVED = metrics.counter(
+    'bot_contacts_saved_total', 'Сохраненные контакты по источнику', ('source',)
+)
+SEND_FAILURES = metrics.counter(
+    'bot_send_failures_total', 'Сообщения, которые не удалось отправить в Telegram', ('reason',)
+)
+BROADCAST_MESSAGES = metrics.counter(
+    'bot_broadcast_messages_total', 'Сообщения рассылок по результату (sent, blocked, failed)', ('result',)
+)
+SEND_QUEUE_DEPTH = metrics.gauge(
+    'bot_send_queue_depth', 'Части сообщений, ожидающие отправки в очереди арендатора', ('tenant',)
+)
+HISTORY_SIZE = metrics.gauge(
+    'bot_history_size', 'Размер хранилища истории диалогов (users - пользователей, messages - сообщений)', ('kind',)
+)
+
+def observe_llm_usage(model: str, kind: str, duration: float, usage, tenant: Optional[str] = None) -> None:
+    """Записывает длительность запроса к LLM и токены из response.usage (в аналитику - если задан арендатор)"""
+    LLM_LATENCY.observe(duration, model, kind)
+    if tenant is not None:
+        analytics.record_llm(tenant, duration)
+    if usage is not None:
+        LLM_TOKENS.inc(model, 'prompt', amount=getattr(usage, 'prompt_tokens', 0) or 0)
+        LLM_TOKENS.inc(model, 'completion', amount=getattr(usage, 'completion_tokens', 0) or 0)
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Измеряет время работы обработчика (метка - имя функции-обработчика: команда или кнопка)
+    и отмечает входящее сообщение в аналитике скользящих окон
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        tenant = data['tenant'].name
+        if isinstance(event, Message) and event.from_user:
+            analytics.record_message(tenant, event.from_user.id)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            analytics.record_error(tenant)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
@@ -1,36 +1,266 @@
+import asyncio
 import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, Optional
+
 from settings.config import Config
 from components.keyboards import Keyboards
+from utils.text_utils import split_long_message
 
 logger = logging.getLogger(__name__)
 
 class NotificationService:
-    """Сервис для отправки уведомлений админу"""
+    """
+    Сервис для отправки уведомлений админу.
+    Уведомления о новых контактах ставятся в очередь и не задерживают ответ пользователю.
+    Первый лид после затишья отправляется сразу, а следующие за ним в течение
+    окна digest_window объединяются в один дайджест. Пока админу не удается доставить уведомление,
+    повторные дайджесты отправляются все реже, а накопленный список ограничен max_backlog контактами
+    """
     
-    def __init__(self, bot):
+    def __init__(self, bot, send_queue=None, digest_window: float = None,
+                 max_retries: int = None, retry_delay: float = None, admin_chat_id: str = None,
+                 max_backlog: int = None, max_backoff: float = None):
         self.bot = bot
-        self.admin_chat_id = Config.ADMIN_CHAT_ID
+        self.send_queue = send_queue
+        self.admin_chat_id = admin_chat_id or Config.ADMIN_CHAT_ID
+        self.digest_window = digest_window if digest_window is not None else Config.NOTIFICATION_DIGEST_WINDOW
+        self.max_retries = max_retries if max_retries is not None else Config.NOTIFICATION_MAX_RETRIES
+        self.retry_delay = retry_delay if retry_delay is not None else Config.NOTIFICATION_RETRY_DELAY
+        self.max_backoff = max_backoff if max_backoff is not None else Config.NOTIFICATION_MAX_BACKOFF
+        
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.delivery: Optional[asyncio.Task] = None  # текущая отправка уведомления или дайджеста
+        self.closing = False
+        # Контакты, взятые из очереди, но еще не доставленные админу (в том числе после неудачной
+        # отправки - уйдут со следующим дайджестом). Держим их здесь, а не в локальных переменных,
+        # чтобы при остановке бота close() отправил и их. При переполнении вытесняются самые старые
+        self.undelivered: Deque[dict] = deque(maxlen=max_backlog or Config.NOTIFICATION_MAX_BACKLOG)
+        self.dropped = 0  # вытесненные контакты, о которых админ еще не знает (в дайджесте будет строка о них)
+        self.sending = 0  # сколько первых контактов undelivered входит в текущую отправку
+        self.evicted_while_sending = 0
+        self.failed_rounds = 0  # неудачные отправки подряд, от них зависит пауза до следующей
+        self.stats = {'contacts': 0, 'messages': 0, 'digests': 0, 'retries': 0, 'dropped': 0}
+    
+    def start(self):
+        """Запускает обработчик очереди уведомлений (вызывается автоматически)"""
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self._worker(), name="admin-notifications")
+    
+    async def close(self, timeout: float = None):
+        """
+        Останавливает обработчик и отправляет все, что осталось в очереди, не дольше timeout секунд.
+        Новые контакты в очередь больше не принимаются, начатая отправка доводится до конца (иначе
+        после отмены посреди отправки админ получил бы уведомление дважды). Не доставленные за это
+        время контакты остаются в undelivered (они уже сохранены в файле контактов)
+        """
+        if self.worker is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        self.closing = True
+        # wait_for в _collect (Python до 3.12) поглощает отмену, если контакт пришел в тот же
+        # момент, - тогда обработчик продолжает работу. Отменяем, пока он действительно не остановится.
+        # Сама отправка идет в отдельной задаче и отменой обработчика не прерывается
+        while not self.worker.done():
+            self.worker.cancel()
+            await asyncio.wait({self.worker}, timeout=0.1)
+        self.worker = None
+        # Начатая отправка удаляет из undelivered только свои контакты, добавленные после нее остаются
+        for contact in self._drain_queue():
+            self._add(contact)
+        
+        if self.delivery is not None:
+            remaining = max(0.0, deadline - loop.time()) if deadline is not None else None
+            await asyncio.wait({self.delivery}, timeout=remaining)
+            if not self.delivery.done():
+                self.delivery.cancel()
+                await asyncio.wait({self.delivery})
+                logger.warning(f"Уведомление о {len(self.undelivered)} контактах не отправлено за {timeout} с при остановке")
+                return
+        
+        if not self.undelivered:
+            return
+        remaining = max(0.0, deadline - loop.time()) if deadline is not None else None
+        try:
+            await asyncio.wait_for(self._deliver(), remaining)
+        except asyncio.TimeoutError:
+            logger.warning(f"Уведомление о {len(self.undelivered)} контактах не отправлено за {timeout} с при остановке")
+    
+    @property
+    def pending(self) -> int:
+        """Количество контактов, ожидающих отправки админу"""
+        queued = self.queue.qsize() if self.queue else 0
+        return queued + len(self.undelivered)
+    
+    async def _send(self, text: str) -> bool:
+        """Отправляет сообщение админу через общую очередь (если она задана)"""
+        if self.send_queue:
+            return await self.send_queue.send_parts(self.admin_chat_id, split_long_message(text))
+        for part in split_long_message(text):
+            await self.bot.send_message(self.admin_chat_id, part)
+        return True
     
     async def notify_new_contact(self, contact_data: dict):
-        """Уведомление о новом контакте"""
+        """Уведомление о новом контакте (ставится в очередь, отправка в фоне)"""
         try:
-            message = f"""
+            contact = dict(contact_data)
+            contact.setdefault('timestamp', datetime.now().isoformat())
+            if self.closing:
+                # Бот останавливается: контакт уже в файле, уведомление попадет в отчет о брошенной работе
+                self._add(contact)
+                return
+            self.start()
+            self.queue.put_nowait(contact)
+        except Exception as e:
+            logger.error(f"Ошибка при постановке уведомления в очередь: {e}")
+    
+    async def _worker(self):
+        """Отправляет первый лид сразу, остальные - дайджестами раз в digest_window секунд"""
+        while True:
+            self._add(await self.queue.get())
+            await self._deliver_in_task()
+            
+            # Пока лиды продолжают поступать или админу не удается доставить уведомление,
+            # копим их и отправляем дайджестами
+            while True:
+                await self._collect(self._next_window())
+                if not self.undelivered:
+                    break
+                await self._deliver_in_task()
+    
+    def _next_window(self) -> float:
+        """Окно до следующего дайджеста: после неудачных отправок растет вдвое, но не больше max_backoff"""
+        if not self.failed_rounds:
+            return self.digest_window
+        base = self.digest_window or self.retry_delay
+        return min(base * 2 ** self.failed_rounds, self.max_backoff)
+    
+    def _add(self, contact: dict):
+        """Добавляет контакт к недоставленным; при переполнении вытесняет самый старый"""
+        if len(self.undelivered) == self.undelivered.maxlen:
+            if self.sending:
+                # Вытеснен контакт из текущей отправки: будет ли он потерян, решит ее итог
+                self.sending -= 1
+                self.evicted_while_sending += 1
+            else:
+                self._drop(1)
+        self.undelivered.append(contact)
+    
+    def _drop(self, count: int):
+        """Учитывает контакты, уведомление о которых админ не получит"""
+        if self.dropped == 0:
+            logger.warning(f"Недоставленных уведомлений больше {self.undelivered.maxlen}, старые контакты вытесняются")
+        self.dropped += count
+        self.stats['dropped'] += count
+    
+    async def _deliver_in_task(self):
+        """Отправляет в отдельной задаче: close() отменяет обработчик, но дожидается начатой отправки"""
+        self.delivery = asyncio.create_task(self._deliver(), name="admin-notification-delivery")
+        await asyncio.shield(self.delivery)
+        self.delivery = None
+    
+    async def _collect(self, window: float):
+        """Собирает в undelivered контакты, поступившие в течение окна"""
+        deadline = time.monotonic() + window
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                self._add(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+    
+    def _drain_queue(self) -> List[dict]:
+        """Забирает из очереди все без ожидания"""
+        contacts = []
+        while self.queue and not self.queue.empty():
+            contacts.append(self.queue.get_nowait())
+        return contacts
+    
+    async def _deliver(self):
+        """Отправляет уведомление или дайджест undelivered с повторами; при неудаче контакты не теряются"""
+        contacts = list(self.undelivered)
+        if not contacts:
+            return
+        dropped = self.dropped
+        
+        if len(contacts) == 1 and not dropped:
+            message = self._format_contact(contacts[0])
+        else:
+            message = self._format_digest(contacts, dropped)
+        
+        self.sending = len(contacts)
+        self.evicted_while_sending = 0
+        delivered = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    if await self._send(message):
+                        delivered = True
+                        break
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке уведомления: {e}")
+                
+                if attempt < self.max_retries:
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        finally:
+            if delivered:
+                # Вытесненные во время отправки контакты в нее уже вошли
+                for _ in range(self.sending):
+                    self.undelivered.popleft()
+                self.dropped -= dropped
+                self.failed_rounds = 0
+            elif self.evicted_while_sending:
+                self._drop(self.evicted_while_sending)
+            self.sending = 0
+            self.evicted_while_sending = 0
+        
+        if delivered:
+            self.stats['contacts'] += len(contacts)
+            self.stats['messages'] += 1
+            if len(contacts) > 1 or dropped:
+                self.stats['digests'] += 1
+            return
+        
+        self.failed_rounds += 1
+        logger.error(f"Не удалось отправить уведомление о {len(contacts)} контактах, повторим через {self._next_window():.0f} с")
+    
+    def _format_contact(self, contact_data: dict) -> str:
+        """Уведомление об одном контакте"""
+        return f"""
 📱 НОВЫЙ КОНТАКТ от потенциального клиента!
 
-👤 Имя: {contact_data['first_name']} {contact_data['last_name']}
-📞 Телефон: {contact_data['phone_number']}
-🔗 Username: @{contact_data['username']}
-🆔 User ID: {contact_data['user_id']}
+👤 Имя: {contact_data.get('first_name', '')} {contact_data.get('last_name', '')}
+📞 Телефон: {contact_data.get('phone_number', '')}
+📧 Email: {contact_data.get('email', '')}
+🔗 Username: @{contact_data.get('username', '')}
+🆔 User ID: {contact_data.get('user_id', '')}
 ⏰ Время: {contact_data['timestamp']}
             """
-            await self.bot.send_message(self.admin_chat_id, message)
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления: {e}")
+    
+    def _format_digest(self, contacts: List[dict], dropped: int = 0) -> str:
+        """Дайджест из нескольких контактов; dropped - сколько более старых не вошло в него"""
+        message = f"📬 НОВЫЕ КОНТАКТЫ ({len(contacts) + dropped}):\n\n"
+        if dropped:
+            message += f"⚠️ Еще {dropped} более ранних контактов не вошли в уведомление, они есть в файле контактов\n\n"
+        for i, contact_data in enumerate(contacts, 1):
+            message += f"{i}. 👤 {contact_data.get('first_name', '')} {contact_data.get('last_name', '')}\n"
+            message += f"   📞 {contact_data.get('phone_number', '') or '-'} | 📧 {contact_data.get('email', '') or '-'}\n"
+            message += f"   🔗 @{contact_data.get('username', '')} | 🆔 {contact_data.get('user_id', '')}\n"
+            message += f"   ⏰ {contact_data['timestamp']}\n\n"
+        return message
     
     async def notify_bot_started(self):
         """Уведомление о запуске бота"""
         try:
             message = "✅ Бот успешно запущен и готов к работе!\nВведите команду /start для начала"
-            await self.bot.send_message(self.admin_chat_id, message)
+            await self._send(message)
         except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления о запуске: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка при отправке уведомления о запуске: {e}")
@@ -0,0 +1,245 @@
+"""
+Очередь исходящих сообщений с учетом лимитов Telegram
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+from settings.config import Config
+from services.metrics import SEND_FAILURES
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Token bucket: пополняется со скоростью rate токенов в секунду, вмещает не больше capacity"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0  # пауза после TelegramRetryAfter
+    
+    def _refill(self, now: float):
+        """Пополняет токены за прошедшее время"""
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+    
+    def wait_time(self, now: float) -> float:
+        """Сколько секунд ждать до появления свободного токена"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def consume(self):
+        """Забирает один токен"""
+        self.tokens -= 1
+    
+    def block(self, seconds: float):
+        """Блокирует отправку на указанное время (flood wait от Telegram)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class OutgoingMessage:
+    """Сообщение в очереди: все части одного ответа отправляются подряд и по порядку"""
+    
+    __slots__ = ('chat_id', 'parts', 'reply_markup', 'kwargs', 'future')
+    
+    def __init__(self, chat_id: int, parts: List[str], reply_markup, kwargs: dict, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.parts = parts
+        self.reply_markup = reply_markup
+        self.kwargs = kwargs
+        self.future = future
+
+class SendQueue:
+    """
+    Центральный планировщик исходящих сообщений.
+    Соблюдает глобальный лимит и лимит на чат, обрабатывает TelegramRetryAfter.
+    Сообщения одного чата обрабатывает не больше одного воркера одновременно,
+    поэтому порядок частей и сообщений внутри чата сохраняется.
+    """
+    
+    # Сколько bucket'ов чатов помнить; сверх этого забываются давно не писавшие чаты
+    MAX_CHAT_BUCKETS = 10000
+    
+    def __init__(self, bot, global_rate: float = None, chat_rate: float = None,
+                 chat_burst: int = None, workers: int = None, max_retries: int = None):
+        self.bot = bot
+        global_rate = global_rate or Config.TELEGRAM_GLOBAL_RATE
+        self.chat_rate = chat_rate or Config.TELEGRAM_CHAT_RATE
+        self.chat_burst = chat_burst or Config.TELEGRAM_CHAT_BURST
+        self.workers_count = workers or Config.SEND_QUEUE_WORKERS
+        self.max_retries = max_retries if max_retries is not None else Config.SEND_MAX_RETRIES
+        
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: OrderedDict[int, TokenBucket] = OrderedDict()  # от давно не писавших к недавним
+        self.chat_queues: Dict[int, deque] = {}
+        self.ready_chats: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        
+        # Метрики
+        self.depth = 0  # частей сообщений, ожидающих отправки
+        self.stats = {'sent': 0, 'failed': 0, 'retry_after': 0, 'dropped': 0}
+    
+    def start(self):
+        """Запускает воркеры (вызывается автоматически при первой отправке)"""
+        if self.workers:
+            return
+        self.ready_chats = asyncio.Queue()
+        self.workers = [
+            asyncio.create_task(self._worker(), name=f"send-queue-worker-{i}")
+            for i in range(self.workers_count)
+        ]
+        logger.info(f"Очередь отправки запущена: {self.workers_count} воркеров")
+    
+    async def close(self, timeout: float = 10.0):
+        """
+        Дожидается отправки очереди (не дольше timeout) и останавливает воркеры.
+        Число неотправленных частей попадает в stats['dropped']
+        """
+        if not self.workers:
+            return
+        try:
+            if self.depth:
+                await asyncio.wait_for(self.ready_chats.join(), timeout)
+        except asyncio.TimeoutError:
+            self.stats['dropped'] += self.depth
+            logger.warning(f"Очередь отправки не опустела за {timeout:.1f} с, не отправлено частей: {self.depth}")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    def enqueue(self, chat_id: int, parts: List[str], reply_markup=None, **kwargs) -> asyncio.Future:
+        """Ставит сообщение (из одной или нескольких частей) в очередь чата"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        item = OutgoingMessage(chat_id, parts, reply_markup, kwargs, future)
+        
+        chat_queue = self.chat_queues.get(chat_id)
+        if chat_queue is None:
+            # Чат не в работе: заводим очередь и отдаем чат воркерам
+            self.chat_queues[chat_id] = deque([item])
+            self.ready_chats.put_nowait(chat_id)
+        else:
+            chat_queue.append(item)
+        
+        self.depth += len(parts)
+        return future
+    
+    async def send_message(self, chat_id: int, text: str, reply_markup=None, **kwargs) -> bool:
+        """Отправляет одно сообщение через очередь, возвращает успех"""
+        return await self.send_parts(chat_id, [text], reply_markup=reply_markup, **kwargs)
+    
+    async def send_parts(self, chat_id: int, parts: List[str], reply_markup=None, **kwargs) -> bool:
+        """Отправляет части сообщения по порядку, клавиатура прикрепляется к первой части"""
+        return await self.enqueue(chat_id, parts, reply_markup=reply_markup, **kwargs)
+    
+    async def _worker(self):
+        """Берет чат из очереди готовых и отправляет его первое сообщение"""
+        while True:
+            chat_id = await self.ready_chats.get()
+            chat_queue = self.chat_queues[chat_id]
+            item = chat_queue.popleft()
+            try:
+                success = await self._deliver(item)
+            except asyncio.CancelledError:
+                if not item.future.done():
+                    item.future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка в очереди отправки: {e}")
+                success = False
+            finally:
+                if chat_queue:
+                    self.ready_chats.put_nowait(chat_id)
+                else:
+                    del self.chat_queues[chat_id]
+                self.ready_chats.task_done()
+            
+            if not item.future.done():
+                item.future.set_result(success)
+    
+    async def _deliver(self, item: OutgoingMessage) -> bool:
+        """Отправляет все части сообщения с учетом лимитов"""
+        chat_bucket = self._get_chat_bucket(item.chat_id)
+        remaining = len(item.parts)
+        
+        try:
+            for i, part in enumerate(item.parts):
+                reply_markup = item.reply_markup if i == 0 else None
+                await self._send_with_retry(chat_bucket, item.chat_id, part, reply_markup, item.kwargs)
+                remaining -= 1
+                self.stats['sent'] += 1
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сообщения в чат {item.chat_id}: {e}")
+            self.stats['failed'] += 1
+            SEND_FAILURES.inc(type(e).__name__)
+            return False
+        finally:
+            self.depth -= len(item.parts)
+    
+    async def _send_with_retry(self, chat_bucket: TokenBucket, chat_id: int, text: str, reply_markup, kwargs: dict):
+        """Отправляет одну часть, повторяя при TelegramRetryAfter"""
+        attempt = 0
+        while True:
+            await self.acquire(chat_bucket)
+            try:
+                return await self.bot.send_message(chat_id, text, reply_markup=reply_markup, **kwargs)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.stats['retry_after'] += 1
+                logger.warning(f"Flood control в чате {chat_id}: ждем {e.retry_after} с (попытка {attempt})")
+                if attempt > self.max_retries:
+                    raise
+                self.flood_wait(chat_bucket, e.retry_after)
+    
+    def flood_wait(self, chat_bucket: TokenBucket, seconds: float):
+        """
+        Пауза после TelegramRetryAfter: и для чата, и для всего бота.
+        Flood control означает, что бот в целом превысил лимиты, - без общей паузы
+        другие чаты продолжали бы слать и продлевали бы блокировку
+        """
+        chat_bucket.block(seconds)
+        self.global_bucket.block(seconds)
+    
+    async def acquire(self, chat_bucket: TokenBucket):
+        """
+        Ждет свободный токен в глобальном bucket и в bucket чата.
+        Рассылки передают сюда свой bucket, чтобы делить глобальный лимит с ответами пользователям
+        """
+        while True:
+            now = time.monotonic()
+            wait = max(self.global_bucket.wait_time(now), chat_bucket.wait_time(now))
+            if wait <= 0:
+                self.global_bucket.consume()
+                chat_bucket.consume()
+                return
+            await asyncio.sleep(wait)
+    
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        """Возвращает bucket чата; сверх MAX_CHAT_BUCKETS забывает давно не писавшие чаты (LRU)"""
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is not None:
+            self.chat_buckets.move_to_end(chat_id)
+            return bucket
+        
+        bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self.chat_buckets[chat_id] = bucket
+        # Чаты с сообщениями в очереди не вытесняем: их bucket сейчас в работе
+        for _ in range(len(self.chat_buckets)):
+            if len(self.chat_buckets) <= self.MAX_CHAT_BUCKETS:
+                break
+            oldest, oldest_bucket = self.chat_buckets.popitem(last=False)
+            if oldest in self.chat_queues:
+                self.chat_buckets[oldest] = oldest_bucket
+        return bucket
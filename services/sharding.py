@@ -0,0 +1,237 @@
+"""
+Запуск бота несколькими процессами-воркерами с шардированием по user_id
+
+Фронт-процесс принимает апдейты (long polling или webhook) в виде сырого JSON,
+без разбора моделями aiogram, и по хешу from_user.id отправляет каждый апдейт
+одному из N воркеров. Все апдейты пользователя попадают в один и тот же воркер,
+поэтому история диалога в памяти остается согласованной без общих блокировок.
+Контакты и счетчики воркеры пишут в общие локальные файлы (flock, SQLite)
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+from typing import List, Optional
+
+import aiohttp
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+
+from settings.config import Config
+from services.log_pipeline import log_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Типы апдейтов, в которых может быть отправитель
+USER_UPDATE_KEYS = (
+    'message', 'edited_message', 'callback_query', 'inline_query',
+    'chosen_inline_result', 'my_chat_member', 'chat_member', 'chat_join_request',
+    'shipping_query', 'pre_checkout_query', 'poll_answer'
+)
+
+def extract_user_id(update: dict) -> int:
+    """Возвращает id отправителя из сырого апдейта (0, если отправителя нет)"""
+    for key in USER_UPDATE_KEYS:
+        event = update.get(key)
+        if event:
+            user = event.get('from') or event.get('user') or {}
+            return user.get('id', 0)
+    return 0
+
+def shard_for(user_id: int, workers: int) -> int:
+    """Номер воркера для пользователя (стабилен между перезапусками)"""
+    return user_id % workers
+
+def run_worker(index: int, queue: multiprocessing.Queue, log_queue: multiprocessing.Queue):
+    """Точка входа процесса-воркера"""
+    # Остановкой воркеров управляет фронт: он прекращает прием апдейтов и присылает None,
+    # а воркер дообрабатывает все, что уже получил. Поэтому сигналы, пришедшие всей
+    # группе процессов (Ctrl+C в терминале, systemd), воркер игнорирует
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Записи уходят в очередь фронта, в консоль и файл их пишет слушатель фронта
+    log_pipeline.attach(log_queue)
+    try:
+        asyncio.run(_worker_loop(index, queue))
+    except KeyboardInterrupt:
+        pass
+
+async def _worker_loop(index: int, queue: multiprocessing.Queue):
+    """Получает апдейты из очереди фронта и передает их в диспетчер aiogram"""
+    import bot as app
+    from settings.production import ProductionConfig
+    from services.web_server import add_metrics_handler, create_web_app, start_web_server
+    
+    # О запуске бота админу сообщает и прерванные рассылки продолжает только первый воркер
+    await app.on_startup(notify_started=(index == 0), resume_broadcasts=(index == 0))
+    bot = app.container.tenant_registry.default.bot
+    runner = None
+    # Метрики у каждого воркера свои: Prometheus опрашивает воркеры как отдельные цели
+    if ProductionConfig.ENABLE_METRICS:
+        web_app = create_web_app(app.get_health_info)
+        add_metrics_handler(web_app, app.metrics)
+        runner = await start_web_server(web_app, Config.WEBAPP_HOST, ProductionConfig.WORKER_METRICS_PORT + index)
+    app.startup_profiler.mark_ready(f"worker-{index}")
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    logger.info(f"Воркер {index} готов к работе")
+    
+    try:
+        while True:
+            update = await loop.run_in_executor(None, queue.get)
+            if update is None:  # сигнал остановки от фронта
+                break
+            task = asyncio.create_task(app.dp.feed_raw_update(bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        # Начатые апдейты, фоновые задачи и очереди дообрабатывает on_shutdown
+        await app.on_shutdown(runner)
+        logger.info(f"Воркер {index} остановлен")
+
+class ShardedFront:
+    """Фронт-процесс: принимает апдейты и распределяет их по воркерам"""
+    
+    def __init__(self, workers: int):
+        self.workers_count = workers
+        self.context = multiprocessing.get_context('spawn')
+        self.queues: List[multiprocessing.Queue] = []
+        self.processes: List[multiprocessing.Process] = []
+        self.routed = [0] * workers
+        # Тот же сервер Bot API, что и у сессии воркеров (TELEGRAM_API_URL - локальный сервер или тестовый стенд)
+        server = TelegramAPIServer.from_base(Config.TELEGRAM_API_URL) if Config.TELEGRAM_API_URL else PRODUCTION
+        self.api_url = server.api_url(Config.TELEGRAM_BOT_TOKEN, '').rstrip('/')
+    
+    def start_workers(self):
+        """Запускает процессы-воркеры"""
+        # Глобальный лимит Telegram делится между воркерами
+        os.environ['TELEGRAM_GLOBAL_RATE'] = str(Config.TELEGRAM_GLOBAL_RATE / self.workers_count)
+        
+        for index in range(self.workers_count):
+            queue = self.context.Queue()
+            process = self.context.Process(
+                target=run_worker, args=(index, queue, log_pipeline.queue), name=f"bot-worker-{index}"
+            )
+            process.start()
+            self.queues.append(queue)
+            self.processes.append(process)
+        logger.info(f"Запущено воркеров: {self.workers_count}")
+    
+    def stop_workers(self, timeout: float = None):
+        """Останавливает воркеры: они дообрабатывают полученные апдейты и завершаются"""
+        timeout = timeout if timeout is not None else Config.SHUTDOWN_DRAIN_TIMEOUT + Config.SHUTDOWN_CRITICAL_TIMEOUT + 5
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                # SIGTERM воркер игнорирует, поэтому завершаем его через SIGKILL
+                logger.warning(f"Воркер {process.name} не завершился за {timeout} с, останавливаем принудительно")
+                process.kill()
+    
+    def route(self, update: dict):
+        """Отправляет апдейт воркеру, отвечающему за пользователя"""
+        index = shard_for(extract_user_id(update), self.workers_count)
+        self.queues[index].put(update)
+        self.routed[index] += 1
+    
+    def health_info(self) -> dict:
+        """Состояние воркеров для /health"""
+        return {
+            'mode': Config.BOT_MODE,
+            'workers': self.workers_count,
+            'workers_alive': sum(process.is_alive() for process in self.processes),
+            'routed': self.routed
+        }
+    
+    async def run_polling(self):
+        """Long polling без разбора апдейтов: сырой JSON сразу уходит воркерам"""
+        from services.shutdown import shutdown
+        
+        shutdown.install_signal_handlers()
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await session.post(f"{self.api_url}/deleteWebhook")
+            logger.info("Фронт запущен в режиме long polling")
+            # По SIGTERM/SIGINT прерываем ожидание getUpdates, апдейты уже у воркеров
+            await shutdown.run_until_stopped(self._poll(session))
+    
+    async def _poll(self, session: aiohttp.ClientSession):
+        """Цикл getUpdates: апдейты сразу рассылаются воркерам"""
+        offset: Optional[int] = None
+        while True:
+            params = {'timeout': 30}
+            if offset is not None:
+                params['offset'] = offset
+            try:
+                async with session.get(f"{self.api_url}/getUpdates", params=params) as response:
+                    data = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Ошибка при получении апдейтов: {e}")
+                await asyncio.sleep(1)
+                continue
+            
+            if not data.get('ok'):
+                retry_after = data.get('parameters', {}).get('retry_after', 1)
+                logger.error(f"Telegram вернул ошибку: {data.get('description')}")
+                await asyncio.sleep(retry_after)
+                continue
+            
+            for update in data['result']:
+                offset = update['update_id'] + 1
+                self.route(update)
+    
+    async def run_webhook(self):
+        """Webhook: проверяем секрет, отвечаем Telegram сразу и передаем апдейт воркеру"""
+        from aiohttp import web
+        from services.shutdown import shutdown
+        from services.web_server import create_web_app, start_web_server
+        
+        shutdown.install_signal_handlers()
+        if not Config.WEBHOOK_BASE_URL:
+            raise ValueError("WEBHOOK_BASE_URL не найден в .env файле (обязателен для BOT_MODE=webhook)")
+        secret_token = Config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        
+        async def handle_update(request: web.Request) -> web.Response:
+            if not secrets.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret_token):
+                return web.Response(status=401, text='Unauthorized')
+            self.route(await request.json())
+            return web.Response()
+        
+        app = create_web_app(self.health_info)
+        app.router.add_post(Config.WEBHOOK_PATH, handle_update)
+        runner = await start_web_server(app, Config.WEBAPP_HOST, Config.WEBAPP_PORT)
+        
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{self.api_url}/setWebhook", json={
+                    'url': Config.WEBHOOK_BASE_URL.rstrip('/') + Config.WEBHOOK_PATH,
+                    'secret_token': secret_token
+                }) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"Не удалось установить webhook: {await response.text()}")
+            logger.info("Фронт запущен в режиме webhook")
+            # До SIGTERM/SIGINT; после него webhook отвечает 503, и Telegram повторит апдейты позже
+            await shutdown.wait()
+        finally:
+            await runner.cleanup()
+
+def run_sharded(workers: int, mode: str = 'polling'):
+    """Запускает фронт и воркеры; блокирует до остановки"""
+    Config.validate()
+    # Воркерам нужна межпроцессная очередь логов (run.py создает ее сам)
+    log_pipeline.start(multiprocess=True)
+    
+    # Фронт принимает апдейты одного бота из .env, мультиарендный режим здесь не поддерживается
+    if Config.uses_tenants_file():
+        raise ValueError("BOT_WORKERS > 1 несовместим с TENANTS_FILE: шардирование работает только с одним ботом")
+    
+    front = ShardedFront(workers)
+    front.start_workers()
+    try:
+        asyncio.run(front.run_webhook() if mode == 'webhook' else front.run_polling())
+    except KeyboardInterrupt:
+        logger.info("Фронт остановлен")
+    finally:
+        front.stop_workers()
@@ -0,0 +1,119 @@
+"""
+Локальное хранилище общего состояния, доступное из нескольких процессов бота
+
+SQLite не трогается из цикла событий: прибавки к счетчикам копятся в памяти
+и раз в FLUSH_INTERVAL секунд пишутся пачкой в отдельном потоке (при нескольких
+воркерах запись может ждать блокировку базы до 5 с). Туда же уходит чтение
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+# Как часто накопленные прибавки пишутся в базу, секунд
+FLUSH_INTERVAL = 2.0
+
+logger = logging.getLogger(__name__)
+
+class SharedStore:
+    """
+    Счетчики в SQLite (режим WAL): корректно работают, когда бот запущен
+    несколькими процессами-воркерами на одной машине
+    """
+    
+    def __init__(self, path: str = "data/shared_state.db"):
+        self.path = path
+        self._local = threading.local()  # у каждого потока свое соединение
+        # Все обращения к базе по очереди выполняет один поток: чтение видит прибавки, отданные до него
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shared-store-db')
+        self.pending: Dict[str, int] = defaultdict(int)  # еще не записанные прибавки
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, создавая его при необходимости"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+    
+    def incr(self, key: str, amount: int = 1):
+        """Увеличивает счетчик. Только память: в базу прибавка попадет пачкой через FLUSH_INTERVAL секунд"""
+        self.pending[key] += amount
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(FLUSH_INTERVAL, self._submit_pending)
+    
+    def _write(self, batch: Dict[str, int]):
+        """Атомарно прибавляет пачку к счетчикам (в потоке базы)"""
+        connection = self._connection()
+        try:
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT INTO counters (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                batch.items()
+            )
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при обновлении счетчиков {', '.join(batch)}: {e}")
+            try:
+                connection.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+    
+    def _submit_pending(self) -> Optional[Future]:
+        """Отдает накопленные прибавки потоку базы"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.pending:
+            return None
+        batch, self.pending = dict(self.pending), defaultdict(int)
+        return self._executor.submit(self._write, batch)
+    
+    async def flush(self):
+        """Записывает накопленные прибавки и ждет записи (при остановке бота)"""
+        future = self._submit_pending()
+        if future is not None:
+            await asyncio.wrap_future(future)
+    
+    async def get(self, key: str) -> int:
+        """Возвращает значение счетчика (0, если его еще нет) вместе с прибавками этого процесса"""
+        self._submit_pending()
+        return await asyncio.wrap_future(self._executor.submit(self._get, key))
+    
+    def _get(self, key: str) -> int:
+        try:
+            row = self._connection().execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else 0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при чтении счетчика {key}: {e}")
+            return 0
+    
+    async def get_prefix(self, prefix: str) -> Dict[str, int]:
+        """Возвращает все счетчики с заданным префиксом (без префикса в ключах)"""
+        self._submit_pending()
+        return await asyncio.wrap_future(self._executor.submit(self._get_prefix, prefix))
+    
+    def _get_prefix(self, prefix: str) -> Dict[str, int]:
+        try:
+            rows = self._connection().execute(
+                "SELECT key, value FROM counters WHERE key LIKE ?", (prefix + '%',)
+            ).fetchall()
+            return {key[len(prefix):]: value for key, value in rows}
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при чтении счетчиков {prefix}: {e}")
+            return {}
+
+# Глобальный экземпляр хранилища
+shared_store = SharedStore()
@@ -0,0 +1,143 @@
+"""
+Плавная остановка бота по SIGTERM/SIGINT
+
+При сигнале бот перестает принимать новые апдейты (polling останавливается,
+webhook отвечает 503 - Telegram повторит доставку уже новому экземпляру),
+дообрабатывает начатые апдейты и фоновые задачи, отправляет очереди сообщений
+и уведомлений. Все это укладывается в общий срок SHUTDOWN_DRAIN_TIMEOUT,
+а в конце в лог пишется отчет о том, что пришлось бросить
+"""
+import asyncio
+import logging
+import signal
+import time
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+class GracefulShutdown:
+    """Состояние остановки: сигнал, общий срок и учет апдейтов в обработке"""
+    
+    def __init__(self):
+        self.stopping = False
+        self.reason = ''
+        self.deadline: Optional[float] = None
+        self.stop_event = asyncio.Event()
+        self.updates: Set[asyncio.Task] = set()  # задачи, обрабатывающие апдейты прямо сейчас
+    
+    def install_signal_handlers(self):
+        """Перехватывает SIGTERM и SIGINT в текущем цикле событий (вместо KeyboardInterrupt)"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            # На Windows обработчики сигналов в цикле событий не поддерживаются
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, self.request_stop, sig.name)
+    
+    def request_stop(self, reason: str = 'stop'):
+        """Начинает остановку: новые апдейты больше не принимаются"""
+        if self.stopping:
+            logger.warning(f"Повторный запрос остановки ({reason}): остановка уже идет, осталось {self.remaining():.1f} с")
+            return
+        self.stopping = True
+        self.reason = reason
+        logger.info(f"Остановка бота ({reason}): прекращаем прием апдейтов и дообрабатываем начатое")
+        self.stop_event.set()
+    
+    async def wait(self):
+        """Ждет сигнала остановки"""
+        await self.stop_event.wait()
+    
+    async def run_until_stopped(self, coro: Coroutine, stop: Callable[[], Awaitable] = None):
+        """
+        Выполняет coro до ее завершения или до сигнала остановки.
+        При сигнале вызывает stop (например, dp.stop_polling), а без него отменяет coro
+        """
+        if self.stopping:
+            # Сигнал пришел еще во время запуска - не начинаем прием апдейтов
+            coro.close()
+            return
+        task = asyncio.ensure_future(coro)
+        waiter = asyncio.create_task(self.wait())
+        try:
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        if not task.done():
+            if stop:
+                await stop()
+            else:
+                task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    
+    def start_deadline(self, timeout: float):
+        """Начинает отсчет общего срока на дообработку (один раз за остановку)"""
+        if self.deadline is None:
+            self.deadline = time.monotonic() + timeout
+    
+    def remaining(self) -> float:
+        """Сколько секунд осталось до общего срока остановки"""
+        if self.deadline is None:
+            return 0.0
+        return max(0.0, self.deadline - time.monotonic())
+    
+    async def drain_updates(self, timeout: float) -> int:
+        """Дожидается обработки начатых апдейтов не дольше timeout; возвращает число отмененных"""
+        if not self.updates:
+            return 0
+        done, pending = await asyncio.wait(set(self.updates), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Апдейтов не обработано за {timeout:.1f} с и отменено: {len(pending)}")
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+    
+    def report(self, dropped: Dict[str, Any]) -> str:
+        """Пишет в лог итог остановки: что успели и что пришлось бросить"""
+        lost = {name: value for name, value in dropped.items() if value}
+        if lost:
+            details = ', '.join(f"{name}: {value}" for name, value in lost.items())
+            message = f"Остановка завершена с потерями - {details}"
+            logger.warning(message)
+        else:
+            message = "Остановка завершена, все начатое дообработано"
+            logger.info(message)
+        return message
+
+class UpdateTrackingMiddleware(BaseMiddleware):
+    """Регистрирует апдейты в обработке, чтобы при остановке дождаться их завершения"""
+    
+    def __init__(self, shutdown: GracefulShutdown):
+        self.shutdown = shutdown
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Апдейт уже подтвержден Telegram: aiogram запрашивает следующую порцию getUpdates,
+        # не дожидаясь обработки, а webhook отвечает сразу. Брошенный апдейт не придет повторно,
+        # поэтому при остановке начатые апдейты дообрабатываются
+        task = asyncio.current_task()
+        self.shutdown.updates.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self.shutdown.updates.discard(task)
+
+def dropped_background(names: List[str]) -> str:
+    """Краткая запись отмененных фоновых задач для отчета: имена без id пользователей с количеством"""
+    counts: Dict[str, int] = {}
+    for name in names:
+        kind = name.split('-')[0]
+        counts[kind] = counts.get(kind, 0) + 1
+    return ', '.join(f"{kind} x{count}" for kind, count in sorted(counts.items()))
+
+# Глобальное состояние остановки
+shutdown = GracefulShutdown()
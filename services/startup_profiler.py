@@ -0,0 +1,166 @@
+"""
+Профиль старта бота: время импорта модулей, создания сервисов и этапов запуска
+
+Этапы запуска (прогрев, запуск очередей) и создание сервисов контейнера
+записываются всегда - это дешево, а при готовности бот пишет в лог, за сколько
+секунд от запуска процесса он начал принимать апдейты. В режиме
+run.py --profile-startup дополнительно ставится хук импорта, который меряет
+собственное время импорта каждого модуля (как python -X importtime), а после
+готовности печатается отчет и бот завершается
+"""
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def process_age() -> Optional[float]:
+    """Сколько секунд назад запущен процесс (Linux, /proc), иначе None"""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # Имя процесса в скобках может содержать пробелы - поля считаем после ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        started_ticks = int(fields[19])
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - started_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class _TimingLoader:
+    """Обертка загрузчика модуля: меряет выполнение модуля за вычетом вложенных импортов"""
+    
+    def __init__(self, loader, profiler: 'StartupProfiler', name: str):
+        self._loader = loader
+        self._profiler = profiler
+        self._name = name
+    
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+    
+    def exec_module(self, module):
+        stack = self._profiler.import_stack()
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - started
+            nested = stack.pop()
+            self._profiler.imports[self._name] = (total - nested, total)
+            if stack:
+                stack[-1] += total
+    
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """Находит модуль остальными искателями sys.meta_path и подменяет его загрузчик на замеряющий"""
+    
+    def __init__(self, profiler: 'StartupProfiler'):
+        self.profiler = profiler
+    
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module') and spec.has_location:
+                spec.loader = _TimingLoader(spec.loader, self.profiler, fullname)
+            return spec
+        return None
+
+class StartupProfiler:
+    """Собирает тайминги старта и строит отчет"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.profile_mode = False  # run.py --profile-startup: отчет и выход после готовности
+        self.imports: Dict[str, Tuple[float, float]] = {}  # модуль -> (собственное время, с вложенными)
+        self._local = threading.local()  # стек вложенных импортов у каждого потока свой
+        self.phases: List[Tuple[str, float]] = []
+        self.ready_time: Optional[float] = None
+        self.ready_mode = ''
+        self._finder: Optional[_TimingFinder] = None
+    
+    def import_stack(self) -> List[float]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+    
+    def enable(self):
+        """Включает режим профилирования старта и замер импортов (вызывать до импорта бота)"""
+        self.profile_mode = True
+        if self._finder is None:
+            self._finder = _TimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+    
+    def disable_import_timing(self):
+        if self._finder is not None and self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+    
+    @contextmanager
+    def phase(self, name: str):
+        """Отмечает этап запуска: with startup_profiler.phase("warm_up"): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+    
+    def mark_ready(self, mode: str) -> float:
+        """Бот готов принимать апдейты; возвращает время от запуска процесса (или от импорта модуля)"""
+        self.disable_import_timing()
+        since_import = time.perf_counter() - self.started
+        age = process_age()
+        self.ready_time = age if age is not None and age >= since_import else since_import
+        self.ready_mode = mode
+        logger.info(f"Бот готов к приему апдейтов ({mode}) через {self.ready_time:.2f} с после запуска процесса")
+        return self.ready_time
+    
+    def report(self, init_times: Dict[str, float], limit: int = 20) -> str:
+        """Текстовый отчет: импорт по модулям и пакетам, создание сервисов, этапы запуска"""
+        if self.ready_time is None:
+            lines = ["Готовность не достигнута"]
+        else:
+            lines = [f"Старт до готовности ({self.ready_mode}): {self.ready_time:.3f} с от запуска процесса"]
+        
+        if self.imports:
+            total_import = sum(own for own, _ in self.imports.values())
+            lines.append("")
+            lines.append(f"Импорт модулей: {total_import:.3f} с, модулей: {len(self.imports)}")
+            packages = defaultdict(float)
+            for name, (own, _) in self.imports.items():
+                packages[name.split('.')[0]] += own
+            lines.append("По пакетам:")
+            for package, own in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:limit]:
+                lines.append(f"  {own * 1000:9.1f} мс  {package}")
+            lines.append("Самые долгие модули (собственное время / с вложенными импортами):")
+            ranked = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+            for name, (own, total) in ranked:
+                lines.append(f"  {own * 1000:9.1f} мс / {total * 1000:9.1f} мс  {name}")
+        
+        if init_times:
+            lines.append("")
+            lines.append("Создание сервисов (с вложенными сервисами):")
+            for name, seconds in sorted(init_times.items(), key=lambda item: item[1], reverse=True):
+                lines.append(f"  {seconds * 1000:9.1f} мс  {name}")
+        
+        if self.phases:
+            lines.append("")
+            lines.append("Этапы запуска:")
+            for name, seconds in self.phases:
+                lines.append(f"  {seconds * 1000:9.1f} мс  {name}")
+        return '\n'.join(lines)
+
+# Глобальный профилировщик старта
+startup_profiler = StartupProfiler()
@@ -0,0 +1,56 @@
+"""
+HTTP-сессия aiogram с оптимизациями для бота
+"""
+from aiohttp import ClientSession, FormData
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import Bot, __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import TelegramMethod
+
+from components.keyboards import Keyboards
+from settings.config import Config
+from services.http_pools import telegram_connector_options, create_telegram_trace_config
+
+class BotSession(AiohttpSession):
+    """
+    Сессия с настроенным пулом соединений (лимит, keep-alive, кэш DNS),
+    подсчетом переиспользования соединений и заранее сериализованными клавиатурами
+    """
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('timeout', Config.TELEGRAM_REQUEST_TIMEOUT)
+        # Локальный Bot API сервер (или тестовый стенд) вместо api.telegram.org
+        if Config.TELEGRAM_API_URL:
+            kwargs.setdefault('api', TelegramAPIServer.from_base(Config.TELEGRAM_API_URL))
+        super().__init__(**kwargs)
+        self._connector_init.update(telegram_connector_options())
+        self._trace_config = create_telegram_trace_config()
+    
+    async def create_session(self) -> ClientSession:
+        # Повторяет AiohttpSession.create_session из aiogram 3.2 (поля _session, _connector_type,
+        # _should_reset_connector): trace_configs передаются только в конструктор ClientSession.
+        # Поэтому версия aiogram закреплена в requirements.txt
+        if self._should_reset_connector:
+            await self.close()
+        
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[self._trace_config]
+            )
+            self._should_reset_connector = False
+        
+        return self._session
+    
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        reply_markup = getattr(method, 'reply_markup', None)
+        serialized_markup = Keyboards.get_serialized(reply_markup) if reply_markup is not None else None
+        if serialized_markup is None:
+            return super().build_form_data(bot, method)
+        # Остальные поля собирает aiogram; пустые значения он пропускает, клавиатуру добавляем готовой
+        form = super().build_form_data(bot, method.model_copy(update={'reply_markup': None}))
+        form.add_field('reply_markup', serialized_markup)
+        return form
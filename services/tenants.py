@@ -0,0 +1,172 @@
+"""
+Мультиарендный режим: несколько брендов (ботов) в одном процессе
+
+Каждый арендатор получает свой токен, базу знаний, промпт, чат админа,
+историю диалогов, контакты и очередь отправки. Общими остаются цикл событий,
+HTTP-сессия Telegram и клиент ИИ (пул соединений к OpenRouter)
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import TelegramObject
+
+from settings.config import Config
+from settings.prompts import SYSTEM_PROMPT
+from services.contact_manager import ContactManager
+from services.history_manager import HistoryManager
+from services.knowledge_service import KnowledgeService
+from services.notification_service import NotificationService
+from services.send_queue import SendQueue
+from services.typing_manager import TypingManager
+
+logger = logging.getLogger(__name__)
+
+class Tenant:
+    """Арендатор (бренд): бот и все его изолированное состояние"""
+    
+    def __init__(self, name: str, token: str, session: BaseSession, admin_chat_id: str,
+                 system_prompt: str = SYSTEM_PROMPT, data_dir: str = "data",
+                 knowledge_service: KnowledgeService = None, history_manager: HistoryManager = None):
+        self.name = name
+        self.admin_chat_id = str(admin_chat_id or '')
+        self.system_prompt = system_prompt
+        
+        self.bot = Bot(token=token, session=session)
+        self.knowledge_service = knowledge_service or KnowledgeService()
+        self.history_manager = history_manager or HistoryManager()
+        self.contact_manager = ContactManager(data_dir)
+        self.send_queue = SendQueue(self.bot)
+        self.typing_manager = TypingManager(self.bot)
+        self.notification_service = NotificationService(self.bot, self.send_queue, admin_chat_id=self.admin_chat_id)
+    
+    def is_admin(self, user_id: int) -> bool:
+        """Проверяет, является ли пользователь админом этого арендатора"""
+        return bool(self.admin_chat_id) and str(user_id) == self.admin_chat_id
+    
+    def is_operator(self, user_id: int) -> bool:
+        """
+        Оператор - ADMIN_CHAT_ID из .env: видит отчеты о процессе целиком (цикл событий,
+        фоновые задачи, память), общие для всех арендаторов
+        """
+        return bool(Config.ADMIN_CHAT_ID) and str(user_id) == str(Config.ADMIN_CHAT_ID)
+    
+    def counter_key(self, name: str) -> str:
+        """Ключ счетчика в общем хранилище с префиксом арендатора (у арендатора по умолчанию - без префикса)"""
+        if self.name == 'default':
+            return name
+        return f"{self.name}:{name}"
+    
+    async def start(self, notify_started: bool = True):
+        """Запускает фоновые сервисы арендатора"""
+        self.send_queue.start()
+        if notify_started:
+            await self.notification_service.notify_bot_started()
+    
+    async def close(self, timeout: float = 10.0):
+        """Останавливает фоновые сервисы арендатора, дожидаясь отправки очередей не дольше timeout секунд"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        await self.typing_manager.close()
+        # Уведомления уходят через очередь отправки, поэтому она закрывается последней
+        await self.notification_service.close(max(0.0, deadline - loop.time()))
+        await self.send_queue.close(max(0.0, deadline - loop.time()))
+
+class TenantRegistry:
+    """
+    Реестр арендаторов.
+    Без файла TENANTS_FILE работает один арендатор "default" из настроек .env
+    """
+    
+    def __init__(self, tenants: List[Tenant]):
+        if not tenants:
+            raise ValueError("Не задан ни один арендатор")
+        self.tenants = tenants
+        self.by_bot_id: Dict[int, Tenant] = {tenant.bot.id: tenant for tenant in tenants}
+    
+    @property
+    def default(self) -> Tenant:
+        """Первый (или единственный) арендатор"""
+        return self.tenants[0]
+    
+    def get(self, bot: Bot) -> Tenant:
+        """Возвращает арендатора по боту, получившему апдейт"""
+        return self.by_bot_id[bot.id]
+    
+    def bots(self) -> List[Bot]:
+        """Боты всех арендаторов"""
+        return [tenant.bot for tenant in self.tenants]
+    
+    @classmethod
+    def from_config(cls, session: BaseSession, knowledge_service: KnowledgeService = None,
+                    history_manager: HistoryManager = None, tenants_file: Optional[str] = None) -> "TenantRegistry":
+        """
+        Загружает арендаторов из JSON-файла вида:
+        [{"name": "brand", "token": "...", "knowledge_base": "knowledge_base/brand",
+          "admin_chat_id": "123", "system_prompt_file": "prompts/brand.txt"}]
+        Если файла нет, создает одного арендатора из .env с общими глобальными сервисами
+        """
+        tenants_file = tenants_file or Config.TENANTS_FILE
+        if not tenants_file or not os.path.exists(tenants_file):
+            return cls([Tenant(
+                name='default',
+                token=Config.TELEGRAM_BOT_TOKEN,
+                session=session,
+                admin_chat_id=Config.ADMIN_CHAT_ID,
+                knowledge_service=knowledge_service,
+                history_manager=history_manager
+            )])
+        
+        with open(tenants_file, 'r', encoding='utf-8') as f:
+            tenants_config = json.load(f)
+        
+        # Имя - ключ данных и счетчиков арендатора, токен - его бот: повторы смешали бы арендаторов
+        names, tokens = set(), set()
+        for item in tenants_config:
+            if item['name'] in names:
+                raise ValueError(f"Арендатор {item['name']} указан в {tenants_file} дважды")
+            if item['token'] in tokens:
+                raise ValueError(f"Токен арендатора {item['name']} в {tenants_file} уже занят другим арендатором")
+            names.add(item['name'])
+            tokens.add(item['token'])
+        
+        tenants = []
+        for item in tenants_config:
+            name = item['name']
+            system_prompt = SYSTEM_PROMPT
+            if item.get('system_prompt_file'):
+                with open(item['system_prompt_file'], 'r', encoding='utf-8') as f:
+                    system_prompt = f.read()
+            
+            tenants.append(Tenant(
+                name=name,
+                token=item['token'],
+                session=session,
+                admin_chat_id=item.get('admin_chat_id', ''),
+                system_prompt=system_prompt,
+                data_dir=item.get('data_dir', os.path.join('data', name)),
+                knowledge_service=KnowledgeService(item.get('knowledge_base', 'knowledge_base'))
+            ))
+        
+        logger.info(f"Загружено арендаторов: {len(tenants)} ({', '.join(t.name for t in tenants)})")
+        return cls(tenants)
+
+class TenantMiddleware(BaseMiddleware):
+    """Передает в обработчики арендатора, которому адресован апдейт (аргумент tenant)"""
+    
+    def __init__(self, get_registry: Callable[[], TenantRegistry]):
+        # Реестр создается лениво (при старте), а middleware регистрируется при импорте
+        self.get_registry = get_registry
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        data['tenant'] = self.get_registry().get(data['bot'])
+        return await handler(event, data)
@@ -0,0 +1,163 @@
+"""
+Трассировка этапов обработки апдейта
+
+Middleware открывает трассу на каждый отобранный (sampling) апдейт, а сервисы
+отмечают этапы через span("имя"). Трасса живет в contextvar, поэтому этапы
+фоновых задач (сохранение контакта, уведомление) попадают в ту же трассу.
+Трасса закрывается, когда завершились обработчик и все его фоновые задачи;
+если апдейт обрабатывался дольше порога, таймлайн пишется в лог и в файл трасс
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from settings.config import Config
+
+logger = logging.getLogger(__name__)
+
+class UpdateTrace:
+    """Таймлайн одного апдейта: список этапов со смещением от начала и длительностью"""
+    
+    __slots__ = ('update_id', 'user_id', 'started', 'spans', 'handler_time', 'holders', 'on_finish')
+    
+    def __init__(self, update_id: int, user_id: Optional[int], on_finish: Callable[['UpdateTrace', float], None]):
+        self.update_id = update_id
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.spans: List[tuple] = []  # (имя, начало от старта, длительность, ошибка)
+        self.handler_time = None
+        self.holders = 1  # обработчик апдейта + фоновые задачи, которые еще работают
+        self.on_finish = on_finish
+    
+    def hold(self) -> Callable[[], None]:
+        """Продлевает трассу на время фоновой задачи; возвращает функцию освобождения"""
+        self.holders += 1
+        return self.release
+    
+    def release(self):
+        self.holders -= 1
+        if self.holders == 0:
+            self.on_finish(self, time.perf_counter() - self.started)
+    
+    def to_dict(self, total: float) -> dict:
+        return {
+            'update_id': self.update_id,
+            'user_id': self.user_id,
+            'total_ms': round(total * 1000, 1),
+            'handler_ms': round(self.handler_time * 1000, 1) if self.handler_time is not None else None,
+            'spans': [
+                {'name': name, 'start_ms': round(start * 1000, 1), 'duration_ms': round(duration * 1000, 1),
+                 **({'error': error} if error else {})}
+                for name, start, duration, error in self.spans
+            ]
+        }
+
+# Трасса текущего апдейта (None - апдейт не попал в выборку или трассировка выключена)
+current_trace: ContextVar[Optional[UpdateTrace]] = ContextVar('current_trace', default=None)
+
+class Span:
+    """Этап обработки апдейта; без активной трассы ничего не записывает"""
+    
+    __slots__ = ('name', 'trace', 'started')
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.trace = None
+    
+    def __enter__(self):
+        self.trace = current_trace.get()
+        if self.trace is not None:
+            self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        trace = self.trace
+        if trace is not None:
+            now = time.perf_counter()
+            trace.spans.append((self.name, self.started - trace.started, now - self.started,
+                                exc_type.__name__ if exc_type else None))
+        return False
+
+def span(name: str) -> Span:
+    """
+    Отмечает этап обработки: with span("openrouter"): ...
+    Работает и в синхронном, и в асинхронном коде
+    """
+    return Span(name)
+
+def hold_current_trace() -> Optional[Callable[[], None]]:
+    """Продлевает текущую трассу на время фоновой задачи (см. BackgroundTasks.spawn)"""
+    trace = current_trace.get()
+    return trace.hold() if trace is not None else None
+
+class SlowUpdateRecorder:
+    """Пишет трассы медленных апдейтов в лог (структурированно) и в файл JSON lines"""
+    
+    def __init__(self, threshold: float = None, trace_file: str = None):
+        self.threshold = threshold if threshold is not None else Config.TRACE_SLOW_THRESHOLD
+        self.trace_file = trace_file if trace_file is not None else Config.TRACE_FILE
+        self.stats = {'traced': 0, 'slow': 0}
+    
+    def __call__(self, trace: UpdateTrace, total: float):
+        self.stats['traced'] += 1
+        if total < self.threshold:
+            return
+        self.stats['slow'] += 1
+        
+        record = trace.to_dict(total)
+        record['time'] = datetime.now().isoformat(timespec='milliseconds')
+        logger.warning(f"Медленный апдейт {trace.update_id}: {record['total_ms']} мс "
+                       f"{json.dumps(record['spans'], ensure_ascii=False)}", extra={'trace': record})
+        
+        if self.trace_file:
+            try:
+                asyncio.get_running_loop().run_in_executor(None, self._append, record)
+            except RuntimeError:
+                self._append(record)
+    
+    def _append(self, record: dict):
+        try:
+            os.makedirs(os.path.dirname(self.trace_file) or '.', exist_ok=True)
+            with open(self.trace_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.error(f"Ошибка при записи трассы в {self.trace_file}: {e}")
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает трассу для доли апдейтов TRACE_SAMPLE_RATE и закрывает ее после обработчика"""
+    
+    def __init__(self, sample_rate: float = None, recorder: SlowUpdateRecorder = None):
+        self.sample_rate = sample_rate if sample_rate is not None else Config.TRACE_SAMPLE_RATE
+        self.recorder = recorder or SlowUpdateRecorder()
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return await handler(event, data)
+        
+        user = data.get('event_from_user')
+        trace = UpdateTrace(
+            update_id=event.update_id if isinstance(event, Update) else 0,
+            user_id=user.id if user else None,
+            on_finish=self.recorder
+        )
+        token = current_trace.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            trace.handler_time = time.perf_counter() - trace.started
+            current_trace.reset(token)
+            trace.release()
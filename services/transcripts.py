@@ -0,0 +1,158 @@
+"""
+Переписки пользователей для офлайн-обработки: запись в лог и чтение выгрузок
+
+При LOG_TRANSCRIPTS=true бот пишет каждое текстовое сообщение пользователя
+в логгер transcripts одной строкой JSON (через общий конвейер логов, с ротацией).
+read_messages потоково читает такие логи (текстовые и LOG_FORMAT=json), файлы
+JSON Lines с полями user_id и text (или content, как в истории диалога) и
+экспорт чатов Telegram Desktop (result.json). Используется backfill_contacts.py
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+from typing import Iterator, List, Optional, Tuple
+
+TRANSCRIPT_LOGGER = 'transcripts'
+# В текстовом формате лога запись переписки выглядит как "... - transcripts - INFO - {...}"
+TEXT_LOG_MARKER = f" - {TRANSCRIPT_LOGGER} - INFO - "
+# Сколько байт начала файла сверяется, чтобы отличить его от другого файла с тем же inode
+HEADER_SIZE = 4096
+
+transcript_logger = logging.getLogger(TRANSCRIPT_LOGGER)
+
+class TranscriptMessage:
+    """Сообщение пользователя из переписки"""
+    
+    __slots__ = ('tenant', 'user_id', 'first_name', 'last_name', 'username', 'text')
+    
+    def __init__(self, user_id: int, text: str, tenant: Optional[str] = None, first_name: str = '',
+                 last_name: str = '', username: str = ''):
+        self.user_id = user_id
+        self.text = text
+        self.tenant = tenant  # None - арендатор неизвестен (экспорт, сторонняя выгрузка)
+        self.first_name = first_name
+        self.last_name = last_name
+        self.username = username
+
+def log_message(tenant: str, user, text: str):
+    """Пишет сообщение пользователя в лог переписок (user - from_user апдейта)"""
+    transcript_logger.info(json.dumps({
+        'tenant': tenant,
+        'user_id': user.id,
+        'first_name': user.first_name or '',
+        'last_name': user.last_name or '',
+        'username': user.username or '',
+        'text': text
+    }, ensure_ascii=False))
+
+def expand_sources(paths: List[str]) -> List[str]:
+    """Файлы для обработки: пути, маски и каталоги (из каталога берутся *.json, *.jsonl и *.log*)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in ('*.json', '*.jsonl', '*.log*'):
+                files.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        else:
+            files.extend(sorted(glob.glob(path)) or [path])
+    # Порядок сохраняем, повторы убираем
+    return list(dict.fromkeys(os.path.abspath(path) for path in files))
+
+def file_key(path: str) -> str:
+    """
+    Ключ файла - устройство и inode: не меняется, когда лог дописывается или
+    переименовывается при ротации (bot.log -> bot.log.1), поэтому позиция
+    обработки привязывается к файлу, а не к имени
+    """
+    stat = os.stat(path)
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+def fingerprint(path: str, size: Optional[int] = None) -> Tuple[int, str]:
+    """
+    (размер, SHA-1) начала файла. Без size берутся целые строки из первых
+    HEADER_SIZE байт: дописывание в конец их не меняет (файл без переводов строк,
+    например сжатый JSON, берется целиком). С size хэшируются ровно size байт -
+    так проверяется, что под тем же inode все еще тот же файл
+    """
+    with open(path, 'rb') as f:
+        if size is not None:
+            return size, hashlib.sha1(f.read(size)).hexdigest()
+        header = f.read(HEADER_SIZE)
+    if b'\n' in header:
+        header = header[:header.rfind(b'\n') + 1]
+    return len(header), hashlib.sha1(header).hexdigest()
+
+def read_messages(path: str, bot_id: Optional[int] = None) -> Iterator[TranscriptMessage]:
+    """Сообщения пользователей из файла по порядку; bot_id - сообщения этого бота в экспорте пропускаются"""
+    if path.endswith('.json'):
+        yield from _read_telegram_export(path, bot_id)
+        return
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            message = _parse_line(line)
+            if message is not None:
+                yield message
+
+def _parse_line(line: str) -> Optional[TranscriptMessage]:
+    """Сообщение из строки JSON Lines или лога; строки без переписки - None"""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+        # Запись лога в формате json: переписка лежит в поле message
+        if data.get('logger') == TRANSCRIPT_LOGGER:
+            return _parse_line(data.get('message', ''))
+        return _from_record(data)
+    if TEXT_LOG_MARKER in line:
+        return _parse_line(line.split(TEXT_LOG_MARKER, 1)[1])
+    return None
+
+def _from_record(data: dict) -> Optional[TranscriptMessage]:
+    """Сообщение из записи JSON с полями user_id и text (content); ответы бота (role) пропускаются"""
+    text = data.get('text') or data.get('content')
+    user_id = data.get('user_id')
+    if not isinstance(text, str) or user_id is None or data.get('role', 'user') != 'user':
+        return None
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return TranscriptMessage(
+        user_id=user_id,
+        text=text,
+        tenant=data.get('tenant'),
+        first_name=data.get('first_name', ''),
+        last_name=data.get('last_name', ''),
+        username=data.get('username', '')
+    )
+
+def _read_telegram_export(path: str, bot_id: Optional[int]) -> Iterator[TranscriptMessage]:
+    """
+    Экспорт Telegram Desktop в JSON: один чат ({"messages": [...]}) или весь
+    аккаунт ({"chats": {"list": [...]}}). Файл читается целиком - так устроен формат
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        return
+    chats = data.get('chats', {}).get('list', []) if 'chats' in data else [data]
+    for chat in chats:
+        for item in chat.get('messages', []):
+            if item.get('type') != 'message' or not str(item.get('from_id', '')).startswith('user'):
+                continue
+            user_id = int(item['from_id'][4:])
+            text = _export_text(item.get('text', ''))
+            if user_id == bot_id or not text:
+                continue
+            yield TranscriptMessage(user_id=user_id, text=text, first_name=item.get('from') or '')
+
+def _export_text(text) -> str:
+    """Текст сообщения экспорта: строка или список фрагментов (строки и {"type": ..., "text": ...})"""
+    if isinstance(text, str):
+        return text
+    return ''.join(part if isinstance(part, str) else part.get('text', '') for part in text)
@@ -0,0 +1,77 @@
+"""
+Менеджер индикатора набора сообщения ("печатает...")
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+class TypingManager:
+    """
+    Держит индикатор набора в чате, пока идет обработка запроса.
+    Telegram показывает действие около 5 секунд, поэтому оно обновляется каждые ~4.5 с.
+    Пересекающиеся запросы в одном чате обслуживает одна общая задача
+    """
+    
+    def __init__(self, bot, interval: float = 4.5, action: str = "typing"):
+        self.bot = bot
+        self.interval = interval
+        self.action = action
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.counters: Dict[int, int] = {}
+    
+    @asynccontextmanager
+    async def typing(self, chat_id: int):
+        """Показывает индикатор набора, пока выполняется блок async with"""
+        self._acquire(chat_id)
+        try:
+            yield
+        finally:
+            self._release(chat_id)
+    
+    @property
+    def active_chats(self) -> int:
+        """Количество чатов, где сейчас показывается индикатор"""
+        return len(self.tasks)
+    
+    def _acquire(self, chat_id: int):
+        """Регистрирует запрос индикатора, при необходимости запускает задачу обновления"""
+        self.counters[chat_id] = self.counters.get(chat_id, 0) + 1
+        if chat_id not in self.tasks:
+            self.tasks[chat_id] = asyncio.create_task(
+                self._keep_typing(chat_id), name=f"typing-{chat_id}"
+            )
+    
+    def _release(self, chat_id: int):
+        """Снимает запрос; когда запросов в чате не осталось, задача обновления отменяется"""
+        count = self.counters.get(chat_id, 0) - 1
+        if count > 0:
+            self.counters[chat_id] = count
+            return
+        
+        self.counters.pop(chat_id, None)
+        task = self.tasks.pop(chat_id, None)
+        if task:
+            task.cancel()
+    
+    async def _keep_typing(self, chat_id: int):
+        """Отправляет действие чата каждые interval секунд до отмены"""
+        while True:
+            try:
+                await self.bot.send_chat_action(chat_id, self.action)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при отправке индикатора набора: {e}")
+            await asyncio.sleep(self.interval)
+    
+    async def close(self):
+        """Останавливает все задачи обновления индикатора"""
+        tasks = list(self.tasks.values())
+        self.tasks.clear()
+        self.counters.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,294 @@
+"""
+Учет токенов LLM по пользователям и дневные квоты
+
+Каждый запрос к LLM добавляет токены из response.usage и длительность запроса
+к строке "арендатор, пользователь, день" в SQLite. Одна строка на пользователя
+в день (таблица WITHOUT ROWID) держит хранилище компактным, а счетчики общими
+для процессов-воркеров. Строки текущего дня кэшируются в памяти, поэтому
+проверка квоты перед запросом к LLM не читает базу.
+
+SQLite не трогается из цикла событий: запросы копятся в памяти и раз в
+FLUSH_INTERVAL секунд пишутся пачкой в отдельном потоке, туда же уходят чтение
+расхода пользователя после перезапуска, очистка старых дней и отчеты.
+
+Мягкая квота (USER_TOKENS_SOFT_LIMIT) отвечает из базы знаний, когда там есть
+ответ, а LLM дает только короткие ответы. Жесткая (USER_TOKENS_HARD_LIMIT)
+до конца дня оставляет только базу знаний. Несколько активных пользователей
+не выбирают так лимиты OpenRouter у всех остальных
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from settings.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Состояние квоты пользователя
+QUOTA_OK = 'ok'
+QUOTA_SOFT = 'soft'
+QUOTA_HARD = 'hard'
+
+# Как часто записывать накопленный расход в базу, секунды
+FLUSH_INTERVAL = 2.0
+
+def day_number(day: date) -> int:
+    """День в виде числа YYYYMMDD (компактный ключ, сортируется как дата)"""
+    return day.year * 10000 + day.month * 100 + day.day
+
+class UserUsage:
+    """Расход пользователя за день"""
+    
+    __slots__ = ('prompt_tokens', 'completion_tokens', 'calls', 'latency')
+    
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0, calls: int = 0, latency: float = 0.0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.calls = calls
+        self.latency = latency  # суммарная длительность запросов, секунды
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+    
+    def describe(self) -> str:
+        """Краткая строка для отчетов: токены, вызовы, токенов на вызов, средняя задержка"""
+        per_call = self.total_tokens // self.calls if self.calls else 0
+        average = self.latency / self.calls if self.calls else 0.0
+        return (
+            f"{self.total_tokens} ток. ({self.prompt_tokens}/{self.completion_tokens}), "
+            f"вызовов {self.calls}, {per_call} ток./вызов, {average:.1f} с"
+        )
+
+class UsageTracker:
+    """Дневной расход токенов по пользователям в SQLite и проверка квот"""
+    
+    def __init__(self, path: str = "data/usage.db"):
+        self.path = path
+        self._local = threading.local()  # у каждого потока свое соединение
+        # Все обращения к базе по очереди выполняет один поток: цикл событий не ждет блокировок SQLite,
+        # а чтение видит все записи, поставленные в очередь до него
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='usage-db')
+        self.day: Optional[int] = None
+        # Расход за текущий день: (арендатор, пользователь) -> UserUsage
+        self.today: Dict[Tuple[str, int], UserUsage] = {}
+        # Еще не записанный в базу расход: (арендатор, пользователь, день) -> UserUsage
+        self.pending: Dict[Tuple[str, int, int], UserUsage] = {}
+        # Расход, добавленный, пока расход пользователя читается из базы (чтение его не увидит)
+        self._loading: Dict[Tuple[str, int], UserUsage] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, создавая его при необходимости"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "tenant TEXT NOT NULL, user_id INTEGER NOT NULL, day INTEGER NOT NULL, "
+                "prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+                "calls INTEGER NOT NULL, latency REAL NOT NULL, "
+                "PRIMARY KEY (tenant, day, user_id)) WITHOUT ROWID"
+            )
+            self._local.connection = connection
+        return connection
+    
+    def _current_day(self) -> int:
+        """Номер текущего дня; с началом нового дня сбрасывает кэш и удаляет старые строки"""
+        today = day_number(date.today())
+        if today != self.day:
+            self.day = today
+            self.today = {}
+            self._executor.submit(self._prune)
+        return today
+    
+    def _prune(self):
+        cutoff = day_number(date.today() - timedelta(days=Config.USAGE_RETENTION_DAYS))
+        try:
+            self._connection().execute("DELETE FROM usage WHERE day < ?", (cutoff,))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при удалении старой статистики токенов: {e}")
+    
+    def _load(self, tenant: str, user_id: int, day: int) -> UserUsage:
+        """Расход пользователя за день из базы (поток базы)"""
+        try:
+            row = self._connection().execute(
+                "SELECT prompt_tokens, completion_tokens, calls, latency FROM usage "
+                "WHERE tenant = ? AND day = ? AND user_id = ?", (tenant, day, user_id)
+            ).fetchone()
+            if row:
+                return UserUsage(*row)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при чтении расхода токенов пользователя {user_id}: {e}")
+        return UserUsage()
+    
+    def _write(self, batch: Dict[Tuple[str, int, int], UserUsage]):
+        """Добавляет накопленный расход к строкам базы одной транзакцией (поток базы)"""
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT INTO usage (tenant, user_id, day, prompt_tokens, completion_tokens, calls, latency) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(tenant, day, user_id) DO UPDATE SET "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "calls = calls + excluded.calls, latency = latency + excluded.latency",
+                [
+                    (tenant, user_id, day, usage.prompt_tokens, usage.completion_tokens, usage.calls, usage.latency)
+                    for (tenant, user_id, day), usage in batch.items()
+                ]
+            )
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при записи расхода токенов ({len(batch)} строк): {e}")
+            try:
+                connection.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+    
+    def _submit_pending(self) -> Optional[Future]:
+        """Отдает накопленный расход потоку базы"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.pending:
+            return None
+        batch, self.pending = self.pending, {}
+        return self._executor.submit(self._write, batch)
+    
+    async def _run(self, func, *args):
+        """Выполняет чтение в потоке базы после записи накопленного расхода"""
+        self._submit_pending()
+        return await asyncio.wrap_future(self._executor.submit(func, *args))
+    
+    def record(self, tenant: str, user_id: int, usage, duration: float):
+        """
+        Добавляет запрос к LLM (usage - response.usage, может отсутствовать) к дневному расходу
+        пользователя. Только память: в базу расход попадет пачкой через FLUSH_INTERVAL секунд
+        """
+        day = self._current_day()
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        targets = [self.pending.setdefault((tenant, user_id, day), UserUsage())]
+        # Расход пользователя, еще не прочитанный из базы, учтется при чтении
+        cached = self.today.get((tenant, user_id)) or self._loading.get((tenant, user_id))
+        if cached is not None:
+            targets.append(cached)
+        for target in targets:
+            target.prompt_tokens += prompt_tokens
+            target.completion_tokens += completion_tokens
+            target.calls += 1
+            target.latency += duration
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(FLUSH_INTERVAL, self._submit_pending)
+    
+    async def flush(self):
+        """Записывает накопленный расход и ждет записи (при остановке бота)"""
+        future = self._submit_pending()
+        if future is not None:
+            await asyncio.wrap_future(future)
+    
+    async def quota(self, tenant: str, user_id: int) -> str:
+        """
+        Состояние дневной квоты пользователя: ok, soft или hard (лимит 0 - квота выключена).
+        Расход берется из памяти; после перезапуска первый запрос пользователя за день читает его из базы
+        """
+        # Смена дня до обращения к кэшу: иначе вчерашняя жесткая квота держалась бы до первого record()
+        day = self._current_day()
+        key = (tenant, user_id)
+        usage = self.today.get(key)
+        if usage is None:
+            late = self._loading.setdefault(key, UserUsage())
+            loaded = await self._run(self._load, tenant, user_id, day)
+            if self._loading.get(key) is late:
+                del self._loading[key]
+            if self._current_day() != day:
+                # День сменился, пока шло чтение: прочитанное относится ко вчера
+                return await self.quota(tenant, user_id)
+            usage = self.today.get(key)
+            if usage is None:
+                loaded.prompt_tokens += late.prompt_tokens
+                loaded.completion_tokens += late.completion_tokens
+                loaded.calls += late.calls
+                loaded.latency += late.latency
+                usage = self.today[key] = loaded
+        used = usage.total_tokens
+        if Config.USER_TOKENS_HARD_LIMIT and used >= Config.USER_TOKENS_HARD_LIMIT:
+            return QUOTA_HARD
+        if Config.USER_TOKENS_SOFT_LIMIT and used >= Config.USER_TOKENS_SOFT_LIMIT:
+            return QUOTA_SOFT
+        return QUOTA_OK
+    
+    async def top_users(self, tenant: str, days: int = 1, limit: int = 10) -> List[Tuple[int, UserUsage]]:
+        """Пользователи с наибольшим расходом токенов за последние days дней (из базы - по всем процессам)"""
+        return await self._run(self._top_users, tenant, days, limit)
+    
+    async def daily_totals(self, tenant: str, days: int = 7) -> List[Tuple[int, int, UserUsage]]:
+        """Расход по дням за последние days дней: (день YYYYMMDD, пользователей, суммарный расход)"""
+        return await self._run(self._daily_totals, tenant, days)
+    
+    async def user_days(self, tenant: str, user_id: int, days: int = 7) -> List[Tuple[int, UserUsage]]:
+        """Расход пользователя по дням за последние days дней"""
+        return await self._run(self._user_days, tenant, user_id, days)
+    
+    async def render_today(self, tenant: str) -> str:
+        """Строка для /stats: расход за сегодня и число пользователей на квотах"""
+        return await self._run(self._render_today, tenant)
+    
+    def _top_users(self, tenant: str, days: int, limit: int) -> List[Tuple[int, UserUsage]]:
+        since = day_number(date.today() - timedelta(days=days - 1))
+        rows = self._connection().execute(
+            "SELECT user_id, SUM(prompt_tokens), SUM(completion_tokens), SUM(calls), SUM(latency) FROM usage "
+            "WHERE tenant = ? AND day >= ? GROUP BY user_id "
+            "ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC LIMIT ?",
+            (tenant, since, limit)
+        ).fetchall()
+        return [(row[0], UserUsage(*row[1:])) for row in rows]
+    
+    def _daily_totals(self, tenant: str, days: int) -> List[Tuple[int, int, UserUsage]]:
+        since = day_number(date.today() - timedelta(days=days - 1))
+        rows = self._connection().execute(
+            "SELECT day, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(calls), SUM(latency) FROM usage "
+            "WHERE tenant = ? AND day >= ? GROUP BY day ORDER BY day DESC",
+            (tenant, since)
+        ).fetchall()
+        return [(row[0], row[1], UserUsage(*row[2:])) for row in rows]
+    
+    def _user_days(self, tenant: str, user_id: int, days: int) -> List[Tuple[int, UserUsage]]:
+        since = day_number(date.today() - timedelta(days=days - 1))
+        rows = self._connection().execute(
+            "SELECT day, prompt_tokens, completion_tokens, calls, latency FROM usage "
+            "WHERE tenant = ? AND user_id = ? AND day >= ? ORDER BY day DESC",
+            (tenant, user_id, since)
+        ).fetchall()
+        return [(row[0], UserUsage(*row[1:])) for row in rows]
+    
+    def _render_today(self, tenant: str) -> str:
+        try:
+            totals = self._daily_totals(tenant, days=1)
+            limited = self._connection().execute(
+                "SELECT SUM(prompt_tokens + completion_tokens >= ?), SUM(prompt_tokens + completion_tokens >= ?) "
+                "FROM usage WHERE tenant = ? AND day = ?",
+                (Config.USER_TOKENS_SOFT_LIMIT or -1, Config.USER_TOKENS_HARD_LIMIT or -1,
+                 tenant, day_number(date.today()))
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при чтении статистики токенов: {e}")
+            return "нет данных"
+        if not totals:
+            return "запросов к LLM не было"
+        _, users, usage = totals[0]
+        soft = (limited[0] or 0) if Config.USER_TOKENS_SOFT_LIMIT else 0
+        hard = (limited[1] or 0) if Config.USER_TOKENS_HARD_LIMIT else 0
+        return f"{usage.describe()}, пользователей {users}, на мягкой квоте {max(0, soft - hard)}, на жесткой {hard}"
+
+# Глобальный учет расхода токенов
+usage_tracker = UsageTracker()
@@ -0,0 +1,71 @@
+"""
+HTTP-сервер бота на aiohttp: webhook Telegram и служебные эндпоинты
+"""
+import logging
+import time
+from typing import Callable, Dict
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from services.shutdown import shutdown
+
+logger = logging.getLogger(__name__)
+
+@web.middleware
+async def reject_when_stopping(request: web.Request, handler):
+    """
+    Во время плавной остановки не принимает апдейты: Telegram получает 503
+    и повторит доставку позже, уже новому экземпляру бота
+    """
+    if shutdown.stopping and request.method == 'POST':
+        return web.Response(status=503, text='Shutting down', headers={'Retry-After': '1'})
+    return await handler(request)
+
+def create_web_app(health_info: Callable[[], Dict] = None) -> web.Application:
+    """Создает aiohttp-приложение с эндпоинтом /health"""
+    app = web.Application(middlewares=[reject_when_stopping])
+    started_at = time.time()
+    
+    async def health(request: web.Request) -> web.Response:
+        """Проверка живости для оркестратора и балансировщика (503 во время остановки)"""
+        info = {'status': 'stopping' if shutdown.stopping else 'ok', 'uptime': round(time.time() - started_at, 1)}
+        if health_info:
+            info.update(health_info())
+        return web.json_response(info, status=503 if shutdown.stopping else 200)
+    
+    app.router.add_get('/health', health)
+    return app
+
+def add_metrics_handler(app: web.Application, registry) -> None:
+    """Регистрирует эндпоинт /metrics в формате Prometheus"""
+    
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+    
+    app.router.add_get('/metrics', metrics)
+
+def add_webhook_handler(app: web.Application, dispatcher, bot, path: str, secret_token: str) -> SimpleRequestHandler:
+    """
+    Регистрирует обработчик webhook.
+    Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются,
+    а Telegram получает ответ сразу - апдейт обрабатывается в фоне
+    """
+    handler = SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret_token
+    )
+    handler.register(app, path=path)
+    return handler
+
+async def start_web_server(app: web.Application, host: str, port: int) -> web.AppRunner:
+    """Запускает HTTP-сервер и возвращает runner для последующей остановки"""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info(f"HTTP-сервер запущен на {host}:{port}")
+    return runner
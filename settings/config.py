@@ -8,14 +8,112 @@ class Config:
     OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
     ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')
     
+    # Лимиты исходящих сообщений Telegram (сообщений в секунду)
+    TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+    TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+    TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+    SEND_QUEUE_WORKERS = int(os.getenv('SEND_QUEUE_WORKERS', '8'))
+    SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
+    
+    # Уведомления админу: окно объединения лидов в дайджест (секунды) и повторы
+    NOTIFICATION_DIGEST_WINDOW = float(os.getenv('NOTIFICATION_DIGEST_WINDOW', '30'))
+    NOTIFICATION_MAX_RETRIES = int(os.getenv('NOTIFICATION_MAX_RETRIES', '5'))
+    NOTIFICATION_RETRY_DELAY = float(os.getenv('NOTIFICATION_RETRY_DELAY', '2'))
+    # Сколько недоставленных контактов держать для дайджеста и максимальная пауза между неудачными дайджестами
+    NOTIFICATION_MAX_BACKLOG = int(os.getenv('NOTIFICATION_MAX_BACKLOG', '100'))
+    NOTIFICATION_MAX_BACKOFF = float(os.getenv('NOTIFICATION_MAX_BACKOFF', '600'))
+    
+    # Фоновые задачи после ответа пользователю (сохранение, уведомления, история)
+    BACKGROUND_MAX_CONCURRENCY = int(os.getenv('BACKGROUND_MAX_CONCURRENCY', '16'))
+    # Отдельный лимит для сохранения лидов (при остановке бота их ждут дольше остальных задач)
+    BACKGROUND_CRITICAL_MAX_CONCURRENCY = int(os.getenv('BACKGROUND_CRITICAL_MAX_CONCURRENCY', '64'))
+    SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '10'))
+    # Сколько еще ждать незавершенное сохранение лидов после SHUTDOWN_DRAIN_TIMEOUT
+    SHUTDOWN_CRITICAL_TIMEOUT = float(os.getenv('SHUTDOWN_CRITICAL_TIMEOUT', '10'))
+    
+    # Режим получения апдейтов: polling или webhook
+    BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+    WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')  # например https://bot.example.com
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+    WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+    
+    # Количество процессов-воркеров (больше 1 - шардирование апдейтов по user_id)
+    BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+    
+    # Мультиарендный режим: JSON-файл со списком брендов (если файла нет - один бот из .env)
+    TENANTS_FILE = os.getenv('TENANTS_FILE', 'tenants.json')
+    
+    # Адреса API: локальный Bot API сервер Telegram и OpenAI-совместимый endpoint (по умолчанию OpenRouter)
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+    OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1')
+    
+    # Пулы HTTP-соединений (Telegram и OpenRouter): лимиты, keep-alive, таймауты (секунды)
+    TELEGRAM_POOL_LIMIT = int(os.getenv('TELEGRAM_POOL_LIMIT', '100'))
+    TELEGRAM_KEEPALIVE_TIMEOUT = float(os.getenv('TELEGRAM_KEEPALIVE_TIMEOUT', '75'))
+    TELEGRAM_REQUEST_TIMEOUT = float(os.getenv('TELEGRAM_REQUEST_TIMEOUT', '60'))
+    DNS_CACHE_TTL = int(os.getenv('DNS_CACHE_TTL', '300'))
+    OPENROUTER_POOL_LIMIT = int(os.getenv('OPENROUTER_POOL_LIMIT', '50'))
+    OPENROUTER_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENROUTER_KEEPALIVE_CONNECTIONS', '20'))
+    OPENROUTER_KEEPALIVE_EXPIRY = float(os.getenv('OPENROUTER_KEEPALIVE_EXPIRY', '90'))
+    OPENROUTER_CONNECT_TIMEOUT = float(os.getenv('OPENROUTER_CONNECT_TIMEOUT', '10'))
+    OPENROUTER_REQUEST_TIMEOUT = float(os.getenv('OPENROUTER_REQUEST_TIMEOUT', '60'))
+    # Прогрев соединений при старте
+    HTTP_WARMUP = os.getenv('HTTP_WARMUP', 'true').lower() == 'true'
+    
+    # Трассировка этапов обработки апдейтов: доля апдейтов (0..1), порог медленного апдейта (секунды), файл трасс
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+    TRACE_SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_THRESHOLD', '3.0'))
+    TRACE_FILE = os.getenv('TRACE_FILE', 'logs/slow_updates.jsonl')
+    
+    # Мониторинг задержки цикла событий: период замера и порог блокировки (секунды), отладка блокирующего I/O
+    LOOP_MONITOR_ENABLED = os.getenv('LOOP_MONITOR_ENABLED', 'true').lower() == 'true'
+    LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.25'))
+    LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.1'))
+    LOOP_DEBUG = os.getenv('LOOP_DEBUG', 'false').lower() == 'true'
+    
+    # Логирование через очередь: уровень, файл (пусто - только консоль), формат text/json,
+    # ротация size (по размеру LOG_MAX_BYTES) или time (по расписанию LOG_ROTATE_WHEN), размер очереди
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FILE = os.getenv('LOG_FILE', 'logs/bot.log')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+    LOG_ROTATION = os.getenv('LOG_ROTATION', 'size').lower()
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '7'))
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    
+    # Рассылки админа: темп (сообщений в секунду, вместе с ответами не выше TELEGRAM_GLOBAL_RATE),
+    # число воркеров, частота сохранения прогресса (в обработанных чатах) и отчета о ходе (секунды)
+    BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '20'))
+    BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '8'))
+    BROADCAST_CHECKPOINT_EVERY = int(os.getenv('BROADCAST_CHECKPOINT_EVERY', '100'))
+    BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '15'))
+    
+    # Дневные квоты токенов LLM на пользователя (0 - без квоты, по умолчанию выключены): мягкая - ответы
+    # из базы знаний, когда они есть, и короткие ответы LLM; жесткая - только база знаний.
+    # Статистика хранится USAGE_RETENTION_DAYS дней
+    USER_TOKENS_SOFT_LIMIT = int(os.getenv('USER_TOKENS_SOFT_LIMIT', '0'))
+    USER_TOKENS_HARD_LIMIT = int(os.getenv('USER_TOKENS_HARD_LIMIT', '0'))
+    USAGE_RETENTION_DAYS = int(os.getenv('USAGE_RETENTION_DAYS', '90'))
+    
+    # Запись сообщений пользователей в лог (логгер transcripts) для дозаполнения контактов (backfill_contacts.py)
+    LOG_TRANSCRIPTS = os.getenv('LOG_TRANSCRIPTS', 'false').lower() == 'true'
+    # Дозаполнение контактов: одновременных запросов к LLM и запросов в секунду
+    BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '8'))
+    BACKFILL_RATE = float(os.getenv('BACKFILL_RATE', '5'))
+    
+    @classmethod
+    def uses_tenants_file(cls) -> bool:
+        """Мультиарендный режим: токены ботов берутся из TENANTS_FILE, а не из TELEGRAM_BOT_TOKEN"""
+        return bool(cls.TENANTS_FILE) and os.path.exists(cls.TENANTS_FILE)
+    
     # Проверка наличия обязательных переменных
     @classmethod
     def validate(cls):
-        if not cls.TELEGRAM_BOT_TOKEN:
+        if not cls.TELEGRAM_BOT_TOKEN and not cls.uses_tenants_file():
             raise ValueError("TELEGRAM_BOT_TOKEN не найден в .env файле")
         if not cls.OPENROUTER_API_KEY:
             raise ValueError("OPENROUTER_API_KEY не найден в .env файле")
-        print("✅ Конфигурация загружена корректно")
-
-# Проверяем при импорте
-Config.validate()
\ No newline at end of file
+        print("✅ Конфигурация загружена корректно")
\ No newline at end of file
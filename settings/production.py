@@ -13,6 +13,8 @@ class ProductionConfig(Config):
     
     # Настройки для мониторинга
     ENABLE_METRICS = os.getenv('ENABLE_METRICS', 'false').lower() == 'true'
+    # При BOT_WORKERS > 1 каждый воркер отдает свои /metrics на порту WORKER_METRICS_PORT + номер воркера
+    WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', '9100'))
     
     @classmethod
     def validate(cls):
@@ -20,7 +22,7 @@ class ProductionConfig(Config):
         super().validate()
         
         # Проверяем обязательные переменные для production
-        required_vars = ['TELEGRAM_BOT_TOKEN', 'OPENROUTER_API_KEY']
+        required_vars = ['OPENROUTER_API_KEY'] if cls.uses_tenants_file() else ['TELEGRAM_BOT_TOKEN', 'OPENROUTER_API_KEY']
         for var in required_vars:
             if not getattr(cls, var):
                 raise ValueError(f"Переменная {var} обязательна для production")
@@ -73,4 +73,10 @@ EMAIL: [email]
 Если контактных данных нет, верни просто "НЕТ_КОНТАКТОВ".
 
 Извлекай данные тщательно, даже если они написаны в разной форме.
-"""
\ No newline at end of file
+"""
+
+# Дополнение к системному промпту, когда контакты уже распознаны локально
+CONTACTS_SAVED_PROMPT = """
+Контактные данные пользователя из его последнего сообщения уже распознаны и сохранены системой.
+НЕ используй блок ===КОНТАКТЫ===. Просто поблагодари пользователя, подтверди, что специалист свяжется с ним в течение 2 часов, и продолжи диалог.
+"""
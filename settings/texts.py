@@ -33,6 +33,8 @@ CONSULTATION_TEXT = """
 BACK_TEXT = "Возвращаемся в главное меню:"
 CONTACT_RECEIVED_TEXT = "✅ Отлично! Ваши контактные данные получены автоматически и без ошибок. Наш специалист свяжется с вами в течение 2 часов для согласования времени бесплатной консультации!"
 ERROR_TEXT = "Извините, произошла ошибка. Попробуйте еще раз."
+QUOTA_EXCEEDED_TEXT = "Сегодня я уже ответил на много ваших вопросов 🙂 Подробные ответы снова будут доступны завтра. А пока загляните в меню (цены, услуги, частые вопросы) или оставьте контакт - менеджер ответит лично."
+CONTACT_SAVED_CONFIRMATION_TEXT = "\n\n✅ Ваши контактные данные сохранены! Мы свяжемся с вами в ближайшее время."
 
 # Тексты для уведомлений админу
 CONTACT_NOTIFICATION_TEMPLATE = """
@@ -47,15 +49,102 @@ User ID: {user_id}
 
 # Тексты для админ-команд
 ADMIN_ONLY_TEXT = "⛔ Эта команда доступна только администратору."
+OPERATOR_ONLY_TEXT = "⛔ Эта команда доступна только оператору бота (ADMIN_CHAT_ID)."
 STATS_TEXT = """
 📊 СТАТИСТИКА БОТА RD-STUDIO
 
 👥 Заявок на консультацию: {contacts_count}
+🔎 Контакты распознаны локально: {local_regex_count}
+🤖 Контакты распознаны ИИ: {ai_extraction_count}
+📤 Очередь отправки: {send_queue_depth} (ошибок: {send_failed_count}, flood wait: {retry_after_count})
+🧮 Токены LLM сегодня: {token_usage}
+{operator_stats}
+📈 Скользящие окна:
+{sliding_windows}
+
 🕒 Последний запуск: {current_time}
 🔧 Статус: ✅ Работает нормально
 
 Для экспорта контактов используйте /export_contacts
+Расход токенов по пользователям: /usage
+"""
+# Процесс целиком (все арендаторы) - только для оператора
+STATS_OPERATOR_TEXT = """⚙️ Фоновых задач в работе: {background_in_flight} (ошибок: {background_failed})
+🔌 Соединения переиспользованы: Telegram {telegram_reused}/{telegram_requests}, OpenRouter {openrouter_reused}/{openrouter_requests}
+"""
+LOOP_STATS_TEXT = """
+🔄 ЦИКЛ СОБЫТИЙ
+
+{report}
+"""
+LOOP_MONITOR_DISABLED_TEXT = "ℹ️ Мониторинг цикла событий выключен (LOOP_MONITOR_ENABLED=false)."
+MEMORY_HELP_TEXT = """
+🧠 ПАМЯТЬ
+
+/memory - RSS, размеры истории, базы знаний и кэшей
+/memory start [кадров] - включить tracemalloc
+/memory top [N] - топ мест выделения памяти
+/memory snapshot - запомнить снимок
+/memory diff [N] - сравнить с запомненным снимком
+/memory stop - выключить tracemalloc
+"""
+MEMORY_REPORT_CAPTION = "🧠 Отчет о памяти"
+USAGE_TEXT = """
+🧮 ТОКЕНЫ LLM
+
+По дням (7 дней):
+{days}
+
+Больше всего за сегодня:
+{top_today}
+
+Больше всего за 7 дней:
+{top_week}
+
+Квоты на пользователя в день: мягкая {soft_limit}, жесткая {hard_limit}
+Расход пользователя: /usage <user_id>
+"""
+USER_USAGE_TEXT = """
+🧮 ТОКЕНЫ LLM: пользователь {user_id}
+
+{days}
+
+Квота сегодня: {quota}
+"""
+USAGE_QUOTA_STATES = {'ok': 'в норме', 'soft': 'мягкая (база знаний и короткие ответы)', 'hard': 'жесткая (только база знаний)'}
+USAGE_NO_DATA_TEXT = "нет данных"
+BROADCAST_HELP_TEXT = """
+📣 РАССЫЛКА
+
+/broadcast <текст> - подготовить рассылку всем, кто писал боту
+/broadcast go - запустить подготовленную рассылку
+/broadcast status - ход последней рассылки
+/broadcast stop - остановить рассылку
+/broadcast resume - продолжить остановленную рассылку
+/broadcast cancel - удалить подготовленную рассылку
 """
+BROADCAST_DRAFT_TEXT = """
+📣 Рассылка #{id} подготовлена, получателей: {recipients}
+
+{text}
+
+Запустить: /broadcast go
+Отменить: /broadcast cancel"""
+BROADCAST_TOO_LONG_TEXT = "❌ Текст рассылки длиннее {limit} символов."
+BROADCAST_NO_DRAFT_TEXT = "ℹ️ Нет подготовленной рассылки. Отправьте /broadcast <текст>."
+BROADCAST_NO_JOBS_TEXT = "ℹ️ Рассылок еще не было."
+BROADCAST_ALREADY_RUNNING_TEXT = "⏳ Рассылка #{id} уже идет. Ход: /broadcast status, остановить: /broadcast stop"
+BROADCAST_NOT_RUNNING_TEXT = "ℹ️ Сейчас рассылка не идет."
+BROADCAST_NOT_STOPPED_TEXT = "ℹ️ Нет остановленной рассылки."
+BROADCAST_STOPPING_TEXT = "⏹ Рассылка #{id} останавливается. Продолжить: /broadcast resume"
+BROADCAST_CANCELLED_TEXT = "🗑 Рассылка #{id} удалена."
+BROADCAST_STATES = {'draft': 'подготовлена', 'running': 'идет', 'stopped': 'остановлена', 'done': 'завершена'}
+BROADCAST_PROGRESS_TEXT = """
+📣 Рассылка #{id} {state}: обработано {processed} из {total} ({percent:.0%})
+✅ Доставлено: {sent}
+🚫 Бот заблокирован: {blocked}
+❌ Ошибок: {failed}
+⚡ Скорость: {rate:.1f} сообщ./с, в работе {elapsed}, осталось ~{eta}"""
 NO_CONTACTS_TEXT = "📭 Нет сохраненных заявок на консультацию."
 EXPORT_SUCCESS_TEXT = "📈 Экспорт заявок ({count} записей)"
 EXPORT_ERROR_TEXT = "❌ Произошла ошибка при экспорте заявок."
@@ -0,0 +1,38 @@
+"""
+Аналитика скользящих окон: арендаторы не видят события друг друга, новые пользователи считаются по окну
+"""
+from services.analytics import Analytics
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+    
+    def __call__(self):
+        return self.now
+
+def window(analytics: Analytics, tenant: str, name: str) -> dict:
+    return dict(analytics.summaries(tenant))[name]
+
+def test_tenants_are_isolated():
+    analytics = Analytics(Clock())
+    analytics.record_message('brand_a', 1)
+    analytics.record_message('brand_a', 2)
+    analytics.record_error('brand_a')
+    analytics.record_message('brand_b', 3)
+    
+    assert window(analytics, 'brand_a', '1 час')['messages'] == 2
+    assert window(analytics, 'brand_b', '1 час')['messages'] == 1
+    assert window(analytics, 'brand_b', '1 час')['error_rate'] == 0.0
+
+def test_new_users_per_window():
+    clock = Clock()
+    analytics = Analytics(clock)
+    analytics.record_message('default', 1)
+    analytics.record_message('default', 1)
+    clock.now += 600  # пользователь вышел из 5-минутного окна, но остался в часовом
+    analytics.record_message('default', 1)
+    analytics.record_contact('default')
+    
+    assert window(analytics, 'default', '5 мин')['new_users'] == 1
+    assert window(analytics, 'default', '1 час')['new_users'] == 1
+    assert window(analytics, 'default', '1 час')['conversion'] == 1.0
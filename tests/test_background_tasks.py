@@ -0,0 +1,38 @@
+"""
+Остановка фоновых задач: обычные отменяются по сроку, критичные получают дополнительное время
+"""
+import asyncio
+
+import pytest
+
+import services.background_tasks as background_module
+from services.background_tasks import BackgroundTasks
+
+@pytest.fixture(autouse=True)
+def short_timeouts(monkeypatch):
+    monkeypatch.setattr(background_module.Config, 'SHUTDOWN_CRITICAL_TIMEOUT', 0.2)
+
+def test_critical_task_finishing_in_grace_period_is_kept():
+    async def scenario():
+        tasks = BackgroundTasks()
+        saved = []
+        
+        async def save():
+            await asyncio.sleep(0.1)
+            saved.append(1)
+        
+        tasks.spawn(asyncio.sleep(10), 'slow')
+        tasks.spawn(save(), 'lead', critical=True)
+        assert await tasks.drain(0.05) == ['slow']
+        assert saved == [1]
+    asyncio.run(scenario())
+
+def test_hung_critical_task_is_cancelled_after_grace_period():
+    async def scenario():
+        tasks = BackgroundTasks()
+        tasks.spawn(asyncio.sleep(10), 'hung_lead', critical=True)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await tasks.drain(0.05) == ['hung_lead']
+        assert loop.time() - started < 1
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+"""
+Регрессии локального разбора контактов: длинные числа (ИНН, заказ, карта) не телефоны
+"""
+import pytest
+
+from utils.contact_parser import contact_parser
+
+@pytest.mark.parametrize('text', [
+    "ИНН 7707083893",
+    "ИНН 770708389312",
+    "номер заказа 1234567890",
+    "заказ №1234567890, когда доставка?",
+    "карта 4276 1234 5678 9012",
+    "карта 4276123456789012",
+    "счет 40702810900000012345",
+    "хотел бы уточнить заказ 9161234567",
+])
+def test_long_numbers_are_not_contacts(text):
+    assert contact_parser.extract_contacts_fast(text) is None
+
+@pytest.mark.parametrize('text, phone', [
+    ("+7 916 123-45-67", '+79161234567'),
+    ("звоните 8 (916) 123 45 67", '+79161234567'),
+    ("мой телефон 9161234567", '9161234567'),
+    ("мобильный: 916-123-45-67", '9161234567'),
+    ("Иван, +79161234567, ivan@example.com", '+79161234567'),
+])
+def test_phones_are_extracted(text, phone):
+    assert contact_parser.extract_contacts_fast(text)['phone'] == phone
+
+def test_email_without_phone():
+    contact = contact_parser.extract_contacts_fast("пишите на Ivan@Example.com, номер заказа 1234567890")
+    assert contact['email'] == 'ivan@example.com'
+    assert contact['phone'] == ''
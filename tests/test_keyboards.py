@@ -0,0 +1,25 @@
+"""
+Замороженные клавиатуры: закешированный JSON не может разойтись с клавиатурой
+"""
+import json
+
+import pytest
+
+from components.keyboards import Keyboards
+
+KEYBOARDS = [Keyboards.get_main_keyboard, Keyboards.get_contact_keyboard, Keyboards.get_back_keyboard]
+
+@pytest.mark.parametrize('get_keyboard', KEYBOARDS)
+def test_keyboard_is_frozen_deeply(get_keyboard):
+    markup = get_keyboard()
+    with pytest.raises(Exception):
+        markup.keyboard = ()
+    with pytest.raises(AttributeError):
+        markup.keyboard[0].append(markup.keyboard[0][0])
+    with pytest.raises(Exception):
+        markup.keyboard[0][0].text = 'changed'
+
+@pytest.mark.parametrize('get_keyboard', KEYBOARDS)
+def test_serialized_matches_keyboard(get_keyboard):
+    markup = get_keyboard()
+    assert json.loads(Keyboards.get_serialized(markup)) == json.loads(json.dumps(markup.model_dump(exclude_none=True)))
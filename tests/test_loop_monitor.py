@@ -0,0 +1,55 @@
+"""
+Монитор цикла событий: блокировка, снятая сторожем, засчитывается только своему пингу
+"""
+import asyncio
+import threading
+import time
+
+from services.loop_monitor import LoopMonitor
+
+def make_monitor() -> LoopMonitor:
+    return LoopMonitor(interval=0.01, threshold=0.05, debug=False)
+
+def pong(monitor: LoopMonitor, seq: int, lag: float) -> threading.Event:
+    done = threading.Event()
+    monitor._pong(seq, time.monotonic() - lag, done)
+    assert done.is_set()
+    return done
+
+def test_stall_is_credited_to_its_probe():
+    monitor = make_monitor()
+    monitor._pending_stall = (3, 'bot.py:10 (handler)')
+    pong(monitor, 3, 0.2)
+    assert monitor.offenders['bot.py:10 (handler)']['count'] == 1
+    assert monitor._pending_stall is None
+
+def test_stale_stall_is_not_credited_to_later_probe():
+    monitor = make_monitor()
+    # Сторож записал блокировку пинга 3 уже после ответа на него
+    monitor._pending_stall = (3, 'bot.py:10 (handler)')
+    pong(monitor, 4, 0.2)
+    assert 'bot.py:10 (handler)' not in monitor.offenders
+    assert monitor.offenders['unknown (стек не снят)']['count'] == 1
+    assert monitor._pending_stall is None
+
+def test_stall_of_future_probe_is_kept():
+    monitor = make_monitor()
+    monitor._pending_stall = (5, 'bot.py:10 (handler)')
+    pong(monitor, 4, 0.01)
+    assert monitor._pending_stall == (5, 'bot.py:10 (handler)')
+
+def test_blocking_call_is_found_in_loop_thread():
+    async def scenario():
+        monitor = make_monitor()
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)  # блокирует цикл
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+    
+    monitor = asyncio.run(scenario())
+    assert monitor.stalls >= 1
+    location, offender = monitor.worst_offenders(1)[0]
+    assert location.startswith('tests/test_loop_monitor.py')
+    assert offender['max'] >= 0.25
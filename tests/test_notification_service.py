@@ -0,0 +1,103 @@
+"""
+Уведомления админу: ограничение накопленных контактов и паузы между неудачными дайджестами
+"""
+import asyncio
+
+from services.notification_service import NotificationService
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.fail = False
+        self.gate = None  # если задано, отправка ждет его
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("Telegram недоступен")
+        self.sent.append(text)
+
+def contact(user_id: int) -> dict:
+    return {'first_name': f"user{user_id}", 'user_id': user_id, 'timestamp': '2026-03-10T12:00:00'}
+
+def make_service(bot: FakeBot, **kwargs) -> NotificationService:
+    options = dict(digest_window=30, max_retries=0, retry_delay=0, admin_chat_id='1', max_backlog=3, max_backoff=300)
+    options.update(kwargs)
+    return NotificationService(bot, **options)
+
+def test_backlog_is_capped_and_digest_reports_dropped():
+    async def scenario():
+        bot = FakeBot()
+        service = make_service(bot)
+        for user_id in range(5):
+            service._add(contact(user_id))
+        assert [item['user_id'] for item in service.undelivered] == [2, 3, 4]
+        assert service.dropped == 2
+        
+        await service._deliver()
+        assert len(bot.sent) == 1
+        assert "НОВЫЕ КОНТАКТЫ (5)" in bot.sent[0]
+        assert "Еще 2 более ранних контактов" in bot.sent[0]
+        assert not service.undelivered
+        assert service.dropped == 0
+        assert service.stats['dropped'] == 2
+    asyncio.run(scenario())
+
+def test_eviction_during_successful_send_keeps_new_contacts():
+    async def scenario():
+        bot = FakeBot()
+        bot.gate = asyncio.Event()
+        service = make_service(bot)
+        for user_id in range(3):
+            service._add(contact(user_id))
+        
+        delivery = asyncio.create_task(service._deliver())
+        await asyncio.sleep(0)  # отправка началась
+        service._add(contact(3))
+        service._add(contact(4))
+        bot.gate.set()
+        await delivery
+        
+        # Вытесненные 0 и 1 уже были в отправленном уведомлении
+        assert [item['user_id'] for item in service.undelivered] == [3, 4]
+        assert service.dropped == 0
+    asyncio.run(scenario())
+
+def test_eviction_during_failed_send_is_counted_as_dropped():
+    async def scenario():
+        bot = FakeBot()
+        bot.gate = asyncio.Event()
+        bot.fail = True
+        service = make_service(bot)
+        for user_id in range(3):
+            service._add(contact(user_id))
+        
+        delivery = asyncio.create_task(service._deliver())
+        await asyncio.sleep(0)
+        service._add(contact(3))
+        bot.gate.set()
+        await delivery
+        
+        assert [item['user_id'] for item in service.undelivered] == [1, 2, 3]
+        assert service.dropped == 1
+    asyncio.run(scenario())
+
+def test_failed_digests_back_off_up_to_limit():
+    async def scenario():
+        bot = FakeBot()
+        bot.fail = True
+        service = make_service(bot)
+        service._add(contact(1))
+        
+        windows = []
+        for _ in range(5):
+            await service._deliver()
+            windows.append(service._next_window())
+        assert windows == [60, 120, 240, 300, 300]
+        
+        bot.fail = False
+        await service._deliver()
+        assert service._next_window() == 30
+        assert not service.undelivered
+    asyncio.run(scenario())
@@ -0,0 +1,96 @@
+"""
+Очередь отправки: порядок частей и сообщений, чередование чатов, повторы после flood control и LRU bucket'ов
+"""
+import asyncio
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from services.send_queue import SendQueue
+
+class FakeBot:
+    def __init__(self, flood=None):
+        self.sent = []
+        self.flood = dict(flood or {})  # chat_id -> сколько раз ответить flood control
+    
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        await asyncio.sleep(0)
+        if self.flood.get(chat_id):
+            self.flood[chat_id] -= 1
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), "Too Many Requests", 1)
+        self.sent.append((chat_id, text, reply_markup))
+
+def make_queue(bot: FakeBot, **kwargs) -> SendQueue:
+    options = dict(global_rate=1000, chat_rate=1000, chat_burst=1000, workers=4, max_retries=3)
+    options.update(kwargs)
+    return SendQueue(bot, **options)
+
+def test_parts_and_messages_keep_order_within_chat():
+    async def scenario():
+        bot = FakeBot()
+        queue = make_queue(bot)
+        results = await asyncio.gather(
+            queue.send_parts(1, ['1a', '1b', '1c'], reply_markup='kb'),
+            queue.send_parts(2, ['2a', '2b']),
+            queue.send_message(1, '1d'),
+            queue.send_message(2, '2c'),
+        )
+        assert results == [True, True, True, True]
+        assert [text for chat_id, text, _ in bot.sent if chat_id == 1] == ['1a', '1b', '1c', '1d']
+        assert [text for chat_id, text, _ in bot.sent if chat_id == 2] == ['2a', '2b', '2c']
+        # Клавиатура прикрепляется только к первой части
+        assert [markup for _, text, markup in bot.sent if text.startswith('1')] == ['kb', None, None, None]
+        assert queue.depth == 0
+        await queue.close()
+    asyncio.run(scenario())
+
+def test_busy_chat_does_not_hold_back_other_chats():
+    async def scenario():
+        bot = FakeBot()
+        queue = make_queue(bot, workers=1)
+        sends = [queue.enqueue(1, [f'1-{i}']) for i in range(3)]
+        sends.append(queue.enqueue(2, ['2-0']))
+        await asyncio.gather(*sends)
+        # Чат с длинной очередью после каждого сообщения уступает место следующему готовому чату
+        assert [text for _, text, _ in bot.sent] == ['1-0', '2-0', '1-1', '1-2']
+        await queue.close()
+    asyncio.run(scenario())
+
+def test_retry_after_pauses_chat_and_whole_bot():
+    async def scenario():
+        bot = FakeBot(flood={1: 1})
+        queue = make_queue(bot)
+        started = time.monotonic()
+        flooded = asyncio.create_task(queue.send_message(1, 'hello'))
+        await asyncio.sleep(0.05)  # flood control уже получен
+        # Другой чат тоже ждет окончания паузы: лимит превысил бот целиком
+        assert await queue.send_message(2, 'other')
+        assert time.monotonic() - started >= 1
+        assert await flooded
+        assert queue.stats['retry_after'] == 1
+        assert sorted(bot.sent) == [(1, 'hello', None), (2, 'other', None)]
+        await queue.close()
+    asyncio.run(scenario())
+
+def test_retry_after_beyond_max_retries_fails_message():
+    async def scenario():
+        bot = FakeBot(flood={1: 1})
+        queue = make_queue(bot, max_retries=0)
+        assert await queue.send_message(1, 'hello') is False
+        assert queue.stats['failed'] == 1
+        assert bot.sent == []
+        assert queue.depth == 0
+        await queue.close()
+    asyncio.run(scenario())
+
+def test_chat_buckets_are_evicted_least_recently_used():
+    queue = make_queue(FakeBot())
+    queue.MAX_CHAT_BUCKETS = 3
+    for chat_id in (1, 2, 3):
+        queue._get_chat_bucket(chat_id)
+    queue._get_chat_bucket(1)  # чат 1 снова писал, самый давний теперь 2
+    queue.chat_queues[2] = deque()  # у чата 2 есть сообщения в очереди - его bucket не трогаем
+    queue._get_chat_bucket(4)
+    assert list(queue.chat_buckets) == [1, 4, 2]
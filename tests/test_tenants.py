@@ -0,0 +1,42 @@
+"""
+Загрузка арендаторов из TENANTS_FILE и проверка настроек в мультиарендном режиме
+"""
+import json
+import os
+
+import pytest
+
+from services.tenants import TenantRegistry
+from settings.config import Config
+from settings.production import ProductionConfig
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_tenants(tmp_path, tenants) -> str:
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps(tenants), encoding='utf-8')
+    return str(path)
+
+@pytest.mark.parametrize('tenants, message', [
+    ([{'name': 'brand', 'token': '1:a'}, {'name': 'brand', 'token': '2:b'}], 'дважды'),
+    ([{'name': 'brand_a', 'token': '1:a'}, {'name': 'brand_b', 'token': '1:a'}], 'уже занят'),
+])
+def test_duplicate_name_or_token_is_rejected(tmp_path, tenants, message):
+    with pytest.raises(ValueError, match=message):
+        TenantRegistry.from_config(None, tenants_file=write_tenants(tmp_path, tenants))
+
+def test_example_tenants_file_loads(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    registry = TenantRegistry.from_config(None, tenants_file='tenants.example.json')
+    assert [tenant.name for tenant in registry.tenants] == ['brand_a', 'brand_b']
+
+@pytest.mark.parametrize('config', [Config, ProductionConfig])
+def test_bot_token_is_optional_with_tenants_file(tmp_path, monkeypatch, config):
+    monkeypatch.setattr(Config, 'TELEGRAM_BOT_TOKEN', None)
+    monkeypatch.setattr(Config, 'OPENROUTER_API_KEY', 'key')
+    monkeypatch.setattr(Config, 'TENANTS_FILE', write_tenants(tmp_path, [{'name': 'brand', 'token': '1:a'}]))
+    config.validate()
+    
+    monkeypatch.setattr(Config, 'TENANTS_FILE', str(tmp_path / 'missing.json'))
+    with pytest.raises(ValueError, match='TELEGRAM_BOT_TOKEN'):
+        config.validate()
@@ -0,0 +1,57 @@
+"""
+Инварианты разбиения длинных сообщений на случайных текстах
+"""
+import random
+import re
+
+import pytest
+
+from utils.text_utils import split_long_message, utf16_length
+
+ALPHABET = list("абвгдеёжзийклмнопрстуфхцчшщьыэюя ABCxyz0123456789,.!?") + ["\n", "\n\n", ". ", "  ", "💰", "🎯", "👨‍💼", "•"]
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def random_text(rng: random.Random, length: int) -> str:
+    """Случайный текст с кириллицей, эмодзи и разделителями"""
+    return ''.join(rng.choice(ALPHABET) for _ in range(length))
+
+def check_invariants(text: str, max_length: int):
+    parts = split_long_message(text, max_length)
+    
+    assert parts, "результат не может быть пустым"
+    if utf16_length(text) <= max_length:
+        assert parts == [text], "короткий текст возвращается без изменений"
+        return
+    
+    for i, part in enumerate(parts):
+        assert part.strip(), f"часть {i} пустая или из одних пробелов: {part!r}"
+        assert utf16_length(part) <= max_length, f"часть {i} длиннее {max_length} единиц UTF-16"
+        if i > 0:
+            assert not part[0].isspace(), f"часть {i} начинается с пробела: {part!r}"
+        if i < len(parts) - 1:
+            assert not part[-1].isspace(), f"часть {i} заканчивается пробелом: {part!r}"
+    
+    # Теряться могут только пробельные символы на стыках частей
+    joined = WHITESPACE_PATTERN.sub('', ''.join(parts))
+    assert joined == WHITESPACE_PATTERN.sub('', text), "содержимое текста изменилось"
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_texts(seed):
+    rng = random.Random(seed)
+    for _ in range(400):
+        max_length = rng.choice([2, 3, 5, 16, 100, 4096])
+        check_invariants(random_text(rng, rng.randint(0, max_length * 4)), max_length)
+
+@pytest.mark.parametrize('text, max_length, parts', [
+    ('ab  cd  ef', 3, ['ab', 'cd', 'ef']),
+    ('абзац один\n\n\nабзац два', 12, ['абзац один', 'абзац два']),
+    ('Первое. Второе.', 10, ['Первое.', 'Второе.']),
+])
+def test_whitespace_at_split_points(text, max_length, parts):
+    assert split_long_message(text, max_length) == parts
+
+def test_long_text_fits_telegram_limit():
+    text = "💰 Тариф. " * 1000
+    parts = split_long_message(text)
+    assert len(parts) > 1
+    assert all(utf16_length(part) <= 4096 for part in parts)
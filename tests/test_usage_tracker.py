@@ -0,0 +1,85 @@
+"""
+Дневные квоты токенов: пороги, смена дня и расход, записанный во время чтения из базы после перезапуска
+"""
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import services.usage_tracker as usage_module
+from services.usage_tracker import QUOTA_HARD, QUOTA_OK, QUOTA_SOFT, UsageTracker
+
+class FakeDate(date):
+    current = date(2026, 3, 10)
+    
+    @classmethod
+    def today(cls):
+        return cls.current
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    FakeDate.current = date(2026, 3, 10)
+    monkeypatch.setattr(usage_module, 'date', FakeDate)
+    monkeypatch.setattr(usage_module.Config, 'USER_TOKENS_SOFT_LIMIT', 100)
+    monkeypatch.setattr(usage_module.Config, 'USER_TOKENS_HARD_LIMIT', 200)
+
+def tokens(prompt: int, completion: int = 0):
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion)
+
+def test_soft_and_hard_thresholds(tmp_path):
+    async def scenario():
+        tracker = UsageTracker(str(tmp_path / 'usage.db'))
+        assert await tracker.quota('t', 1) == QUOTA_OK
+        tracker.record('t', 1, tokens(60, 39), 0.1)
+        assert await tracker.quota('t', 1) == QUOTA_OK
+        tracker.record('t', 1, tokens(1), 0.1)
+        assert await tracker.quota('t', 1) == QUOTA_SOFT
+        tracker.record('t', 1, tokens(50, 50), 0.1)
+        assert await tracker.quota('t', 1) == QUOTA_HARD
+        assert await tracker.quota('t', 2) == QUOTA_OK
+        await tracker.flush()
+    asyncio.run(scenario())
+
+def test_zero_limits_disable_quotas(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_module.Config, 'USER_TOKENS_SOFT_LIMIT', 0)
+    monkeypatch.setattr(usage_module.Config, 'USER_TOKENS_HARD_LIMIT', 0)
+    
+    async def scenario():
+        tracker = UsageTracker(str(tmp_path / 'usage.db'))
+        tracker.record('t', 1, tokens(10_000), 0.1)
+        assert await tracker.quota('t', 1) == QUOTA_OK
+        await tracker.flush()
+    asyncio.run(scenario())
+
+def test_hard_quota_ends_at_midnight_without_new_requests(tmp_path):
+    async def scenario():
+        tracker = UsageTracker(str(tmp_path / 'usage.db'))
+        tracker.record('t', 1, tokens(250), 0.1)
+        assert await tracker.quota('t', 1) == QUOTA_HARD
+        FakeDate.current = date(2026, 3, 11)
+        assert await tracker.quota('t', 1) == QUOTA_OK
+        await tracker.flush()
+    asyncio.run(scenario())
+
+def test_restart_load_merges_usage_recorded_during_read(tmp_path):
+    path = str(tmp_path / 'usage.db')
+    
+    async def scenario():
+        before_restart = UsageTracker(path)
+        before_restart.record('t', 1, tokens(150), 0.1)
+        await before_restart.flush()
+        
+        tracker = UsageTracker(path)
+        loading = asyncio.create_task(tracker.quota('t', 1))
+        await asyncio.sleep(0)  # чтение из базы началось
+        tracker.record('t', 1, tokens(100), 0.1)
+        assert await loading == QUOTA_HARD
+        assert tracker.today[('t', 1)].total_tokens == 250
+        assert tracker.today[('t', 1)].calls == 2
+        
+        await tracker.flush()
+        after_second_restart = UsageTracker(path)
+        assert await after_second_restart.quota('t', 1) == QUOTA_HARD
+        assert after_second_restart.today[('t', 1)].total_tokens == 250
+    asyncio.run(scenario())
@@ -4,18 +4,40 @@ from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+# Предкомпилированные регулярные выражения (компилируются один раз при импорте)
+# Номер не должен быть куском более длинного числа (ИНН, карта, счет): справа граница (?!\d),
+# слева ее проверяет _search_number (lookbehind в шаблоне отключает быстрый поиск и замедляет разбор).
+# Скобки вокруг кода необязательны, поэтому вариант без скобок отдельным шаблоном не нужен
+PHONE_PATTERNS = [
+    re.compile(r'(\+7|8)[\s\-]?\(?(\d{3})\)?[\s\-]?(\d{3})[\s\-]?(\d{2})[\s\-]?(\d{2})(?!\d)')
+]
+# 10 цифр без +7/8 - телефон, только если рядом слово о телефоне: иначе это номер заказа, ИНН и т.п.
+BARE_PHONE_PATTERN = re.compile(r'(\d{3})[\s\-]?(\d{3})[\s\-]?(\d{2})[\s\-]?(\d{2})(?!\d)')
+PHONE_KEYWORDS_PATTERN = re.compile(
+    r'\b(?:тел|моб|сот|звон|позвон|перезвон|набер|whatsapp|ватсап|вотсап|viber|вайбер|контакт)',
+    re.IGNORECASE
+)
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', re.IGNORECASE)
+NON_PHONE_CHARS_PATTERN = re.compile(r'[^\d+]')
+
+# Быстрая предварительная проверка: без 10 цифр подряд (с разделителями) или "@" контактов точно нет
+CONTACT_HINT_PATTERN = re.compile(r'@|\d[\d\s\-()]{8,}\d')
+
+def _search_number(pattern: re.Pattern, text: str) -> Optional[re.Match]:
+    """Первое совпадение, перед которым нет цифры или "+" (то есть не продолжение другого числа)"""
+    for match in pattern.finditer(text):
+        start = match.start()
+        if start == 0 or not (text[start - 1].isdigit() or text[start - 1] == '+'):
+            return match
+    return None
+
 class ContactParser:
     """Парсер для извлечения контактной информации из текста"""
     
     def __init__(self):
         # Регулярные выражения для извлечения данных
-        self.phone_patterns = [
-            r'(\+7|8)[\s\-]?\(?(\d{3})\)?[\s\-]?(\d{3})[\s\-]?(\d{2})[\s\-]?(\d{2})',
-            r'(\+7|8)[\s\-]?(\d{3})[\s\-]?(\d{3})[\s\-]?(\d{2})[\s\-]?(\d{2})',
-            r'(\d{3})[\s\-]?(\d{3})[\s\-]?(\d{2})[\s\-]?(\d{2})'
-        ]
-        
-        self.email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+        self.phone_patterns = PHONE_PATTERNS
+        self.email_pattern = EMAIL_PATTERN
         
         # Ключевые слова, указывающие на контактные данные
         self.contact_keywords = [
@@ -46,6 +68,34 @@ class ContactParser:
         
         return None
     
+    def extract_contacts_fast(self, text: str) -> Optional[Dict]:
+        """
+        Быстрое локальное извлечение телефона и email из сообщения пользователя.
+        В отличие от extract_contact_info не требует ключевых слов: если в сообщении
+        есть телефон или email, это уже лид.
+        """
+        try:
+            if not text or not CONTACT_HINT_PATTERN.search(text):
+                return None
+            
+            phone = self._extract_phone(text)
+            email = self._extract_email(text)
+            
+            if not phone and not email:
+                return None
+            
+            # Имя эвристикой _extract_name не угадываем: первое слово предложения
+            # почти всегда с заглавной буквы, надежнее взять имя из Telegram
+            return {
+                'name': '',
+                'phone': phone,
+                'email': email.lower() if email else '',
+                'additional_info': text
+            }
+        except Exception as e:
+            logger.error(f"Ошибка при локальном извлечении контактов: {e}")
+            return None
+    
     def _extract_name(self, text: str) -> str:
         """Извлекает имя из текста"""
         # Простая эвристика: ищем слова с заглавной буквы в начале
@@ -63,22 +113,26 @@ class ContactParser:
     def _extract_phone(self, text: str) -> str:
         """Извлекает номер телефона из текста"""
         for pattern in self.phone_patterns:
-            matches = re.findall(pattern, text)
-            if matches:
+            match = _search_number(pattern, text)
+            if match:
                 # Берем первый найденный номер
-                phone = ''.join([''.join(match) for match in matches][0])
+                phone = ''.join(match.groups())
                 return self._format_phone(phone)
+        # Слова о телефоне ищем, только когда уже нашлись 10 цифр: так дешевле
+        match = _search_number(BARE_PHONE_PATTERN, text)
+        if match and PHONE_KEYWORDS_PATTERN.search(text):
+            return self._format_phone(''.join(match.groups()))
         return ''
     
     def _extract_email(self, text: str) -> str:
         """Извлекает email из текста"""
-        matches = re.findall(self.email_pattern, text, re.IGNORECASE)
-        return matches[0] if matches else ''
+        match = self.email_pattern.search(text)
+        return match.group(0) if match else ''
     
     def _format_phone(self, phone: str) -> str:
         """Форматирует номер телефона в единый формат"""
         # Убираем все нецифровые символы, кроме +
-        digits = re.sub(r'[^\d+]', '', phone)
+        digits = NON_PHONE_CHARS_PATTERN.sub('', phone)
         
         if digits.startswith('8') and len(digits) == 11:
             return '+7' + digits[1:]
@@ -90,4 +144,4 @@ class ContactParser:
             return digits  # Оставляем как есть, если формат не распознан
 
 # Создаем глобальный экземпляр парсера
-contact_parser = ContactParser()
\ No newline at end of file
+contact_parser = ContactParser()
@@ -1,34 +1,81 @@
 """
 Утилиты для работы с текстом
 """
+from typing import Iterator, Tuple
 
-def split_long_message(text: str, max_length: int = 4096) -> list:
+# Telegram ограничивает длину сообщения 4096 единицами UTF-16 (а не символами Python)
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# Места для разрыва в порядке предпочтения: (разделитель, сколько его символов оставить в части)
+BREAK_SEPARATORS = (
+    ('\n\n', 0),  # абзац
+    ('\n', 0),    # строка
+    ('. ', 1),    # предложение (точку оставляем)
+    (' ', 0),     # слово
+)
+
+def utf16_length(text: str) -> int:
+    """Длина текста в единицах UTF-16, как ее считает Telegram"""
+    return len(text.encode('utf-16-le')) // 2
+
+def _window_end(text: str, start: int, max_length: int) -> int:
     """
-    Разбивает длинное сообщение на части по max_length символов
-    Telegram имеет ограничение на длину сообщения (4096 символов)
+    Возвращает end, при котором text[start:end] помещается в max_length единиц UTF-16.
+    Символы вне BMP (эмодзи) занимают 2 единицы, поэтому окно сужается, пока превышение
+    не исчезнет (каждый шаг убирает не меньше половины превышения)
     """
-    if len(text) <= max_length:
-        return [text]
-    
-    parts = []
-    while text:
-        if len(text) <= max_length:
-            parts.append(text)
+    end = min(len(text), start + max_length)
+    while end > start + 1:
+        excess = utf16_length(text[start:end]) - max_length
+        if excess <= 0:
             break
+        end -= (excess + 1) // 2
+    return end
+
+def _find_break(text: str, start: int, end: int) -> Tuple[int, int]:
+    """Ищет лучшее место разрыва в окне: (конец текущей части, начало следующей)"""
+    for separator, keep in BREAK_SEPARATORS:
+        pos = text.rfind(separator, start, end)
+        if pos > start:
+            return pos + keep, pos + len(separator)
+    # Разделителей нет - режем жестко по границе окна
+    return end, end
+
+def iter_message_parts(text: str, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> Iterator[str]:
+    """
+    Разбивает длинное сообщение на части за один проход.
+    Длина считается в единицах UTF-16, разрыв делается по абзацам, строкам, предложениям
+    или словам. Хвост текста не копируется на каждой итерации: двигается только индекс
+    начала, а срез берется лишь для отдаваемой части, поэтому время работы линейное
+    """
+    if utf16_length(text) <= max_length:
+        yield text
+        return
+    
+    text_length = len(text)
+    start = 0
+    while start < text_length:
+        end = _window_end(text, start, max_length)
+        if end >= text_length:
+            yield text[start:]
+            return
         
-        # Ищем место для разрыва (предпочтительно по абзацам)
-        break_pos = text.rfind('\n\n', 0, max_length)
-        if break_pos == -1:
-            break_pos = text.rfind('\n', 0, max_length)
-        if break_pos == -1:
-            break_pos = text.rfind('. ', 0, max_length)
-        if break_pos == -1:
-            break_pos = max_length
+        part_end, next_start = _find_break(text, start, end)
+        # Пробелы и переносы на стыке частей отбрасываем: часть из одних пробелов Telegram не примет
+        part = text[start:part_end].rstrip()
+        if part:
+            yield part
         
-        parts.append(text[:break_pos + 1])
-        text = text[break_pos + 1:]
-    
-    return parts
+        while next_start < text_length and text[next_start].isspace():
+            next_start += 1
+        start = next_start
+
+def split_long_message(text: str, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> list:
+    """
+    Разбивает длинное сообщение на части не длиннее max_length единиц UTF-16
+    Telegram имеет ограничение на длину сообщения (4096 единиц UTF-16)
+    """
+    return list(iter_message_parts(text, max_length))
 
 def truncate_text(text: str, max_length: int = 4000) -> str:
     """Обрезает текст до максимальной длины, добавляя многоточие"""